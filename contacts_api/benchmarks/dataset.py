@@ -0,0 +1,112 @@
+"""
+Synthetic dataset of users with contacts, bulk inserted.
+
+Creates N confirmed users who share one password and M contacts for each of them, with pronounceable names,
+unique emails and phones and birthdays spread over the year. The canonical columns the ORM validators fill
+are computed here, because bulk inserts skip the validators::
+
+    python benchmarks/dataset.py --users 1000 --contacts 200
+
+Seeding is idempotent, users which already exist are kept with their contacts.
+All rows go to the database behind SQLALCHEMY_DATABASE_URL (a local SQLite file by default), the first shard.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./loadtest.db")
+
+from sqlalchemy import insert, select  # noqa: E402
+
+from src.db.db import engine  # noqa: E402
+from src.db.models import Contact, User, create_tables  # noqa: E402
+from src.services.auth import auth_service  # noqa: E402
+from src.services.normalize_service import name_key, normalize_email, normalize_phone  # noqa: E402
+
+PASSWORD = "loadtest-password"
+SYLLABLES = ["al", "an", "bo", "da", "el", "ka", "li", "ma", "mi", "na", "ol", "ra", "ri", "sa", "ta", "vi", "yu", "zo"]
+
+
+def name(rng: random.Random) -> str:
+    """
+    The name function generates a pronounceable name of two or three syllables.
+
+    :param rng: random.Random: Source of randomness
+    :return: A capitalized name
+    """
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def user_email(number: int) -> str:
+    return f"user{number}@loadtest.com"
+
+
+def contact_row(rng: random.Random, user_id: int, number: int) -> dict:
+    """
+    The contact_row function generates the columns of one contact, owner and number make email and phone unique.
+
+    :param rng: random.Random: Source of randomness
+    :param user_id: int: Owner of the contact
+    :param number: int: Number of the contact of the owner, below 100000
+    :return: Columns of the contact
+    """
+    first_name, last_name = name(rng), name(rng)
+    email = f"{first_name.lower()}.{user_id}.{number}@contacts.loadtest.com"
+    phone = f"+380{user_id % 100_000:05d}{number:05d}"
+    return {"first_name": first_name, "last_name": last_name, "email": email, "phone": phone,
+            "birthday": datetime.datetime(rng.randint(1950, 2005), rng.randint(1, 12), rng.randint(1, 28)),
+            "favorite": rng.random() < 0.2, "contact_owner_id": user_id, "email_canonical": normalize_email(email),
+            "phone_canonical": normalize_phone(phone), "name_key": name_key(first_name, last_name)}
+
+
+def seed(users: int, contacts: int, batch: int = 10_000, random_seed: int = 42) -> dict[str, int]:
+    """
+    The seed function creates the missing users and gives every new user its contacts.
+
+    :param users: int: Number of users
+    :param contacts: int: Contacts of every user
+    :param batch: int: Rows inserted in one statement
+    :param random_seed: int: Seed of the generated names
+    :return: Id of every requested user by email
+    """
+    rng = random.Random(random_seed)
+    password = auth_service.get_password_hash(PASSWORD)
+    emails = [user_email(number) for number in range(users)]
+    with engine.begin() as connection:
+        existing = dict(connection.execute(select(User.email, User.id).where(User.email.like("%@loadtest.com"))).all())
+        missing = [{"username": email.split("@")[0], "email": email, "password": password, "confirmed": True}
+                   for email in emails if email not in existing]
+        created = connection.execute(insert(User).returning(User.email, User.id), missing).all() if missing else []
+        rows = []
+        for email, user_id in created:
+            rows.extend(contact_row(rng, user_id, number) for number in range(contacts))
+            if len(rows) >= batch:
+                connection.execute(insert(Contact), rows)
+                rows = []
+        if rows:
+            connection.execute(insert(Contact), rows)
+    ids = {**existing, **dict(created)}
+    return {email: ids[email] for email in emails}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--contacts", type=int, default=100)
+    args = parser.parse_args()
+
+    engine.echo = False
+    create_tables()
+    started = time.perf_counter()
+    users = seed(args.users, args.contacts)
+    print(f"{engine.dialect.name}: {len(users)} users with {args.contacts} contacts each "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+HTTP load test of the API with a weighted mix of scenarios.
+
+Seeds users with contacts (see ``dataset.py``), then sends the scenarios login, list, search, birthday,
+create, update and avatar as authenticated users, and reports per scenario the throughput, the errors
+and the p50/p95/p99 latency::
+
+    python benchmarks/loadtest.py --users 100 --contacts 200 --concurrency 50 --duration 30
+    python benchmarks/loadtest.py --rate 200 --duration 30 --mix list:50,search:30,create:20
+    python benchmarks/loadtest.py --uvicorn --workers 4 --concurrency 100 --json report.json
+
+Load models:
+
+- closed loop (``--concurrency``): every virtual user sends its next request when the previous one answered,
+  so a slower server gets fewer requests, the way a fixed pool of clients behaves.
+- open loop (``--rate``): requests arrive on a Poisson schedule whether the server keeps up or not, and latency
+  counts from the scheduled start, so queueing in a slow server shows in the percentiles.
+
+Targets:
+
+- in-process (default): the ASGI app through httpx, no network, with the rate limits off.
+- ``--uvicorn``: starts ``uvicorn main:app`` on a free port with the same environment, the rate limits apply.
+- ``--url``: a running server which uses the same database and SECRET_KEY.
+
+Unless the environment says otherwise, Redis, the mail server and Cloudinary are the in-memory fakes,
+so only the database is needed. Their latency and faults are set with REDIS_FAKE_PROFILE, MAIL_FAKE_PROFILE
+and IMAGE_FAKE_PROFILE, e.g. ``REDIS_FAKE_PROFILE=latency_ms=1,spike_rate=0.01,spike_ms=200``.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./loadtest.db")
+os.environ.setdefault("REDIS_BACKEND", "memory")
+os.environ.setdefault("MAIL_BACKEND", "memory")
+os.environ.setdefault("IMAGE_BACKEND", "filesystem")
+os.environ.setdefault("IMAGE_DIR", "loadtest_media")
+
+import httpx  # noqa: E402
+from fastapi_limiter.depends import RateLimiter  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from dataset import PASSWORD, SYLLABLES, seed  # noqa: E402
+from src.db.db import engine  # noqa: E402
+from src.db.models import Contact, create_tables  # noqa: E402
+from src.services.auth import auth_service  # noqa: E402
+
+AVATAR = b"\x89PNG\r\n\x1a\n" + bytes(2048)
+DEFAULT_MIX = "login:1,list:30,search:25,birthday:10,create:5,update:5,avatar:1"
+
+
+class Account:
+    def __init__(self, email: str, token: str, contact_ids: list[int]):
+        self.email = email
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.contact_ids = contact_ids
+
+
+class Results:
+    """
+    Latencies and statuses of every scenario.
+    """
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, Counter] = defaultdict(Counter)
+        self.errors = Counter()
+        self.dropped = 0
+
+    def record(self, scenario: str, status: int | str, latency: float, ok: bool):
+        self.latencies[scenario].append(latency)
+        self.statuses[scenario][status] += 1
+        if not ok:
+            self.errors[scenario] += 1
+
+    def report(self, elapsed: float) -> dict:
+        """
+        The report function summarizes the run.
+
+        :param elapsed: float: Seconds of the run
+        :return: Requests, errors, throughput, latency percentiles in milliseconds and statuses of every scenario
+        """
+        scenarios = {}
+        for scenario, latencies in sorted(self.latencies.items(), key=lambda item: -len(item[1])):
+            scenarios[scenario] = {"requests": len(latencies), "errors": self.errors[scenario],
+                                   "throughput": len(latencies) / elapsed,
+                                   **{name: percentile(latencies, q) * 1000
+                                      for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1))},
+                                   "statuses": {str(status): count for status, count in self.statuses[scenario].items()}}
+        everything = list(itertools.chain.from_iterable(self.latencies.values()))
+        return {"elapsed": elapsed, "requests": len(everything), "errors": sum(self.errors.values()),
+                "dropped": self.dropped, "throughput": len(everything) / elapsed,
+                **{name: percentile(everything, q) * 1000 for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+                "scenarios": scenarios}
+
+
+def percentile(latencies: list[float], q: float) -> float:
+    """
+    The percentile function returns the nearest-rank percentile.
+
+    :param latencies: list[float]: Measured latencies
+    :param q: float: Percentile between 0 and 1
+    :return: The latency, 0 without latencies
+    """
+    if not latencies:
+        return 0.0
+    ordered = sorted(latencies)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+class Scenarios:
+    """
+    The requests of the mix. Every scenario sends one request as the account and returns the response
+    and the statuses which count as success. Created contacts get unique emails and phones.
+    """
+
+    def __init__(self):
+        self._numbers = itertools.count()
+        self._run = int(time.time()) % 100_000
+
+    def _contact(self, rng: random.Random) -> dict:
+        number = next(self._numbers) % 1_000_000
+        first_name = "".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()
+        return {"first_name": first_name, "last_name": "Loadtest",
+                "birthday": f"19{rng.randint(50, 99)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "email": f"new.{self._run}.{number}@loadtest.com", "phone": f"+381{self._run:05d}{number:06d}",
+                "favorite": rng.random() < 0.2}
+
+    async def login(self, client: httpx.AsyncClient, account: Account, rng: random.Random):
+        return await client.post("/api/auth/login", data={"username": account.email, "password": PASSWORD}), {200}
+
+    async def list(self, client: httpx.AsyncClient, account: Account, rng: random.Random):
+        return await client.get("/api/contacts/", headers=account.headers), {200}
+
+    async def search(self, client: httpx.AsyncClient, account: Account, rng: random.Random):
+        return await client.get("/api/contacts/search", params={"q": rng.choice(SYLLABLES)},
+                                headers=account.headers), {200}
+
+    async def birthday(self, client: httpx.AsyncClient, account: Account, rng: random.Random):
+        # 404 means nobody of the contacts has a birthday in the next week
+        return await client.get("/api/contacts/", params={"key": "birthday"}, headers=account.headers), {200, 404}
+
+    async def create(self, client: httpx.AsyncClient, account: Account, rng: random.Random):
+        return await client.post("/api/contacts/", json=self._contact(rng), headers=account.headers), {201}
+
+    async def update(self, client: httpx.AsyncClient, account: Account, rng: random.Random):
+        contact_id = rng.choice(account.contact_ids)
+        return await client.put(f"/api/contacts/{contact_id}", json=self._contact(rng), headers=account.headers), {200}
+
+    async def avatar(self, client: httpx.AsyncClient, account: Account, rng: random.Random):
+        return await client.put("/api/users/avatar", files={"file": ("avatar.png", AVATAR, "image/png")},
+                                headers=account.headers), {200}
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """
+    The parse_mix function reads a mix like ``list:30,search:20``.
+
+    :param mix: str: Scenario names with their weights
+    :return: Weight of every scenario
+    :raises ValueError: Unknown scenario
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.strip().partition(":")
+        if not hasattr(Scenarios, name) or name.startswith("_"):
+            raise ValueError(f"Unknown scenario {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def accounts(users: int, contacts: int) -> list[Account]:
+    """
+    The accounts function seeds the dataset and signs an access token for every user.
+
+    :param users: int: Number of users
+    :param contacts: int: Contacts of every user
+    :return: The accounts
+    """
+    create_tables()
+    ids = seed(users, contacts)
+    owned = defaultdict(list)
+    with engine.connect() as connection:
+        for contact_id, owner in connection.execute(select(Contact.id, Contact.contact_owner_id)
+                                                    .where(Contact.contact_owner_id.in_(ids.values()))):
+            owned[owner].append(contact_id)
+
+    async def tokens():
+        return [await auth_service.create_access_token(data={"sub": email}, expires_delta=24 * 3600) for email in ids]
+
+    return [Account(email, token, owned[user_id])
+            for (email, user_id), token in zip(ids.items(), asyncio.run(tokens()))]
+
+
+def in_process():
+    """
+    The in_process function prepares the ASGI app for an in-process run with the rate limits off.
+
+    :return: The app
+    """
+    from main import app
+
+    async def no_limit():
+        pass
+
+    for route in app.routes:
+        for dependency in getattr(route, "dependencies", []):
+            if isinstance(dependency.dependency, RateLimiter):
+                app.dependency_overrides[dependency.dependency] = no_limit
+    return app
+
+
+def start_uvicorn(workers: int) -> tuple[subprocess.Popen, str]:
+    """
+    The start_uvicorn function starts the app in uvicorn on a free port and waits until it is alive.
+
+    :param workers: int: Number of worker processes
+    :return: The server process and its url
+    """
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers",
+                               str(workers), "--log-level", "warning"], cwd=ROOT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            if httpx.get(f"{url}/api/health/live").status_code == 200:
+                return server, url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start in 60s")
+
+
+async def send(client: httpx.AsyncClient, scenarios: Scenarios, scenario: str, account: Account,
+               rng: random.Random, results: Results, started: float):
+    try:
+        response, expected = await getattr(scenarios, scenario)(client, account, rng)
+        status, ok = response.status_code, response.status_code in expected
+    except httpx.HTTPError as error:
+        status, ok = type(error).__name__, False
+    results.record(scenario, status, time.perf_counter() - started, ok)
+
+
+async def closed_loop(client: httpx.AsyncClient, users: list[Account], weights: dict[str, float],
+                      concurrency: int, duration: float, results: Results):
+    """
+    The closed_loop function runs concurrency virtual users, each sends its next request when the previous one answered.
+
+    :param client: httpx.AsyncClient: Client of the target
+    :param users: list[Account]: Accounts the virtual users log in as
+    :param weights: dict[str, float]: Mix of the scenarios
+    :param concurrency: int: Number of virtual users
+    :param duration: float: Seconds of the run
+    :param results: Results: Collected results
+    :return: None
+    """
+    scenarios, names, cumulative = Scenarios(), list(weights), list(itertools.accumulate(weights.values()))
+    deadline = time.perf_counter() + duration
+
+    async def virtual_user(number: int):
+        rng = random.Random(number)
+        account = users[number % len(users)]
+        while time.perf_counter() < deadline:
+            scenario = rng.choices(names, cum_weights=cumulative)[0]
+            await send(client, scenarios, scenario, account, rng, results, time.perf_counter())
+
+    await asyncio.gather(*(virtual_user(number) for number in range(concurrency)))
+
+
+async def open_loop(client: httpx.AsyncClient, users: list[Account], weights: dict[str, float],
+                    rate: float, duration: float, results: Results, max_in_flight: int):
+    """
+    The open_loop function starts requests on a Poisson schedule of rate per second, independent of the answers.
+    A request which would exceed max_in_flight is dropped and counted.
+
+    :param client: httpx.AsyncClient: Client of the target
+    :param users: list[Account]: Accounts the requests are spread over
+    :param weights: dict[str, float]: Mix of the scenarios
+    :param rate: float: Requests per second
+    :param duration: float: Seconds during which requests start
+    :param results: Results: Collected results
+    :param max_in_flight: int: Most requests waiting for an answer
+    :return: None
+    """
+    scenarios, names, cumulative = Scenarios(), list(weights), list(itertools.accumulate(weights.values()))
+    rng = random.Random(0)
+    in_flight = set()
+    started = scheduled = time.perf_counter()
+    while True:
+        scheduled += rng.expovariate(rate)
+        if scheduled - started >= duration:
+            break
+        await asyncio.sleep(max(scheduled - time.perf_counter(), 0))
+        if len(in_flight) >= max_in_flight:
+            results.dropped += 1
+            continue
+        scenario = rng.choices(names, cum_weights=cumulative)[0]
+        task = asyncio.create_task(send(client, scenarios, scenario, rng.choice(users), random.Random(rng.random()),
+                                        results, scheduled))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    await asyncio.gather(*in_flight)
+
+
+async def run(args, users: list[Account], weights: dict[str, float], transport: httpx.AsyncBaseTransport | None,
+              url: str) -> dict:
+    results = Results()
+    connections = args.concurrency or args.max_in_flight
+    async with httpx.AsyncClient(transport=transport, base_url=url, timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=connections,
+                                                     max_keepalive_connections=connections)) as client:
+        started = time.perf_counter()
+        if args.rate:
+            await open_loop(client, users, weights, args.rate, args.duration, results, args.max_in_flight)
+        else:
+            await closed_loop(client, users, weights, args.concurrency, args.duration, results)
+        return results.report(time.perf_counter() - started)
+
+
+def print_report(report: dict):
+    print(f"{'scenario':10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8}  statuses")
+    for scenario, row in report["scenarios"].items():
+        statuses = " ".join(f"{status}:{count}" for status, count in sorted(row["statuses"].items()))
+        print(f"{scenario:10} {row['requests']:>9} {row['errors']:>7} {row['throughput']:>8.1f} {row['p50']:>8.1f} "
+              f"{row['p95']:>8.1f} {row['p99']:>8.1f} {row['max']:>8.1f}  {statuses}")
+    print(f"{'total':10} {report['requests']:>9} {report['errors']:>7} {report['throughput']:>8.1f} "
+          f"{report['p50']:>8.1f} {report['p95']:>8.1f} {report['p99']:>8.1f}")
+    if report["dropped"]:
+        print(f"{report['dropped']} requests dropped at the in-flight limit")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--contacts", type=int, default=100)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users of the closed loop")
+    parser.add_argument("--rate", type=float, help="requests per second of the open loop, replaces --concurrency")
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--uvicorn", action="store_true")
+    target.add_argument("--url")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.rate:
+        args.concurrency = 0
+    engine.echo = False
+    users = accounts(args.users, args.contacts)
+    server = None
+    if args.uvicorn:
+        server, url = start_uvicorn(args.workers)
+        transport = None
+    elif args.url:
+        url, transport = args.url, None
+    else:
+        url, transport = "http://loadtest", httpx.ASGITransport(app=in_process(), raise_app_exceptions=False)
+    try:
+        report = asyncio.run(run(args, users, weights, transport, url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    load = f"open loop {args.rate}/s" if args.rate else f"closed loop of {args.concurrency} users"
+    print(f"{url}, {engine.dialect.name}, {load}, {report['elapsed']:.1f}s")
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark of the contacts table hash partitioned by owner at several partition counts.
+
+Needs a scratch Postgres database in SQLALCHEMY_DATABASE_URL. For every partition count a ``contacts_bench``
+table is built with the same keys and indexes as the partitioned contacts table, filled with generated rows
+and measured with the owner scoped queries of the repository::
+
+    python benchmarks/partition_benchmark.py --contacts 10000000 --users 100000 --partitions 0,8,32,128
+
+Partition count 0 is the plain table with the same keys for comparison.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+
+from src.db.db import engine  # noqa: E402
+from src.db.models import User, create_tables  # noqa: E402
+from src.jobs.partition_contacts import create_table_ddl  # noqa: E402
+
+TABLE = "contacts_bench"
+
+QUERIES = {
+    "page": f"SELECT * FROM {TABLE} WHERE contact_owner_id = :owner ORDER BY id LIMIT 50",
+    "phone": f"SELECT id FROM {TABLE} WHERE contact_owner_id = :owner AND phone_canonical = :phone",
+    "changes": f"SELECT * FROM {TABLE} WHERE contact_owner_id = :owner AND change_seq > :seq "
+               f"ORDER BY change_seq LIMIT 100",
+    "count": f"SELECT count(*) FROM {TABLE} WHERE contact_owner_id = :owner",
+}
+
+
+def seed_users(users: int) -> list[int]:
+    """
+    The seed_users function creates the owners of the generated contacts unless there are enough users.
+
+    :param users: int: Number of owners
+    :return: Ids of the owners
+    """
+    with engine.begin() as connection:
+        existing = connection.execute(select(func.count(User.id))).scalar()
+        if existing < users:
+            connection.execute(insert(User), [{"username": f"user{i}", "email": f"user{i}@bench.com", "password": "x"}
+                                              for i in range(existing, users)])
+        return connection.execute(select(User.id).order_by(User.id).limit(users)).scalars().all()
+
+
+def build(partitions: int, contacts: int, owners: list[int]) -> dict:
+    """
+    The build function recreates the benchmark table and fills it on the server side.
+
+    :param partitions: int: Number of hash partitions, 0 for a plain table
+    :param contacts: int: Number of generated contacts
+    :param owners: list[int]: Ids of the owners
+    :return: Load, vacuum and index size measurements
+    """
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        for statement in create_table_ddl("contacts", TABLE, partitions):
+            connection.execute(text(statement))
+
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(text(
+            f"INSERT INTO {TABLE} (id, first_name, last_name, email, phone, favorite, contact_owner_id, change_seq, "
+            f"email_canonical, phone_canonical, created_at, updated_at) "
+            f"SELECT g, 'first' || g, 'last' || g, 'c' || g || '@bench.com', '+380' || lpad(g::text, 9, '0'), "
+            f"g % 7 = 0, (:owners)[1 + g % cardinality(:owners)], g, 'c' || g || '@bench.com', "
+            f"'+380' || lpad(g::text, 9, '0'), now(), now() FROM generate_series(1, :contacts) AS g"),
+            {"owners": owners, "contacts": contacts})
+    load = time.perf_counter() - started
+
+    with engine.begin() as connection:
+        connection.execute(text(f"UPDATE {TABLE} SET favorite = NOT favorite WHERE id % 100 = 0"))
+    started = time.perf_counter()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"VACUUM (ANALYZE) {TABLE}"))
+    vacuum = time.perf_counter() - started
+
+    with engine.connect() as connection:
+        sizes = connection.execute(text(
+            "SELECT sum(pg_indexes_size(relid)), max(pg_indexes_size(relid)) "
+            "FROM pg_partition_tree(CAST(:table AS regclass)) WHERE isleaf"), {"table": TABLE}).one()
+    return {"load": load, "vacuum": vacuum, "indexes_mb": sizes[0] / 2 ** 20, "largest_mb": sizes[1] / 2 ** 20}
+
+
+def measure(queries: int, contacts: int, owners: list[int]) -> dict[str, list[float]]:
+    """
+    The measure function runs every benchmark query for random owners and returns the latencies.
+
+    :param queries: int: Number of runs of every query
+    :param contacts: int: Number of generated contacts
+    :param owners: list[int]: Ids of the owners
+    :return: Query name to latencies in milliseconds
+    """
+    rng = random.Random(7)
+    latencies = {name: [] for name in QUERIES}
+    with engine.connect() as connection:
+        for _ in range(queries):
+            contact = rng.randint(1, contacts)
+            params = {"owner": owners[contact % len(owners)], "phone": f"+380{contact:09d}",
+                      "seq": contact - 1000}
+            for name, query in QUERIES.items():
+                started = time.perf_counter()
+                connection.execute(text(query), params).all()
+                latencies[name].append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--partitions", default="0,8,32,128")
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        parser.error("partitioning needs a Postgres database")
+    engine.echo = False
+    create_tables()
+    owners = seed_users(args.users)
+    try:
+        for partitions in map(int, args.partitions.split(",")):
+            built = build(partitions, args.contacts, owners)
+            print(f"{partitions} partitions: load {built['load']:.1f}s, vacuum {built['vacuum']:.1f}s, "
+                  f"indexes {built['indexes_mb']:.0f}MB, largest partition indexes {built['largest_mb']:.0f}MB")
+            for name, latencies in measure(args.queries, args.contacts, owners).items():
+                quantiles = statistics.quantiles(latencies, n=100)
+                print(f"  {name:8} p50={quantiles[49]:.2f}ms p95={quantiles[94]:.2f}ms p99={quantiles[98]:.2f}ms")
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
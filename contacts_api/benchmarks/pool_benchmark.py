@@ -0,0 +1,117 @@
+"""
+Connection pool pressure of authenticated requests.
+
+Sends concurrent ``GET /api/users/me`` requests for a set of users through the ASGI app and counts
+the pool checkouts, the peak of connections checked out at once and the total time connections were held.
+The user cache is an in-memory stand-in for Redis, so only the first request of every user reads the database::
+
+    python benchmarks/pool_benchmark.py --users 200 --requests 5000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./pool_benchmark.db")
+
+import httpx  # noqa: E402
+from sqlalchemy import event, insert, select  # noqa: E402
+
+from main import app  # noqa: E402
+from src.db.db import engine  # noqa: E402
+from src.db.models import User, create_tables  # noqa: E402
+from src.services.auth import auth_service  # noqa: E402
+
+
+class MemoryCache(dict):
+    def get(self, key):
+        return super().get(key)
+
+    def set(self, key, value, ex=None):
+        self[key] = value
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.current = 0
+        self.peak = 0
+        self.held = 0.0
+        self._started: dict[int, float] = {}
+
+    def checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        self.current += 1
+        self.peak = max(self.peak, self.current)
+        self._started[id(connection_record)] = time.perf_counter()
+
+    def checkin(self, dbapi_connection, connection_record):
+        self.current -= 1
+        self.held += time.perf_counter() - self._started.pop(id(connection_record), time.perf_counter())
+
+
+def seed(users: int) -> list[str]:
+    """
+    The seed function creates the benchmark users unless they exist.
+
+    :param users: int: Number of users
+    :return: Emails of the users
+    """
+    emails = [f"pool{i}@bench.com" for i in range(users)]
+    with engine.begin() as connection:
+        existing = set(connection.execute(select(User.email).where(User.email.in_(emails))).scalars())
+        missing = [{"username": email, "email": email, "password": "x"} for email in emails if email not in existing]
+        if missing:
+            connection.execute(insert(User), missing)
+    return emails
+
+
+async def run(emails: list[str], requests: int, concurrency: int) -> float:
+    """
+    The run function sends the requests with at most concurrency of them in flight.
+
+    :param emails: list[str]: Users the requests are spread over
+    :param requests: int: Number of requests
+    :param concurrency: int: Requests in flight
+    :return: Elapsed seconds
+    """
+    tokens = [await auth_service.create_access_token(data={"sub": email}, expires_delta=3600) for email in emails]
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(number: int):
+            async with semaphore:
+                response = await client.get("/api/users/me/",
+                                            headers={"Authorization": f"Bearer {tokens[number % len(tokens)]}"})
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(number) for number in range(requests)))
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    engine.echo = False
+    create_tables()
+    emails = seed(args.users)
+    auth_service.c = MemoryCache()
+    stats = PoolStats()
+    event.listen(engine, "checkout", stats.checkout)
+    event.listen(engine, "checkin", stats.checkin)
+    elapsed = asyncio.run(run(emails, args.requests, args.concurrency))
+    print(f"{args.requests} requests for {args.users} users, concurrency {args.concurrency}: "
+          f"{args.requests / elapsed:.0f} req/s")
+    print(f"checkouts={stats.checkouts} peak={stats.peak} held={stats.held * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
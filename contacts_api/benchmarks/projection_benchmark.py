@@ -0,0 +1,94 @@
+"""
+Throughput and memory of loading a contact list as ORM instances and as projected rows.
+
+Seeds one user of the database behind SQLALCHEMY_DATABASE_URL (a local SQLite file by default)
+with generated contacts and loads them with ``get_contacts`` and ``get_contact_rows``::
+
+    python benchmarks/projection_benchmark.py --contacts 50000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./projection_benchmark.db")
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from src.db.db import DBSession, engine  # noqa: E402
+from src.db.models import Contact, User, create_tables  # noqa: E402
+from src.repository.contacts import CONTACT_FIELDS, get_contact_rows, get_contacts  # noqa: E402
+
+MODES = {
+    "orm": lambda user_id, db: get_contacts(user_id, db),
+    "rows": lambda user_id, db: get_contact_rows(user_id, db),
+    "rows id,first_name,phone": lambda user_id, db: get_contact_rows(user_id, db, ("id", "first_name", "phone")),
+}
+
+
+def seed(contacts: int) -> int:
+    """
+    The seed function creates the benchmark user with the contacts unless they exist.
+
+    :param contacts: int: Number of contacts of the user
+    :return: Id of the user
+    """
+    with engine.begin() as connection:
+        user_id = connection.execute(select(User.id).where(User.email == "projection@bench.com")).scalar()
+        if user_id is None:
+            user_id = connection.execute(insert(User).values(username="projection", email="projection@bench.com",
+                                                             password="x").returning(User.id)).scalar()
+        existing = connection.execute(select(func.count(Contact.id)).where(Contact.contact_owner_id == user_id)).scalar()
+        rows = [{"first_name": f"first{i}", "last_name": f"last{i}", "email": f"projection{i}@bench.com",
+                 "phone": f"38099{i:07d}", "favorite": i % 2 == 0, "contact_owner_id": user_id}
+                for i in range(existing, contacts)]
+        if rows:
+            connection.execute(insert(Contact), rows)
+    return user_id
+
+
+async def measure(mode: str, user_id: int, repeats: int) -> tuple[float, float, int]:
+    """
+    The measure function loads the list repeatedly and returns the best throughput and the memory per row.
+
+    :param mode: str: Name of the loading mode
+    :param user_id: int: Owner of the contacts
+    :param repeats: int: Number of timed loads
+    :return: Rows per second, bytes per row and number of rows
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        with DBSession() as db:
+            started = time.perf_counter()
+            rows = await MODES[mode](user_id, db)
+            best = min(best, time.perf_counter() - started)
+
+    with DBSession() as db:
+        tracemalloc.start()
+        rows = await MODES[mode](user_id, db)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return len(rows) / best, current / len(rows), len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=50_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    engine.echo = False
+    create_tables()
+    user_id = seed(args.contacts)
+    print(f"{engine.dialect.name}: {args.contacts} contacts, {len(CONTACT_FIELDS)} response fields")
+    for mode in MODES:
+        throughput, per_row, rows = asyncio.run(measure(mode, user_id, args.repeats))
+        print(f"{mode:26} {throughput:>10.0f} rows/s {per_row:>8.0f} bytes/row")
+
+
+if __name__ == "__main__":
+    main()
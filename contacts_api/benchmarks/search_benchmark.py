@@ -0,0 +1,116 @@
+"""
+Latency benchmark of the contacts search.
+
+Seeds the database behind SQLALCHEMY_DATABASE_URL (a local SQLite file by default) with
+generated contacts and measures ``search_contacts`` for random prefixes::
+
+    python benchmarks/search_benchmark.py --contacts 1000000 --users 1000
+
+Point SQLALCHEMY_DATABASE_URL to a Postgres database to measure the tsvector / trigram path.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite:///./search_benchmark.db")
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from src.db.db import DBSession, engine  # noqa: E402
+from src.db.models import Contact, User, create_tables  # noqa: E402
+from src.repository.contacts import search_contacts  # noqa: E402
+
+SYLLABLES = ["al", "an", "bo", "da", "el", "ka", "li", "ma", "mi", "na", "ol", "ra", "ri", "sa", "ta", "vi", "yu", "zo"]
+
+
+def name(rng: random.Random) -> str:
+    """
+    The name function generates a pronounceable name of two or three syllables.
+
+    :param rng: random.Random: Source of randomness
+    :return: A capitalized name
+    """
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def seed(contacts: int, users: int, batch: int = 10_000):
+    """
+    The seed function fills the database with users and contacts unless it already holds enough contacts.
+
+    :param contacts: int: Total number of contacts
+    :param users: int: Number of owners the contacts are spread over
+    :param batch: int: Rows inserted in one statement
+    :return: None
+    """
+    rng = random.Random(42)
+    with engine.begin() as connection:
+        existing = connection.execute(select(func.count(Contact.id))).scalar()
+        if existing >= contacts:
+            return
+        if not connection.execute(select(func.count(User.id))).scalar():
+            connection.execute(insert(User), [{"username": f"user{i}", "email": f"user{i}@bench.com", "password": "x"}
+                                              for i in range(users)])
+        user_ids = connection.execute(select(User.id)).scalars().all()
+
+    started = time.perf_counter()
+    for start in range(existing, contacts, batch):
+        rows = []
+        for i in range(start, min(start + batch, contacts)):
+            first_name, last_name = name(rng), name(rng)
+            rows.append({"first_name": first_name, "last_name": last_name,
+                         "email": f"{first_name.lower()}.{last_name.lower()}{i}@bench.com",
+                         "phone": f"380{i:09d}", "favorite": False,
+                         "contact_owner_id": rng.choice(user_ids)})
+        with engine.begin() as connection:
+            connection.execute(insert(Contact), rows)
+    print(f"seeded {contacts - existing} contacts in {time.perf_counter() - started:.1f}s")
+
+
+async def run(queries: int, limit: int) -> list[float]:
+    """
+    The run function executes random prefix searches and returns their latencies.
+
+    :param queries: int: Number of searches
+    :param limit: int: Result limit of every search
+    :return: Latencies in milliseconds
+    """
+    rng = random.Random(7)
+    db = DBSession()
+    try:
+        user_ids = db.execute(select(User.id)).scalars().all()
+        latencies = []
+        for _ in range(queries):
+            prefix = name(rng)[:rng.randint(2, 4)]
+            started = time.perf_counter()
+            await search_contacts(rng.choice(user_ids), prefix, limit, db)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--contacts", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    engine.echo = False
+    create_tables()
+    seed(args.contacts, args.users)
+    latencies = sorted(asyncio.run(run(args.queries, args.limit)))
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{engine.dialect.name}: {args.queries} queries over {args.contacts} contacts, limit {args.limit}")
+    print(f"p50={quantiles[49]:.2f}ms p95={quantiles[94]:.2f}ms p99={quantiles[98]:.2f}ms max={latencies[-1]:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Cold start latency of a worker.
+
+Starts fresh interpreters which import the application, run its lifespan startup and answer a first request,
+and reports the time of every phase and the slowest imports. Startup creates the tables and connects the limiter
+to Redis, so it is measured only with ``--lifespan``, and against live services::
+
+    python benchmarks/startup_benchmark.py --runs 10
+    python benchmarks/startup_benchmark.py --runs 10 --lifespan
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+WORKER = """
+import asyncio, json, time
+from fastapi.testclient import TestClient
+started = time.perf_counter()
+from main import app, lifespan
+imported = time.perf_counter()
+
+async def start():
+    async with lifespan(app):
+        pass
+
+if {lifespan}:
+    asyncio.run(start())
+ready = time.perf_counter()
+TestClient(app).get("/api/health/live").raise_for_status()
+answered = time.perf_counter()
+print(json.dumps({{"import": imported - started, "startup": ready - imported, "first request": answered - ready}}))
+"""
+
+
+def run(lifespan: bool) -> tuple[dict, dict]:
+    """
+    The run function starts one worker interpreter.
+
+    :param lifespan: bool: Run the lifespan startup between import and first request
+    :return: Seconds of every phase and the own import seconds of every module
+    """
+    env = {"SQLALCHEMY_DATABASE_URL": "sqlite:///./startup_benchmark.db", **os.environ}
+    done = subprocess.run([sys.executable, "-X", "importtime", "-c", WORKER.format(lifespan=lifespan)],
+                          cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    modules = {}
+    for line in done.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "self [us]" not in line:
+            own, _, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = int(own) / 1e6
+    return json.loads(done.stdout.splitlines()[-1]), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--lifespan", action="store_true")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    phases, modules = defaultdict(list), defaultdict(list)
+    for _ in range(args.runs):
+        timings, imports = run(args.lifespan)
+        for phase, seconds in timings.items():
+            phases[phase].append(seconds)
+        for name, seconds in imports.items():
+            modules[name].append(seconds)
+    for phase, seconds in phases.items():
+        print(f"{phase:14} median {statistics.median(seconds) * 1000:8.1f}ms  max {max(seconds) * 1000:8.1f}ms")
+    print(f"\nslowest own import times, median of {args.runs} runs:")
+    slowest = sorted(modules.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:args.top]
+    for name, seconds in slowest:
+        print(f"  {statistics.median(seconds) * 1000:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,64 @@
+import functools
 
-import redis.asyncio as redis
 from fastapi_limiter import FastAPILimiter
+from redis.exceptions import NoScriptError
 
 from src.conf.config import settings
+from src.services.fakes_service import MemoryStore
+from src.services.metrics_service import instrument_redis
+from src.services.redis_service import rate_limit, redis_client
+
+
+def limiter_fallback(policy: str = settings.limiter_fallback):
+    """
+    The limiter_fallback function answers the commands of the limiter while Redis is unavailable.
+    With local the limits are counted in buckets of this worker, so every worker allows the full limit,
+    open lets every request through and closed rejects them until the circuit breaker tries Redis again.
+
+    :param policy: str: local, open or closed
+    :return: Callable with the arguments of a Redis command
+    """
+    store = MemoryStore()
+    store.register_script(FastAPILimiter.lua_script, rate_limit)
+    store.execute("SCRIPT LOAD", FastAPILimiter.lua_script)
+
+    def fallback(command: str, *args, **options):
+        if policy == "local" or command != "EVALSHA":
+            return store.execute(command, *args, **options)
+        return 0 if policy == "open" else int(settings.redis_breaker_reset * 1000)
+
+    return fallback
+
+
+def reload_script(client):
+    """
+    The reload_script function loads the script of the limiter again when Redis lost it, after a restart
+    of the server or when the worker started while Redis was unavailable.
+
+    :param client: asyncio Redis client of the limiter
+    :return: The client
+    """
+    execute_command = client.execute_command
+
+    @functools.wraps(execute_command)
+    async def execute(*args, **options):
+        try:
+            return await execute_command(*args, **options)
+        except NoScriptError:
+            await execute_command("SCRIPT LOAD", FastAPILimiter.lua_script)
+            return await execute_command(*args, **options)
+
+    client.execute_command = execute
+    return client
+
 
 async def setup_limiter():
     """
     The setup_limiter function is used to initialize the FastAPILimiter library.
     It takes no arguments, and returns nothing. It must be called before any other
     FastAPILimiter functions are called.
-    
+
     :return: The fastapilimiter object
     """
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(r)
\ No newline at end of file
+    r = redis_client(decode_responses=True, name="limiter", fallback=limiter_fallback())
+    await FastAPILimiter.init(reload_script(instrument_redis(r, "limiter")))
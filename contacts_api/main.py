@@ -1,14 +1,52 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from fastapi_limiter.depends import RateLimiter
 
-from src.db.db import get_db
-from src.routes import contacts, auth, users
+from src.db.db import get_db, named_engines
+from src.db.models import create_tables
+from src.db.profiler import QueryProfiler, SQLProfilerMiddleware
+from src.db.shards import UserMoving
+from src.services.admission_service import AdmissionMiddleware, admission
+from src.services.health_service import health
+from src.services.idempotency_service import IdempotencyMiddleware, idempotency
+from src.services.loop_monitor_service import LoopMonitorMiddleware, loop_monitor
+from src.services.profiling_service import RequestProfileMiddleware
+from src.services.metrics_service import (MetricsMiddleware, instrument_engine, instrument_redis, mark_process_dead,
+                                         metrics_response)
+from src.services.tracing_service import TracingMiddleware, tracer
+from src.routes import contacts, auth, users, admin
+from src.conf.config import settings
 from limiter import setup_limiter
 
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function initializes the worker when it starts and cleans up when it stops.
+    Importing the application connects to nothing, the tables, the limiter and the loop monitor
+    are set up here, the Redis, mail and Cloudinary clients on first use.
+
+    :param app: FastAPI: The application
+    :return: A context manager around the life of the worker
+    """
+    if settings.db_create_tables:
+        create_tables()
+    await setup_limiter()
+    if settings.loop_monitor:
+        loop_monitor.start()
+    yield
+    loop_monitor.stop()
+    mark_process_dead()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,18 +55,39 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(AdmissionMiddleware, admission=admission)
+app.add_middleware(IdempotencyMiddleware, prefixes=("/api/contacts",))
+if settings.sql_profile:
+    app.add_middleware(SQLProfilerMiddleware, threshold=settings.sql_repeat_threshold)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+if settings.loop_monitor:
+    app.add_middleware(LoopMonitorMiddleware)
+if settings.admin_token:
+    app.add_middleware(RequestProfileMiddleware)
 
+query_profiler = QueryProfiler(settings.sql_slow_query_ms, settings.sql_slow_query_sample)
+for name, named_engine in named_engines():
+    instrument_engine(named_engine, name)
+    query_profiler.instrument(named_engine)
+    tracer.instrument_engine(named_engine)
+instrument_redis(idempotency.c, "idempotency")
+tracer.instrument_redis(idempotency.c, "idempotency")
+tracer.instrument_fastapi()
 
-@app.on_event("startup")
-async def startup():
+
+@app.exception_handler(UserMoving)
+async def user_moving_handler(request: Request, exc: UserMoving):
     """
-    The startup function is called when the application starts up.
-    It's a good place to initialize things that are used by the whole application,
-    like database connections or caches.
-    
-    :return: A coroutine, which means it's a function that
+    The user_moving_handler function answers 503 while the user is moved to another shard,
+    the move takes seconds, so the client is asked to retry shortly.
+
+    :param request: Request: The failed request
+    :param exc: UserMoving: The raised exception
+    :return: A 503 response with a Retry-After header
     """
-    await setup_limiter()
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)},
+                        headers={"Retry-After": "5"})
 
 
 @app.get("/", dependencies=[Depends(RateLimiter(times=3, seconds=5))])
@@ -61,6 +120,45 @@ def healthchecker(db: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"{e}")
 
 
+@app.get('/api/health/live')
+async def liveness():
+    """
+    The liveness function answers as long as the event loop of the worker runs, it touches no dependency,
+    so a slow database does not get the worker restarted.
+
+    :return: A dictionary with the status
+    """
+    return {"status": "alive"}
+
+
+@app.get('/api/health/ready')
+async def readiness():
+    """
+    The readiness function checks the databases, Redis and the mail server concurrently with timeouts,
+    the result is cached for a moment. The worker is not ready when a database or Redis fails,
+    or when the database pool is nearly exhausted, a failing mail server only degrades it.
+
+    :return: The checks and the pool usage, with status 503 when the worker is not ready
+    """
+    result = await health.readiness()
+    return JSONResponse(status_code=status.HTTP_200_OK if result["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content=result)
+
+
+@app.get('/metrics', include_in_schema=False)
+def metrics():
+    """
+    The metrics function exposes the request, database pool, Redis, cache, email, upload and admission metrics
+    in the Prometheus text format. With PROMETHEUS_MULTIPROC_DIR set it reports the sum over all workers.
+
+    :return: The metrics response
+    """
+    return metrics_response()
+
+
 app.include_router(contacts.router, prefix="/api")
 app.include_router(auth.router, prefix="/api")
-app.include_router(users.router, prefix="/api")
\ No newline at end of file
+app.include_router(users.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
+if settings.image_backend == "filesystem":
+    app.mount(settings.image_base_url, StaticFiles(directory=settings.image_dir, check_dir=False), name="images")
\ No newline at end of file
@@ -14,16 +14,68 @@ class Settings(BaseModel):
     mail_password: str = os.getenv("MAIL_PASSWORD", 'password')
     mail_from: str = os.getenv("MAIL_FROM", 'example@mail.com')
     mail_port: int = os.getenv("MAIL_PORT", 465)
-    mail_server: str = os.getenv("", 'smtp.meta.ua')
+    mail_server: str = os.getenv("MAIL_SERVER", 'smtp.meta.ua')
+    mail_ssl_tls: bool = os.getenv("MAIL_SSL_TLS", True)
+    mail_starttls: bool = os.getenv("MAIL_STARTTLS", False)
+    mail_validate_certs: bool = os.getenv("MAIL_VALIDATE_CERTS", False)
     redis_host: str = os.getenv("REDIS_HOST", 'localhost')
     redis_port: int = os.getenv("REDIS_PORT", 6379)
-    redis_password: int = os.getenv("REDIS_PASSWORD", 'password')
+    redis_password: str = os.getenv("REDIS_PASSWORD", 'password')
     cloudinary_name: str = os.getenv("CLOUDINARY_NAME", "sa@5-3123df_fd")
     cloudinary_api_key: int = os.getenv("CLOUDINARY_API_KEY", "37927498275972984")
     cloudinary_api_secret: str = os.getenv("CLOUDINARY_API_SECRET", '********')
+    redis_backend: str = os.getenv("REDIS_BACKEND", "redis")
+    redis_fake_profile: str = os.getenv("REDIS_FAKE_PROFILE", "")
+    redis_timeout: float = os.getenv("REDIS_TIMEOUT", 0.25)
+    redis_breaker_failures: int = os.getenv("REDIS_BREAKER_FAILURES", 5)
+    redis_breaker_reset: float = os.getenv("REDIS_BREAKER_RESET", 5)
+    auth_cache_fallback: str = os.getenv("AUTH_CACHE_FALLBACK", "local")
+    auth_local_cache_size: int = os.getenv("AUTH_LOCAL_CACHE_SIZE", 10000)
+    auth_local_cache_ttl: float = os.getenv("AUTH_LOCAL_CACHE_TTL", 30)
+    limiter_fallback: str = os.getenv("LIMITER_FALLBACK", "local")
+    mail_backend: str = os.getenv("MAIL_BACKEND", "smtp")
+    mail_fake_profile: str = os.getenv("MAIL_FAKE_PROFILE", "")
+    image_backend: str = os.getenv("IMAGE_BACKEND", "cloudinary")
+    image_fake_profile: str = os.getenv("IMAGE_FAKE_PROFILE", "")
+    image_dir: str = os.getenv("IMAGE_DIR", "media")
+    image_base_url: str = os.getenv("IMAGE_BASE_URL", "/media")
+    events_queue_size: int = os.getenv("EVENTS_QUEUE_SIZE", 100)
+    events_heartbeat: int = os.getenv("EVENTS_HEARTBEAT", 15)
+    tombstone_retention_days: int = os.getenv("TOMBSTONE_RETENTION_DAYS", 30)
+    phone_country_code: str = os.getenv("PHONE_COUNTRY_CODE", "380")
+    contacts_quota: int = os.getenv("CONTACTS_QUOTA", 0)
+    contacts_partitions: int = os.getenv("CONTACTS_PARTITIONS", 0)
+    shard_urls: str = os.getenv("SHARD_URLS", "")
+    shard_directory_ttl: int = os.getenv("SHARD_DIRECTORY_TTL", 30)
+    replica_urls: str = os.getenv("REPLICA_URLS", "")
+    replica_strategy: str = os.getenv("REPLICA_STRATEGY", "round_robin")
+    replica_max_lag: float = os.getenv("REPLICA_MAX_LAG", 5)
+    replica_check_interval: float = os.getenv("REPLICA_CHECK_INTERVAL", 2)
+    idempotency_ttl: int = os.getenv("IDEMPOTENCY_TTL", 86400)
+    idempotency_wait: float = os.getenv("IDEMPOTENCY_WAIT", 10)
+    admission_limits: str = os.getenv("ADMISSION_LIMITS", "auth:20,write:10,list:10,export:2:0.5")
+    admission_deadline: float = os.getenv("ADMISSION_DEADLINE", 2)
+    admission_queue: int = os.getenv("ADMISSION_QUEUE", 50)
+    sql_echo: bool = os.getenv("SQL_ECHO", False)
+    db_create_tables: bool = os.getenv("DB_CREATE_TABLES", True)
+    sql_profile: bool = os.getenv("SQL_PROFILE", False)
+    sql_slow_query_ms: float = os.getenv("SQL_SLOW_QUERY_MS", 500)
+    sql_slow_query_sample: float = os.getenv("SQL_SLOW_QUERY_SAMPLE", 1.0)
+    sql_repeat_threshold: int = os.getenv("SQL_REPEAT_THRESHOLD", 5)
+    trace_exporter: str = os.getenv("TRACE_EXPORTER", "none")
+    trace_sample_rate: float = os.getenv("TRACE_SAMPLE_RATE", 0.01)
+    trace_tail_latency_ms: float = os.getenv("TRACE_TAIL_LATENCY_MS", 500)
+    trace_tail_errors: bool = os.getenv("TRACE_TAIL_ERRORS", True)
+    loop_monitor: bool = os.getenv("LOOP_MONITOR", False)
+    loop_monitor_threshold_ms: float = os.getenv("LOOP_MONITOR_THRESHOLD_MS", 100)
+    admin_token: str = os.getenv("ADMIN_TOKEN", "")
+    health_timeout: float = os.getenv("HEALTH_TIMEOUT", 1)
+    health_cache_seconds: float = os.getenv("HEALTH_CACHE_SECONDS", 2)
+    health_pool_limit: float = os.getenv("HEALTH_POOL_LIMIT", 0.8)
 
     class Config:
         env_file = '.env'
         env_file_encoding = 'utf-8'
+        validate_default = True
 
 settings = Settings()
\ No newline at end of file
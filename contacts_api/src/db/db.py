@@ -1,17 +1,98 @@
-from fastapi import HTTPException, status
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import Select, create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
 
 from src.conf.config import settings
+from src.db.replicas import ReplicaSet
+from src.services.metrics_service import instrument_redis
+from src.services.redis_service import redis_client
 
 URI = settings.sqlalchemy_database_url
 
-engine = create_engine(URI, echo=True)
-DBSession = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+engine = create_engine(URI, echo=settings.sql_echo)
+shard_engines = [engine if url == URI else create_engine(url, echo=settings.sql_echo)
+                 for url in settings.shard_urls.split(",") if url.strip()] or [engine]
+replica_groups = settings.replica_urls.split(";")
+# read-your-writes pins shared by all workers, the client connects on its first command
+replica_pins = (instrument_redis(redis_client(sync=True, name="replicas"), "replicas")
+                if settings.replica_urls.strip() else None)
+replica_sets = [ReplicaSet([create_engine(url, echo=settings.sql_echo) for url in group.split(",") if url.strip()],
+                           settings.replica_strategy, settings.replica_max_lag, settings.replica_check_interval,
+                           store=replica_pins)
+                if group.strip() else None
+                for group in replica_groups + [""] * (len(shard_engines) - len(replica_groups))]
 
 
-def get_db():
+def named_engines() -> list[tuple[str, Engine]]:
+    """
+    The named_engines function lists the engines of every shard and of its replicas, for instrumentation.
+
+    :return: Pairs of a name like shard0 or shard0-replica1 and the engine
+    """
+    named = []
+    for shard, shard_engine in enumerate(shard_engines):
+        named.append((f"shard{shard}", shard_engine))
+        for number, replica in enumerate(replica_sets[shard].replicas if replica_sets[shard] else []):
+            named.append((f"shard{shard}-replica{number}", replica.engine))
+    return named
+
+
+class ShardedSession(Session):
+    """
+    Session which sends every statement to one of the shard engines. The shard is chosen by the
+    shard directory once the user of the request is known and kept in ``session.info["shard"]``,
+    sessions without a user use the first shard.
+
+    Sessions marked with ``session.info["replica"]`` read from a replica of the shard until their first write,
+    the write and everything after it goes to the primary, so the request reads its own writes.
+    The replica is picked once per session and kept in ``session.info["replica_engines"]``, so all reads
+    of a request see the same replication lag and use one connection.
+    A write also pins the user of ``session.info["user_id"]`` to the primary for the next requests.
+    """
+
+    def __init__(self, shards: list[Engine], replicas: list[ReplicaSet | None] | None = None,
+                 bind: Engine | None = None, **kwargs):
+        super().__init__(bind=bind or shards[0], **kwargs)
+        self.shards = shards
+        self.replicas = replicas or [None] * len(shards)
+
+    def _writes(self, clause) -> bool:
+        if self.info.get("wrote"):
+            return True
+        if self._flushing or isinstance(clause, UpdateBase) or \
+                (isinstance(clause, Select) and clause._for_update_arg is not None):
+            self.info["wrote"] = True
+            return True
+        return False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        shard = self.info.get("shard", 0)
+        replicas = self.replicas[shard]
+        if replicas is not None:
+            if self._writes(clause):
+                replicas.pin(self.info.get("user_id"))
+            elif self.info.get("replica"):
+                picked = self.info.setdefault("replica_engines", {})
+                if shard not in picked:
+                    picked[shard] = replicas.pick(self.info.get("user_id")) or self.shards[shard]
+                return picked[shard]
+        return self.shards[shard]
+
+
+DBSession = sessionmaker(class_=ShardedSession, shards=shard_engines, replicas=replica_sets,
+                         autoflush=False, autocommit=False)
+
+
+async def get_db():
+    """
+    The get_db function gives every request its own session. The session checks out a connection
+    on its first statement only, and being async it does not take a threadpool worker for every request.
+
+    :return: A database session
+    """
     db = DBSession()
     try:
         yield db
@@ -19,4 +100,17 @@ def get_db():
         db.rollback()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_read_db(db: Session = Depends(get_db)):
+    """
+    The get_read_db function marks the request session for replica reads, for endpoints which only read.
+    It wraps get_db, so the route and get_current_user share one session, and like get_db it is async,
+    so read routes do not take a threadpool worker for it.
+
+    :param db: Session: Session of the request
+    :return: The same session
+    """
+    db.info["replica"] = True
+    return db
@@ -1,25 +1,84 @@
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, func, ForeignKey
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, func, ForeignKey, Index, event
+from sqlalchemy.orm import declarative_base, relationship, validates
 
-from src.db.db import engine
+from src.db.db import engine, shard_engines
+from src.db.partitioning import contacts_partitions, partitioned_table_args, create_partitions
+from src.db.search import setup_search, drop_search
+from src.services.normalize_service import normalize_phone, normalize_email, name_key
 
 Base = declarative_base()
+DirectoryBase = declarative_base()
+
+PARTITIONS = contacts_partitions()
 
 class Contact(Base):
     __tablename__ = 'contacts'
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     first_name = Column(String(50), nullable=False)
     last_name = Column(String(50), nullable=False)
     birthday = Column(DateTime)
-    email = Column(String(150), unique=True, nullable=False)
-    phone = Column(String(30), unique=True, nullable=False)
+    email = Column(String(150), unique=not PARTITIONS, nullable=False)
+    phone = Column(String(30), unique=not PARTITIONS, nullable=False)
     favorite = Column(Boolean, default=False)
     created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), updated_at=func.now())
-    contact_owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, default=1)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    contact_owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, default=1,
+                              primary_key=bool(PARTITIONS))
     contact_owner = relationship("User", backref="contacts")
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")
+    email_canonical = Column(String(150))
+    phone_canonical = Column(String(20))
+    name_key = Column(String(8))
+
+    __table_args__ = (
+        Index("ix_contacts_owner_change_seq", "contact_owner_id", "change_seq"),
+        # one contact per canonical email and phone of a user, databases created before run backfill_canonical
+        Index("ix_contacts_owner_email_canonical", "contact_owner_id", "email_canonical", unique=True),
+        Index("ix_contacts_owner_phone_canonical", "contact_owner_id", "phone_canonical", unique=True),
+        Index("ix_contacts_owner_name_key", "contact_owner_id", "name_key"),
+        *partitioned_table_args(PARTITIONS),
+    )
+
+    @validates("first_name")
+    def validate_first_name(self, key, first_name):
+        self.name_key = name_key(first_name, self.last_name)
+        return first_name
+
+    @validates("last_name")
+    def validate_last_name(self, key, last_name):
+        self.name_key = name_key(self.first_name, last_name)
+        return last_name
+
+    @validates("email")
+    def validate_email(self, key, email):
+        self.email_canonical = normalize_email(email)
+        return email
+
+    @validates("phone")
+    def validate_phone(self, key, phone):
+        self.phone_canonical = normalize_phone(phone)
+        return phone
+
+
+class ContactTombstone(Base):
+    __tablename__ = 'contact_tombstones'
+    id = Column(Integer, primary_key=True)
+    contact_id = Column(Integer, nullable=False)
+    contact_owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    change_seq = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("ix_contact_tombstones_owner_change_seq", "contact_owner_id", "change_seq"),
+    )
+
+class ContactCounter(Base):
+    __tablename__ = 'contact_counters'
+    contact_owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    name = Column(String(20), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
 
 class User(Base):
     __tablename__ = 'users'
@@ -31,6 +90,31 @@ class User(Base):
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
     avatar = Column(String(255), default="no-image.jpg")
+    contacts_version = Column(Integer, nullable=False, default=0, server_default="0")
+    tombstone_horizon = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class UserDirectory(DirectoryBase):
+    __tablename__ = 'user_directory'
+    user_id = Column(Integer, primary_key=True)
+    email = Column(String(200), nullable=False, unique=True)
+    shard = Column(Integer, nullable=False)
+    moving = Column(Boolean, nullable=False, default=False, server_default="0")
+
+
+event.listen(Contact.__table__, "after_create", create_partitions)
+event.listen(Base.metadata, "after_create", setup_search)
+event.listen(Base.metadata, "before_drop", drop_search)
+
 
+def create_tables():
+    """
+    The create_tables function creates the missing tables of every shard and the shard directory.
+    It runs at application startup and in the benchmarks, importing the models touches no database.
 
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    :return: None
+    """
+    for shard_engine in shard_engines:
+        Base.metadata.create_all(bind=shard_engine)
+    if len(shard_engines) > 1:
+        DirectoryBase.metadata.create_all(bind=engine)
@@ -0,0 +1,63 @@
+from sqlalchemy import UniqueConstraint, text
+from sqlalchemy.engine import make_url
+
+from src.conf.config import settings
+
+PARTITION_KEY = "contact_owner_id"
+
+
+def contacts_partitions() -> int:
+    """
+    The contacts_partitions function returns the number of hash partitions of the contacts table.
+    Partitioning is opt-in with CONTACTS_PARTITIONS and only used on Postgres, other databases get 0.
+
+    :return: Number of partitions, 0 for a plain table
+    """
+    if make_url(settings.sqlalchemy_database_url).get_backend_name() != "postgresql":
+        return 0
+    return int(settings.contacts_partitions)
+
+
+def partitioned_table_args(partitions: int) -> tuple:
+    """
+    The partitioned_table_args function returns the extra table arguments of a partitioned contacts table.
+    Postgres only allows unique constraints which contain the partition key, so email and phone
+    become unique per owner instead of globally.
+
+    :param partitions: int: Number of partitions, 0 for a plain table
+    :return: Constraints followed by the table options, empty for a plain table
+    """
+    if not partitions:
+        return ()
+    return (
+        UniqueConstraint(PARTITION_KEY, "email", name="uq_contacts_owner_email"),
+        UniqueConstraint(PARTITION_KEY, "phone", name="uq_contacts_owner_phone"),
+        {"postgresql_partition_by": f"HASH ({PARTITION_KEY})", "info": {"partitions": partitions}},
+    )
+
+
+def partitions_ddl(table: str, partitions: int) -> list[str]:
+    """
+    The partitions_ddl function returns the statements which create the hash partitions of a table.
+
+    :param table: str: Name of the partitioned table
+    :param partitions: int: Number of partitions
+    :return: One CREATE TABLE statement per partition
+    """
+    return [f"CREATE TABLE IF NOT EXISTS {table}_p{remainder} PARTITION OF {table} "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})" for remainder in range(partitions)]
+
+
+def create_partitions(target, connection, **kw):
+    """
+    The create_partitions function creates the partitions right after the partitioned table,
+    a partitioned table without partitions rejects every insert.
+
+    :param target: Table: Table which was created
+    :param connection: Connection: Connection used by create_all
+    :return: None
+    """
+    partitions = target.info.get("partitions")
+    if partitions and connection.dialect.name == "postgresql":
+        for statement in partitions_ddl(target.name, partitions):
+            connection.execute(text(statement))
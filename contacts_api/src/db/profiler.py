@@ -0,0 +1,130 @@
+import logging
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProfile:
+    """
+    Statements of one request: how many ran, how long they took and how often every statement shape repeated.
+    The shape is the SQL text with bound parameters, so lazy loads of one relationship share a shape.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def add(self, statement: str, duration: float):
+        """
+        The add function records one statement.
+
+        :param statement: str: SQL text of the statement
+        :param duration: float: Seconds the statement took
+        :return: None
+        """
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement] += 1
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        The repeated function returns the statement shapes which ran at least threshold times, the N+1 suspects.
+
+        :param threshold: int: Smallest number of runs
+        :return: Shapes with their number of runs, most frequent first
+        """
+        return [(shape, runs) for shape, runs in self.shapes.most_common() if runs >= threshold]
+
+    def server_timing(self, threshold: int) -> str:
+        """
+        The server_timing function renders the profile as a Server-Timing header value.
+
+        :param threshold: int: Smallest number of runs of a repeated shape
+        :return: Header value
+        """
+        value = f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+        repeated = self.repeated(threshold)
+        if repeated:
+            value += f', db-repeated;desc="{len(repeated)} shapes, {repeated[0][1]} runs of the most repeated"'
+        return value
+
+
+current_profile: ContextVar[QueryProfile | None] = ContextVar("current_profile", default=None)
+
+
+class QueryProfiler:
+    """
+    Statement timing on engine events. Statements of a profiled request are added to its QueryProfile,
+    and a sample of the statements slower than slow_ms is logged with their parameters,
+    in place of echoing every statement.
+    """
+
+    def __init__(self, slow_ms: float = 500, sample: float = 1.0):
+        self.slow = slow_ms / 1000
+        self.sample = sample
+
+    def instrument(self, engine: Engine):
+        """
+        The instrument function times every statement of the engine.
+
+        :param engine: Engine: Engine to instrument
+        :return: None
+        """
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+        event.listen(engine, "handle_error", self._failed)
+
+    @staticmethod
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @staticmethod
+    def _failed(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_started"].pop()
+        profile = current_profile.get()
+        if profile is not None:
+            profile.add(statement, duration)
+        if self.slow and duration >= self.slow and random.random() < self.sample:
+            logger.warning("Slow query %.1fms: %s %r", duration * 1000, statement, parameters)
+
+
+class SQLProfilerMiddleware:
+    """
+    ASGI middleware which profiles the statements of every request, reports the totals in the
+    Server-Timing header and logs the statement shapes repeated at least threshold times.
+    """
+
+    def __init__(self, app, threshold: int = 5):
+        self.app = app
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profile = QueryProfile()
+        token = current_profile.set(profile)
+
+        async def add_server_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", profile.server_timing(self.threshold))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, add_server_timing)
+        finally:
+            current_profile.reset(token)
+            for shape, runs in profile.repeated(self.threshold):
+                logger.warning("%s %s ran %d times the statement: %s", scope["method"], scope["path"], runs, shape)
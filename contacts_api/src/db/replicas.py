@@ -0,0 +1,154 @@
+import itertools
+import math
+import threading
+import time
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+PG_LAG = ("SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+          "ELSE coalesce(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END")
+
+
+class Replica:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.healthy = False
+        self.lag = float("inf")
+
+
+class ReplicaSet:
+    """
+    Read replicas of one primary database. A background thread measures the replication lag of every replica
+    each interval seconds, replicas which fail or lag more than max_lag seconds are out of rotation until
+    the next successful check, and a replica whose connection breaks during a request is taken out at once.
+    Users who just wrote are pinned to the primary for max_lag seconds, so they read their own writes.
+    With a store the pins are Redis keys, so a read handled by another worker also goes to the primary,
+    while the store is unavailable only the pins of this worker are seen.
+    """
+
+    def __init__(self, replicas: list[Engine], strategy: str = "round_robin", max_lag: float = 5,
+                 interval: float = 2, size: int = 10_000, store=None):
+        if strategy not in ("round_robin", "least_lag"):
+            raise ValueError(f"Unknown replica strategy {strategy}")
+        self.replicas = [Replica(engine) for engine in replicas]
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.interval = interval
+        self.size = size
+        self.store = store
+        self._turn = itertools.count()
+        self._pinned: dict[int, float] = {}
+        self._monitor: threading.Thread | None = None
+        for replica in self.replicas:
+            event.listen(replica.engine, "handle_error", self._on_error(replica))
+
+    @staticmethod
+    def _on_error(replica: Replica):
+        def handle_error(context):
+            if context.is_disconnect:
+                replica.healthy = False
+        return handle_error
+
+    @staticmethod
+    def measure_lag(engine: Engine) -> float:
+        """
+        The measure_lag function returns the replication lag of a replica in seconds.
+        Databases without streaming replication report no lag.
+
+        :param engine: Engine: Replica engine
+        :return: Lag in seconds
+        """
+        with engine.connect() as connection:
+            if connection.dialect.name == "postgresql":
+                return float(connection.execute(text(PG_LAG)).scalar())
+            connection.execute(text("SELECT 1"))
+            return 0.0
+
+    def check(self):
+        """
+        The check function measures every replica and updates its place in the rotation.
+
+        :return: None
+        """
+        for replica in self.replicas:
+            try:
+                replica.lag = self.measure_lag(replica.engine)
+            except Exception:
+                replica.lag = float("inf")
+            replica.healthy = replica.lag <= self.max_lag
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.interval)
+
+    def start(self):
+        """
+        The start function starts the background health checks once.
+
+        :return: None
+        """
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+            self._monitor.start()
+
+    def pin(self, user_id: int | None):
+        """
+        The pin function sends the reads of a user to the primary until replicas in rotation have the write.
+
+        :param user_id: int | None: User who wrote
+        :return: None
+        """
+        if user_id is None:
+            return
+        now = time.monotonic()
+        if len(self._pinned) >= self.size:
+            self._pinned = {user: until for user, until in self._pinned.items() if until > now}
+        self._pinned[user_id] = now + self.max_lag + 1
+        if self.store is not None:
+            try:
+                self.store.set(self._pin_key(user_id), 1, ex=math.ceil(self.max_lag + 1))
+            except RedisError:
+                pass
+
+    @staticmethod
+    def _pin_key(user_id: int) -> str:
+        return f"replica_pin:{user_id}"
+
+    def pinned(self, user_id: int | None) -> bool:
+        """
+        The pinned function tells whether the reads of a user go to the primary, after a write
+        handled by this worker or, with a store, by any worker.
+
+        :param user_id: int | None: User of the request
+        :return: True while the user is pinned
+        """
+        if user_id is None:
+            return False
+        if self._pinned.get(user_id, 0) > time.monotonic():
+            return True
+        if self.store is None:
+            return False
+        try:
+            return bool(self.store.exists(self._pin_key(user_id)))
+        except RedisError:
+            return False
+
+    def pick(self, user_id: int | None = None) -> Engine | None:
+        """
+        The pick function chooses the replica for a read.
+
+        :param user_id: int | None: User of the request
+        :return: A replica engine, None when the read must go to the primary
+        """
+        self.start()
+        if self.pinned(user_id):
+            return None
+        available = [replica for replica in self.replicas if replica.healthy]
+        if not available:
+            return None
+        if self.strategy == "least_lag":
+            return min(available, key=lambda replica: replica.lag).engine
+        return available[next(self._turn) % len(available)].engine
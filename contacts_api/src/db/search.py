@@ -0,0 +1,101 @@
+import re
+
+from sqlalchemy import text
+
+SEARCH_COLUMNS = ("first_name", "last_name", "email", "phone")
+
+PG_DOCUMENT = ("to_tsvector('simple', coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || "
+               "coalesce(email, '') || ' ' || coalesce(phone, ''))")
+
+PG_TEXT = "lower(first_name || ' ' || last_name || ' ' || email || ' ' || phone)"
+
+
+def setup_search(target, connection, **kw):
+    """
+    The setup_search function creates the full-text search structures after the tables are created.
+    On Postgres it creates a GIN index on the tsvector of the contact and a trigram index for substring matches.
+    On SQLite it creates an external content FTS5 table with triggers which keep it in sync with contacts,
+    the table is filled from the existing rows only when it is created for the first time.
+
+    :param target: MetaData: Metadata which was created
+    :param connection: Connection: Connection used by create_all
+    :return: None
+    """
+    dialect = connection.dialect.name
+
+    if dialect == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_contacts_search_tsv ON contacts USING gin ({PG_DOCUMENT})"))
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_contacts_search_trgm ON contacts "
+                                f"USING gin (({PG_TEXT}) gin_trgm_ops)"))
+
+    elif dialect == "sqlite":
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contacts_fts'")).first()
+        if exists:
+            return
+        columns = ", ".join(SEARCH_COLUMNS)
+        new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+        old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+        connection.execute(text(f"CREATE VIRTUAL TABLE contacts_fts USING fts5({columns}, contact_owner_id, "
+                                f"content='contacts', content_rowid='id', prefix='2 3')"))
+        connection.execute(text(f"CREATE TRIGGER contacts_fts_insert AFTER INSERT ON contacts BEGIN "
+                                f"INSERT INTO contacts_fts(rowid, {columns}, contact_owner_id) "
+                                f"VALUES (new.id, {new_values}, new.contact_owner_id); END"))
+        connection.execute(text(f"CREATE TRIGGER contacts_fts_delete AFTER DELETE ON contacts BEGIN "
+                                f"INSERT INTO contacts_fts(contacts_fts, rowid, {columns}, contact_owner_id) "
+                                f"VALUES ('delete', old.id, {old_values}, old.contact_owner_id); END"))
+        connection.execute(text(f"CREATE TRIGGER contacts_fts_update AFTER UPDATE ON contacts BEGIN "
+                                f"INSERT INTO contacts_fts(contacts_fts, rowid, {columns}, contact_owner_id) "
+                                f"VALUES ('delete', old.id, {old_values}, old.contact_owner_id); "
+                                f"INSERT INTO contacts_fts(rowid, {columns}, contact_owner_id) "
+                                f"VALUES (new.id, {new_values}, new.contact_owner_id); END"))
+        connection.execute(text("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')"))
+
+
+def drop_search(target, connection, **kw):
+    """
+    The drop_search function removes the SQLite FTS5 table before the tables are dropped,
+    so it is rebuilt together with its triggers by the next create_all.
+
+    :param target: MetaData: Metadata which will be dropped
+    :param connection: Connection: Connection used by drop_all
+    :return: None
+    """
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DROP TABLE IF EXISTS contacts_fts"))
+
+
+def search_terms(query: str) -> list[str]:
+    """
+    The search_terms function splits the user input into lowercase words.
+    Everything which is not a letter or a digit is dropped, so the terms are safe to put into
+    tsquery and FTS5 expressions.
+
+    :param query: str: Raw search string
+    :return: A list of terms
+    """
+    return re.findall(r"\w+", query.lower())
+
+
+def pg_prefix_query(terms: list[str]) -> str:
+    """
+    The pg_prefix_query function builds a tsquery where every term is matched as a prefix.
+
+    :param terms: list[str]: Search terms
+    :return: A tsquery string
+    """
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def fts5_prefix_query(user_id: int, terms: list[str]) -> str:
+    """
+    The fts5_prefix_query function builds an FTS5 query where every term is matched as a prefix
+    of one of the searched columns. The owner is part of the full-text query too,
+    so SQLite intersects the posting lists instead of filtering matches of all users.
+
+    :param user_id: int: Owner of the contacts
+    :param terms: list[str]: Search terms
+    :return: An FTS5 query string
+    """
+    phrases = " AND ".join(f'"{term}"*' for term in terms)
+    return f'contact_owner_id : "{int(user_id)}" AND {{{" ".join(SEARCH_COLUMNS)}}} : ({phrases})'
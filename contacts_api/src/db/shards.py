@@ -0,0 +1,159 @@
+import time
+from typing import NamedTuple
+
+from sqlalchemy import select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from src.conf.config import settings
+from src.db.db import engine, shard_engines
+from src.db.models import UserDirectory
+
+
+class DirectoryEntry(NamedTuple):
+    user_id: int
+    shard: int
+    moving: bool
+
+
+class UserMoving(Exception):
+    pass
+
+
+class ShardDirectory:
+    """
+    Directory of users keyed by email which tells the shard of every user. It lives in the
+    SQLALCHEMY_DATABASE_URL database and allocates the user ids, so they are unique over all shards.
+    Entries are cached in the process for ttl seconds, the resharding job waits that long
+    before it moves a user. Without SHARD_URLS there is one shard and the directory is not used.
+    """
+
+    def __init__(self, directory: Engine, shards: list[Engine], ttl: float, size: int = 10_000):
+        self.session = sessionmaker(bind=directory)
+        self.shards = shards
+        self.ttl = ttl
+        self.size = size
+        self._cache: dict[str, tuple[float, DirectoryEntry]] = {}
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.shards) > 1
+
+    def placement(self, user_id: int) -> int:
+        """
+        The placement function returns the shard a user belongs to with the current number of shards.
+
+        :param user_id: int: User id
+        :return: Shard number
+        """
+        return user_id % len(self.shards)
+
+    def lookup(self, email: str) -> DirectoryEntry | None:
+        """
+        The lookup function returns the directory entry of an email, from the cache while it is fresh.
+        Missing entries are not cached, so a new user is found right after signup.
+
+        :param email: str: User email
+        :return: The entry or None
+        """
+        cached = self._cache.get(email)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        with self.session() as db:
+            row = db.execute(select(UserDirectory.user_id, UserDirectory.shard, UserDirectory.moving)
+                             .where(UserDirectory.email == email)).first()
+        if row is None:
+            return None
+        entry = DirectoryEntry(*row)
+        if len(self._cache) >= self.size:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[email] = (time.monotonic() + self.ttl, entry)
+        return entry
+
+    def forget(self, email: str):
+        """
+        The forget function drops an email from the cache of this process.
+
+        :param email: str: User email
+        :return: None
+        """
+        self._cache.pop(email, None)
+
+    def use(self, db: Session, entry: DirectoryEntry):
+        """
+        The use function binds the session to the shard of the entry.
+
+        :param db: Session: Session of the request
+        :param entry: DirectoryEntry: Directory entry of the user
+        :return: None
+        :raises UserMoving: The user is being moved to another shard
+        """
+        if entry.moving:
+            raise UserMoving(f"User {entry.user_id} is being moved, try again later")
+        db.info["shard"] = entry.shard
+
+    def route(self, email: str, db: Session) -> DirectoryEntry | None:
+        """
+        The route function binds the session to the shard of the user with the email.
+
+        :param email: str: User email
+        :param db: Session: Session of the request
+        :return: The directory entry, None when the user is unknown or there is one shard
+        :raises UserMoving: The user is being moved to another shard
+        """
+        if not self.sharded:
+            return None
+        entry = self.lookup(email)
+        if entry is not None:
+            self.use(db, entry)
+        return entry
+
+    def register(self, email: str, db: Session) -> DirectoryEntry | None:
+        """
+        The register function allocates the id and the shard of a new user and binds the session to the shard.
+        An email which is already registered keeps its entry, so a signup which failed on the shard can be repeated.
+
+        :param email: str: User email
+        :param db: Session: Session of the request
+        :return: The directory entry, None when there is one shard
+        """
+        if not self.sharded:
+            return None
+        entry = self.lookup(email)
+        if entry is None:
+            with self.session() as directory:
+                row = UserDirectory(email=email, shard=0, moving=False)
+                directory.add(row)
+                directory.flush()
+                row.shard = self.placement(row.user_id)
+                entry = DirectoryEntry(row.user_id, row.shard, False)
+                directory.commit()
+        self.use(db, entry)
+        return entry
+
+    def set(self, user_id: int, **values):
+        """
+        The set function changes the shard or the moving flag of a user, used by the resharding job.
+
+        :param user_id: int: User id
+        :param values: New column values
+        :return: None
+        """
+        with self.session() as directory:
+            email = directory.execute(update(UserDirectory).where(UserDirectory.user_id == user_id)
+                                      .values(**values).returning(UserDirectory.email)).scalar()
+            directory.commit()
+        self.forget(email)
+
+    def entries(self) -> list[tuple[int, str, int]]:
+        """
+        The entries function returns the user id, email and shard of every user.
+
+        :return: A list of (user_id, email, shard)
+        """
+        with self.session() as directory:
+            return directory.execute(select(UserDirectory.user_id, UserDirectory.email, UserDirectory.shard)
+                                     .order_by(UserDirectory.user_id)).all()
+
+
+shard_directory = ShardDirectory(engine, shard_engines, settings.shard_directory_ttl)
@@ -0,0 +1,109 @@
+"""
+Fill the canonical phone, email and name key columns of contacts created before they existed,
+then make the per-user indexes of the canonical phone and email unique.
+
+Run from the project directory::
+
+    python -m src.jobs.backfill_canonical --batch-size 1000
+"""
+import argparse
+
+from sqlalchemy import func, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from src.db.db import DBSession, shard_engines
+from src.db.models import Contact
+from src.services.normalize_service import normalize_phone, normalize_email, name_key
+
+
+def backfill_canonical(db: Session, batch_size: int = 1000) -> int:
+    """
+    The backfill_canonical function walks the contacts without canonical values in primary key order
+    and updates them in batches, every batch is committed separately so the job can be stopped and restarted.
+
+    :param db: Session: Database session
+    :param batch_size: int: Number of contacts updated in one transaction
+    :return: The number of updated contacts
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        rows = db.execute(select(Contact.id, Contact.contact_owner_id, Contact.phone, Contact.email,
+                                 Contact.first_name, Contact.last_name)
+                          .where(Contact.id > last_id,
+                                 or_(Contact.phone_canonical.is_(None), Contact.email_canonical.is_(None),
+                                     Contact.name_key.is_(None)))
+                          .order_by(Contact.id)
+                          .limit(batch_size)).all()
+        if not rows:
+            return updated
+
+        db.execute(update(Contact), [{"id": row.id, "contact_owner_id": row.contact_owner_id,
+                                      "phone_canonical": normalize_phone(row.phone),
+                                      "email_canonical": normalize_email(row.email),
+                                      "name_key": name_key(row.first_name, row.last_name)} for row in rows])
+        db.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
+
+
+CANONICAL_INDEXES = ("ix_contacts_owner_email_canonical", "ix_contacts_owner_phone_canonical")
+
+
+def duplicate_canonical(db: Session) -> int:
+    """
+    The duplicate_canonical function counts the canonical phones and emails shared by contacts of one user.
+
+    :param db: Session: Database session
+    :return: The number of shared values
+    """
+    duplicates = 0
+    for column in (Contact.phone_canonical, Contact.email_canonical):
+        shared = (select(Contact.contact_owner_id).where(column.is_not(None))
+                  .group_by(Contact.contact_owner_id, column).having(func.count() > 1).subquery())
+        duplicates += db.execute(select(func.count()).select_from(shared)).scalar()
+    return duplicates
+
+
+def unique_canonical_indexes(db: Session) -> int:
+    """
+    The unique_canonical_indexes function replaces the indexes of the canonical phone and email
+    of databases created before they were unique. While a user still has contacts with the same
+    canonical phone or email nothing changes, merge them with the dedupe job and run it again.
+
+    :param db: Session: Database session
+    :return: The number of shared values, 0 when the indexes are unique
+    """
+    duplicates = duplicate_canonical(db)
+    if duplicates:
+        return duplicates
+    connection = db.connection()
+    existing = {index["name"]: index["unique"] for index in inspect(connection).get_indexes(Contact.__tablename__)}
+    for index in Contact.__table__.indexes:
+        if index.name in CANONICAL_INDEXES and not existing.get(index.name):
+            if index.name in existing:
+                index.drop(connection)
+            index.create(connection)
+    db.commit()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill canonical phone, email and name key columns of contacts")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    for shard in range(len(shard_engines)):
+        db = DBSession(info={"shard": shard})
+        try:
+            print(f"Shard {shard}: updated {backfill_canonical(db, args.batch_size)} contacts")
+            duplicates = unique_canonical_indexes(db)
+            if duplicates:
+                print(f"Shard {shard}: {duplicates} canonical phones and emails are shared by contacts of one user, "
+                      f"merge them with src.jobs.dedupe and run this job again")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Find, and optionally merge, duplicate contacts of every user.
+
+Run from the project directory::
+
+    python -m src.jobs.dedupe --threshold 0.6
+    python -m src.jobs.dedupe --user-id 1 --merge-above 0.95
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.db.db import DBSession, shard_engines
+from src.db.models import User
+from src.repository.contacts import find_duplicates, merge_contacts
+
+
+async def dedupe_user(user_id: int, db: Session, threshold: float, merge_above: float | None = None):
+    """
+    The dedupe_user function finds the duplicate groups of one user and merges the groups
+    scored at least merge_above into their oldest contact.
+
+    :param user_id: int: Owner of the contacts
+    :param db: Session: Database session
+    :param threshold: float: Minimal score of a duplicate pair
+    :param merge_above: float | None: Minimal score of an automatically merged group, None disables merging
+    :return: Number of found groups and number of merged groups
+    """
+    groups = await find_duplicates(user_id, db, threshold)
+    merged = 0
+    if merge_above is not None:
+        for ids, score in groups:
+            if score >= merge_above and await merge_contacts(user_id, ids[0], ids[1:], db):
+                merged += 1
+    return len(groups), merged
+
+
+async def dedupe(db: Session, threshold: float, merge_above: float | None = None, user_id: int | None = None):
+    """
+    The dedupe function runs dedupe_user for one or for all users.
+
+    :param db: Session: Database session
+    :param threshold: float: Minimal score of a duplicate pair
+    :param merge_above: float | None: Minimal score of an automatically merged group, None disables merging
+    :param user_id: int | None: Only this user, all users when None
+    :return: None
+    """
+    user_ids = [user_id] if user_id is not None else db.execute(select(User.id).order_by(User.id)).scalars().all()
+    for current_id in user_ids:
+        started = time.perf_counter()
+        groups, merged = await dedupe_user(current_id, db, threshold, merge_above)
+        print(f"user {current_id}: {groups} duplicate groups, {merged} merged "
+              f"in {time.perf_counter() - started:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and merge duplicate contacts")
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--merge-above", type=float, default=None)
+    parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+
+    for shard in range(len(shard_engines)):
+        db = DBSession(info={"shard": shard})
+        try:
+            asyncio.run(dedupe(db, args.threshold, args.merge_above, args.user_id))
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Move the existing contacts table of a Postgres database into a table hash partitioned by owner, online.
+
+The job runs in three steps which can also be started separately::
+
+    python -m src.jobs.partition_contacts prepare --partitions 32
+    python -m src.jobs.partition_contacts copy --batch-size 5000 --pause 0.05
+    python -m src.jobs.partition_contacts swap
+
+``prepare`` creates ``contacts_new`` with the partition-aware keys and indexes and a trigger which mirrors
+every write on ``contacts`` into it, ``copy`` copies the existing rows in short primary key batches and
+``swap`` renames the tables in one short transaction. Set CONTACTS_PARTITIONS to the same number before
+restarting the application. The old table is kept as ``contacts_old`` until it is dropped with --drop-old.
+"""
+import argparse
+import time
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from src.db.db import engine
+from src.db.models import Contact
+from src.db.partitioning import PARTITION_KEY, partitions_ddl
+from src.db.search import PG_DOCUMENT, PG_TEXT
+
+SOURCE = "contacts"
+TARGET = "contacts_new"
+SUFFIX = "_new"
+COLUMNS = [column.name for column in Contact.__table__.columns]
+
+
+def create_table_ddl(source: str, target: str, partitions: int) -> list[str]:
+    """
+    The create_table_ddl function returns the statements which create an empty copy of the source table.
+    The copy shares the id sequence of the source, its primary key and unique constraints contain the owner,
+    so they are allowed on a partitioned table. Index names end with _new until the swap.
+
+    :param source: str: Name of the existing table
+    :param target: str: Name of the new table
+    :param partitions: int: Number of hash partitions, 0 for a plain table
+    :return: A list of statements
+    """
+    partition_by = f" PARTITION BY HASH ({PARTITION_KEY})" if partitions else ""
+    statements = [
+        f"CREATE TABLE {target} (LIKE {source} INCLUDING DEFAULTS, "
+        f"CONSTRAINT {source}_pkey{SUFFIX} PRIMARY KEY (id, {PARTITION_KEY}), "
+        f"CONSTRAINT uq_contacts_owner_email{SUFFIX} UNIQUE ({PARTITION_KEY}, email), "
+        f"CONSTRAINT uq_contacts_owner_phone{SUFFIX} UNIQUE ({PARTITION_KEY}, phone), "
+        f"CONSTRAINT {source}_{PARTITION_KEY}_fkey FOREIGN KEY ({PARTITION_KEY}) REFERENCES users (id))"
+        f"{partition_by}",
+    ]
+    statements += partitions_ddl(target, partitions) if partitions else []
+    for index in Contact.__table__.indexes:
+        columns = ", ".join(column.name for column in index.columns)
+        statements.append(f"CREATE INDEX {index.name}{SUFFIX} ON {target} ({columns})")
+    statements.append(f"CREATE INDEX ix_contacts_search_tsv{SUFFIX} ON {target} USING gin ({PG_DOCUMENT})")
+    statements.append(f"CREATE INDEX ix_contacts_search_trgm{SUFFIX} ON {target} USING gin (({PG_TEXT}) gin_trgm_ops)")
+    return statements
+
+
+def mirror_trigger_ddl(source: str, target: str) -> list[str]:
+    """
+    The mirror_trigger_ddl function returns the statements which install a trigger repeating every insert,
+    update and delete of the source table on the target table. An update is mirrored as delete and insert,
+    so a changed owner moves the row into the right partition.
+
+    :param source: str: Name of the existing table
+    :param target: str: Name of the new table
+    :return: A list of statements
+    """
+    columns = ", ".join(COLUMNS)
+    values = ", ".join(f"NEW.{column}" for column in COLUMNS)
+    return [
+        f"CREATE OR REPLACE FUNCTION {source}_mirror() RETURNS trigger AS $$ BEGIN "
+        f"IF TG_OP IN ('UPDATE', 'DELETE') THEN "
+        f"DELETE FROM {target} WHERE id = OLD.id AND {PARTITION_KEY} = OLD.{PARTITION_KEY}; END IF; "
+        f"IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+        f"INSERT INTO {target} ({columns}) VALUES ({values}) ON CONFLICT DO NOTHING; END IF; "
+        f"RETURN NULL; END $$ LANGUAGE plpgsql",
+        f"CREATE TRIGGER {source}_mirror AFTER INSERT OR UPDATE OR DELETE ON {source} "
+        f"FOR EACH ROW EXECUTE FUNCTION {source}_mirror()",
+    ]
+
+
+def copy_batch_sql(source: str, target: str) -> str:
+    """
+    The copy_batch_sql function returns the statement which copies one id range of the source table.
+    The rows are locked FOR SHARE while they are copied, so a concurrent delete waits and its mirrored delete
+    sees the copy, and rows which the trigger already mirrored are skipped.
+
+    :param source: str: Name of the existing table
+    :param target: str: Name of the new table
+    :return: Statement with the :low and :high bind parameters
+    """
+    columns = ", ".join(COLUMNS)
+    return (f"WITH batch AS (SELECT {columns} FROM {source} WHERE id > :low AND id <= :high FOR SHARE) "
+            f"INSERT INTO {target} ({columns}) SELECT {columns} FROM batch ON CONFLICT DO NOTHING")
+
+
+def swap_ddl(source: str, target: str, partitions: int, sequence: str) -> list[str]:
+    """
+    The swap_ddl function returns the statements which replace the source table by the target table.
+    The old table and its indexes get the _old suffix, the _new suffix is removed from the new ones
+    and the id sequence is moved to the new table, so dropping the old table keeps it.
+
+    :param source: str: Name of the existing table
+    :param target: str: Name of the new table
+    :param partitions: int: Number of hash partitions of the target table
+    :param sequence: str: Name of the id sequence
+    :return: A list of statements
+    """
+    statements = [
+        f"DROP TRIGGER {source}_mirror ON {source}",
+        f"DROP FUNCTION {source}_mirror()",
+        f"ALTER TABLE {source} RENAME TO {source}_old",
+        f"DO $$ DECLARE r record; BEGIN "
+        f"FOR r IN SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() "
+        f"AND tablename = '{source}_old' LOOP "
+        f"EXECUTE format('ALTER INDEX %I RENAME TO %I', r.indexname, left(r.indexname, 59) || '_old'); END LOOP; "
+        f"FOR r IN SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() "
+        f"AND tablename = '{target}' AND right(indexname, {len(SUFFIX)}) = '{SUFFIX}' LOOP "
+        f"EXECUTE format('ALTER INDEX %I RENAME TO %I', r.indexname, "
+        f"left(r.indexname, length(r.indexname) - {len(SUFFIX)})); END LOOP; END $$",
+        f"ALTER TABLE {target} RENAME TO {source}",
+    ]
+    statements += [f"ALTER TABLE {target}_p{remainder} RENAME TO {source}_p{remainder}"
+                   for remainder in range(partitions)]
+    statements.append(f"ALTER SEQUENCE {sequence} OWNED BY {source}.id")
+    return statements
+
+
+def prepare(connection: Connection, partitions: int):
+    """
+    The prepare function creates the new table and starts mirroring the writes into it.
+
+    :param connection: Connection: Connection inside a transaction
+    :param partitions: int: Number of hash partitions
+    :return: None
+    """
+    for statement in create_table_ddl(SOURCE, TARGET, partitions) + mirror_trigger_ddl(SOURCE, TARGET):
+        connection.execute(text(statement))
+
+
+def copy(db_engine: Engine, batch_size: int, pause: float) -> int:
+    """
+    The copy function copies the rows which existed before the trigger, every batch in its own transaction.
+    Rows created later are mirrored by the trigger, so the upper bound is read once.
+
+    :param db_engine: Engine: Database engine
+    :param batch_size: int: Width of the copied id range
+    :param pause: float: Seconds to sleep between batches to leave room for the application
+    :return: The number of copied rows
+    """
+    with db_engine.connect() as connection:
+        high = connection.execute(text(f"SELECT coalesce(max(id), 0) FROM {SOURCE}")).scalar()
+    statement = text(copy_batch_sql(SOURCE, TARGET))
+    copied = 0
+    started = time.perf_counter()
+    for low in range(0, high, batch_size):
+        with db_engine.begin() as connection:
+            copied += connection.execute(statement, {"low": low, "high": low + batch_size}).rowcount
+        print(f"copied ids up to {min(low + batch_size, high)} of {high}, "
+              f"{copied} rows in {time.perf_counter() - started:.1f}s")
+        time.sleep(pause)
+    return copied
+
+
+def swap(connection: Connection, partitions: int, drop_old: bool = False):
+    """
+    The swap function checks that the copy is complete and replaces the table. Both tables are counted
+    in one statement, so they are compared in one snapshot, and the trigger keeps them equal afterwards,
+    so the writes are blocked for the renames only.
+
+    :param connection: Connection: Connection inside a transaction
+    :param partitions: int: Number of hash partitions of the new table
+    :param drop_old: bool: Drop the old table after the swap
+    :return: None
+    """
+    source_rows, target_rows = connection.execute(text(f"SELECT (SELECT count(*) FROM {SOURCE}), "
+                                                       f"(SELECT count(*) FROM {TARGET})")).one()
+    if source_rows != target_rows:
+        raise RuntimeError(f"{SOURCE} has {source_rows} rows but {TARGET} has {target_rows}, run copy again")
+    sequence = connection.execute(text(f"SELECT pg_get_serial_sequence('{SOURCE}', 'id')")).scalar()
+    connection.execute(text(f"LOCK TABLE {SOURCE} IN ACCESS EXCLUSIVE MODE"))
+    for statement in swap_ddl(SOURCE, TARGET, partitions, sequence):
+        connection.execute(text(statement))
+    if drop_old:
+        connection.execute(text(f"DROP TABLE {SOURCE}_old"))
+
+
+def target_partitions(connection: Connection) -> int:
+    """
+    The target_partitions function returns the number of partitions of the new table.
+
+    :param connection: Connection: Database connection
+    :return: Number of partitions
+    """
+    return connection.execute(text("SELECT count(*) FROM pg_inherits WHERE inhparent = CAST(:table AS regclass)"),
+                              {"table": TARGET}).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hash partition the contacts table by owner")
+    parser.add_argument("step", choices=["prepare", "copy", "swap", "all"])
+    parser.add_argument("--partitions", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--pause", type=float, default=0.0)
+    parser.add_argument("--drop-old", action="store_true")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        parser.error("partitioning needs a Postgres database")
+    engine.echo = False
+    if args.step in ("prepare", "all"):
+        with engine.begin() as connection:
+            prepare(connection, args.partitions)
+    if args.step in ("copy", "all"):
+        print(f"Copied {copy(engine, args.batch_size, args.pause)} contacts")
+    if args.step in ("swap", "all"):
+        with engine.begin() as connection:
+            swap(connection, target_partitions(connection), args.drop_old)
+        print("Swapped, set CONTACTS_PARTITIONS before restarting the application")
+
+
+if __name__ == "__main__":
+    main()
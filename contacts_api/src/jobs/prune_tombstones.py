@@ -0,0 +1,49 @@
+"""
+Remove the tombstones of contacts deleted longer than TOMBSTONE_RETENTION_DAYS ago.
+Clients with an older changes cursor get 410 Gone and sync again from 0.
+
+Run periodically, e.g. from cron or with --interval::
+
+    python -m src.jobs.prune_tombstones
+    python -m src.jobs.prune_tombstones --days 7 --interval 86400
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+
+from src.conf.config import settings
+from src.db.db import DBSession, shard_engines
+from src.repository.contacts import prune_tombstones
+
+
+async def run(days: int, interval: int | None):
+    """
+    The run function prunes the tombstones of every shard once, or forever every interval seconds.
+
+    :param days: int: Retention of the tombstones in days
+    :param interval: int | None: Pause between two runs in seconds
+    :return: None
+    """
+    while True:
+        for shard in range(len(shard_engines)):
+            db = DBSession(info={"shard": shard})
+            try:
+                pruned = await prune_tombstones(timedelta(days=days), db)
+                print(f"Shard {shard}: removed {pruned} tombstones")
+            finally:
+                db.close()
+        if not interval:
+            return
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove old contact tombstones")
+    parser.add_argument("--days", type=int, default=settings.tombstone_retention_days)
+    parser.add_argument("--interval", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(run(args.days, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Recompute the contact counters of every user from the contacts table.
+
+Run once after deploying the counters and then periodically, e.g. from cron or with --interval::
+
+    python -m src.jobs.reconcile_stats
+    python -m src.jobs.reconcile_stats --interval 3600
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.db.db import DBSession, shard_engines
+from src.db.models import User
+from src.repository.stats import reconcile_stats
+
+
+async def reconcile_all(db: Session) -> int:
+    """
+    The reconcile_all function reconciles the counters user by user, each user in its own transaction.
+
+    :param db: Session: Database session
+    :return: The number of reconciled users
+    """
+    user_ids = db.execute(select(User.id).order_by(User.id)).scalars().all()
+    for user_id in user_ids:
+        await reconcile_stats(user_id, db)
+        db.commit()
+    return len(user_ids)
+
+
+async def run(interval: int | None):
+    """
+    The run function reconciles all users of every shard once, or forever every interval seconds.
+
+    :param interval: int | None: Pause between two runs in seconds
+    :return: None
+    """
+    while True:
+        for shard in range(len(shard_engines)):
+            db = DBSession(info={"shard": shard})
+            try:
+                print(f"Shard {shard}: reconciled counters of {await reconcile_all(db)} users")
+            finally:
+                db.close()
+        if not interval:
+            return
+        await asyncio.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile contact counters")
+    parser.add_argument("--interval", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(run(args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Move users between shards after SHARD_URLS changed, or move one user by hand.
+
+Run from the project directory::
+
+    python -m src.jobs.reshard
+    python -m src.jobs.reshard --user-id 42 --to-shard 3
+
+Every moved user is marked as moving in the shard directory first, requests of the user get 503 until
+the move is done. The job waits until no process uses a cached entry of the user any more, copies the user,
+contacts, tombstones and counters to the new shard, switches the directory entry and deletes the old rows.
+Contacts get new ids on the new shard, tombstones of the old ids let synced clients catch up with one delta.
+"""
+import argparse
+import time
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from src.db.db import DBSession
+from src.db.models import Contact, ContactCounter, ContactTombstone, User
+from src.db.shards import shard_directory
+
+OWNED = ((ContactCounter, ContactCounter.contact_owner_id), (ContactTombstone, ContactTombstone.contact_owner_id),
+         (Contact, Contact.contact_owner_id))
+
+
+def delete_user(user_id: int, db: Session):
+    """
+    The delete_user function removes a user and everything the user owns from one shard.
+
+    :param user_id: int: User id
+    :param db: Session: Session bound to the shard
+    :return: None
+    """
+    for model, owner in OWNED:
+        db.execute(delete(model).where(owner == user_id))
+    db.execute(delete(User).where(User.id == user_id))
+
+
+def copy_user(user_id: int, source: Session, target: Session) -> int:
+    """
+    The copy_user function copies a user with the contacts, tombstones and counters to another shard.
+    Leftovers of an interrupted copy are removed from the target first. The contacts version is bumped,
+    the copied contacts carry the new version and every old contact id gets a tombstone with it.
+
+    :param user_id: int: User id
+    :param source: Session: Session bound to the current shard of the user
+    :param target: Session: Session bound to the new shard
+    :return: The number of copied contacts
+    """
+    user = dict(source.execute(select(User.__table__).where(User.id == user_id)).mappings().one())
+    version = user["contacts_version"] + 1
+    user["contacts_version"] = version
+    contacts = [dict(row) for row in source.execute(select(Contact.__table__)
+                                                    .where(Contact.contact_owner_id == user_id)).mappings()]
+    tombstones = [dict(row) for row in source.execute(select(ContactTombstone.__table__)
+                                                      .where(ContactTombstone.contact_owner_id == user_id)).mappings()]
+    counters = [dict(row) for row in source.execute(select(ContactCounter.__table__)
+                                                    .where(ContactCounter.contact_owner_id == user_id)).mappings()]
+
+    delete_user(user_id, target)
+    target.execute(insert(User), [user])
+    for contact in contacts:
+        tombstones.append({"contact_id": contact.pop("id"), "contact_owner_id": user_id, "change_seq": version})
+        contact["change_seq"] = version
+    for tombstone in tombstones:
+        tombstone.pop("id", None)
+    for model, rows in ((Contact, contacts), (ContactTombstone, tombstones), (ContactCounter, counters)):
+        if rows:
+            target.execute(insert(model.__table__), rows)
+    return len(contacts)
+
+
+def move_user(user_id: int, source_shard: int, target_shard: int, drain: float) -> int:
+    """
+    The move_user function moves one user to another shard while the user is blocked in the directory.
+
+    :param user_id: int: User id
+    :param source_shard: int: Current shard of the user
+    :param target_shard: int: New shard of the user
+    :param drain: float: Seconds to wait until requests routed with older directory entries are finished
+    :return: The number of moved contacts
+    """
+    shard_directory.set(user_id, moving=True)
+    time.sleep(drain)
+    source, target = DBSession(info={"shard": source_shard}), DBSession(info={"shard": target_shard})
+    try:
+        moved = copy_user(user_id, source, target)
+        target.commit()
+    except Exception:
+        target.rollback()
+        shard_directory.set(user_id, moving=False)
+        raise
+    finally:
+        target.close()
+    shard_directory.set(user_id, shard=target_shard, moving=False)
+    try:
+        delete_user(user_id, source)
+        source.commit()
+    finally:
+        source.close()
+    return moved
+
+
+def reshard(drain: float, user_id: int | None = None, to_shard: int | None = None):
+    """
+    The reshard function moves every user whose shard differs from the placement of the current shard count,
+    or only the given user to the given shard.
+
+    :param drain: float: Seconds to wait before a user is copied
+    :param user_id: int | None: Only this user
+    :param to_shard: int | None: Shard of the user given by user_id, its placement when None
+    :return: None
+    """
+    for current_id, email, shard in shard_directory.entries():
+        if user_id is not None and current_id != user_id:
+            continue
+        target = to_shard if to_shard is not None else shard_directory.placement(current_id)
+        if target == shard:
+            continue
+        started = time.perf_counter()
+        moved = move_user(current_id, shard, target, drain)
+        print(f"user {current_id}: moved {moved} contacts from shard {shard} to {target} "
+              f"in {time.perf_counter() - started:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move users between shards")
+    parser.add_argument("--user-id", type=int, default=None)
+    parser.add_argument("--to-shard", type=int, default=None)
+    parser.add_argument("--drain", type=float, default=shard_directory.ttl + 5)
+    args = parser.parse_args()
+
+    if not shard_directory.sharded:
+        parser.error("set SHARD_URLS to more than one database")
+    if args.to_shard is not None and args.user_id is None:
+        parser.error("--to-shard needs --user-id")
+    reshard(args.drain, args.user_id, args.to_shard)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,135 @@
+from datetime import timedelta
+
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, delete, select, update, text, or_, func
 
-from src.db.models import Contact
+from src.db.models import Contact, ContactTombstone, User
+from src.conf.config import settings
+from src.db.search import PG_DOCUMENT, PG_TEXT, search_terms, pg_prefix_query, fts5_prefix_query
 from src.schemas.contacts_schema import ContactModel
+from src.services.events_service import contact_events
+from src.services.normalize_service import normalize_phone, normalize_email
+from src.services.dedupe_service import Candidate, group_duplicates
+from src.repository.stats import TOTAL, ContactsQuotaExceeded, contact_counters, reserve_contact, update_counters
+
+
+class ContactChanged(Exception):
+    pass
+
+
+CONTACT_FIELDS = ("id", "first_name", "last_name", "birthday", "email", "phone", "favorite", "created_at", "updated_at")
+
+
+def _bump_contacts_version(user_id: int, db: Session, count: int = 1):
+    """
+    Increment the contact-set version of the owner in the current transaction.
+    The version is the owner's monotonic change sequence, every changed contact
+    or tombstone is stamped with it.
+
+    :param user_id: Owner of the changed contacts
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :param count: Number of changes, each of them gets its own sequence number
+    :type count: int
+    :return: New version of the contact set, the last of the reserved sequence numbers
+    :rtype: int
+    """
+    return db.execute(update(User).where(User.id == user_id)
+                      .values(contacts_version=User.contacts_version + count)
+                      .returning(User.contacts_version)).scalar()
+
+
+async def get_contacts_version(user_id: int, db: Session):
+    """
+    Return the contact-set version of the user without loading any contact.
+
+    :param user_id: For wich user id get the version
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :return: Version of the contact set, changes on every create, update or delete
+    :rtype: int | None
+    """
+    return db.execute(select(User.contacts_version).where(User.id == user_id)).scalar()
+
+
+async def get_changes_window(user_id: int, db: Session):
+    """
+    Return the oldest cursor the changes can still be read from and the contact-set version of the user.
+
+    :param user_id: For wich user id get the window
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :return: Tombstone horizon and contacts version or None if user not found
+    :rtype: (int, int) | None
+    """
+    return db.execute(select(User.tombstone_horizon, User.contacts_version).where(User.id == user_id)).first()
+
+
+async def get_contact_version(contact_id: int, user_id: int, db: Session):
+    """
+    Return only the version of a contact, the change sequence of its last write.
+
+    :param contact_id: Contact id for searching
+    :type contact_id: int
+    :param user_id: For wich user id get the contact
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :return: change_seq of the contact or None if contact not found
+    :rtype: int | None
+    """
+    return db.execute(select(Contact.change_seq).where(Contact.id == contact_id,
+                                                        Contact.contact_owner_id == user_id)).scalar()
+
 
+def _reload_contacts(contact_ids: list[int], user_id: int, db: Session):
+    """
+    Read the contacts again after the user row is locked, loaded objects get the current values,
+    so a concurrent write which committed meanwhile is not overwritten with a stale counter delta.
+
+    :param contact_ids: Contact ids
+    :type contact_ids: list[int]
+    :param user_id: Owner of the contacts
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :return: The contacts which still exist
+    :rtype: [Contact]
+    """
+    return db.execute(select(Contact).where(Contact.id.in_(contact_ids), Contact.contact_owner_id == user_id)
+                      .execution_options(populate_existing=True)).scalars().all()
 
 
+def _claim_contact(contact: Contact, user_id: int, version: int, change_seq: int, db: Session):
+    """
+    Stamp the contact with the new change sequence only if it is still at the expected version,
+    in one conditional update, and reload it. Without a match the transaction is rolled back.
+
+    :param contact: The loaded contact
+    :type contact: Contact
+    :param user_id: Owner of the contact
+    :type user_id: int
+    :param version: Version the client has seen
+    :type version: int
+    :param change_seq: Change sequence of the write
+    :type change_seq: int
+    :param db: database session
+    :type db: Session
+    :return: None
+    :raises ContactChanged: The contact was changed by another request
+    """
+    claimed = db.execute(update(Contact).where(Contact.id == contact.id, Contact.contact_owner_id == user_id,
+                                               Contact.change_seq == version)
+                         .values(change_seq=change_seq)
+                         .execution_options(synchronize_session=False)).rowcount
+    if not claimed:
+        db.rollback()
+        raise ContactChanged(f"Contact with id {contact.id} was changed by another request")
+    db.refresh(contact)
+
 
 async def get_contacts(user_id: int, db: Session):
     """
@@ -21,6 +145,101 @@ async def get_contacts(user_id: int, db: Session):
     contacts = db.query(Contact).filter(Contact.contact_owner_id == user_id).all()
     return contacts
 
+
+def contact_fields(fields: str | None) -> tuple[str, ...]:
+    """
+    Parse a comma separated field list of the contact response.
+
+    :param fields: Comma separated field names, all fields when empty
+    :type fields: str | None
+    :return: Field names in the order of the response model
+    :rtype: tuple[str, ...]
+    :raises ValueError: Unknown field name
+    """
+    if not fields:
+        return CONTACT_FIELDS
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(CONTACT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in CONTACT_FIELDS if field in requested)
+
+
+async def get_contact_rows(user_id: int, db: Session, fields: tuple[str, ...] = CONTACT_FIELDS):
+    """
+    Return the contacts of the user as read-only rows of the chosen columns.
+    The rows are plain named tuples from a Core select, no ORM instance, identity map entry
+    or relationship is created for them, so they are much cheaper for lists that are only serialized.
+
+    :param user_id: For wich user id get all contacts
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :param fields: Names of the selected columns
+    :type fields: tuple[str, ...]
+    :return: Rows with the fields as attributes, ordered by id
+    :rtype: [Row] | []
+    """
+    columns = [Contact.__table__.c[field] for field in fields]
+    return db.execute(select(*columns).where(Contact.contact_owner_id == user_id).order_by(Contact.id)).all()
+
+
+async def get_contacts_by_phone(user_id: int, phone: str, db: Session):
+    """
+    Return contacts with the phone number, formatting differences are ignored.
+
+    :param user_id: For wich user id search contacts
+    :type user_id: int
+    :param phone: Phone number in any format
+    :type phone: str
+    :param db: database session
+    :type db: Session
+    :return: Contacts with the same canonical phone number, none for a phone without digits
+    :rtype: [Contact] | []
+    """
+    canonical = normalize_phone(phone)
+    if canonical is None:
+        return []
+    return db.query(Contact).filter(Contact.contact_owner_id == user_id,
+                                    Contact.phone_canonical == canonical).all()
+
+
+async def get_contacts_by_email(user_id: int, email: str, db: Session):
+    """
+    Return contacts with the email, the case is ignored.
+
+    :param user_id: For wich user id search contacts
+    :type user_id: int
+    :param email: Email in any case
+    :type email: str
+    :param db: database session
+    :type db: Session
+    :return: Contacts with the same canonical email, none for a blank email
+    :rtype: [Contact] | []
+    """
+    canonical = normalize_email(email)
+    if canonical is None:
+        return []
+    return db.query(Contact).filter(Contact.contact_owner_id == user_id,
+                                    Contact.email_canonical == canonical).all()
+
+
+async def get_contacts_by_ids(contact_ids: list[int], user_id: int, db: Session):
+    """
+    Return contacts with the given ids.
+
+    :param contact_ids: Contact ids for searching
+    :type contact_ids: list[int]
+    :param user_id: For wich user id get contacts
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :return: Found contacts
+    :rtype: [Contact] | []
+    """
+    return db.query(Contact).filter(Contact.contact_owner_id == user_id, Contact.id.in_(contact_ids)).all()
+
+
 async def create_contact(user_id: int, body: ContactModel, db: Session):
     """
     Create Contact to database.
@@ -33,12 +252,27 @@ async def create_contact(user_id: int, body: ContactModel, db: Session):
     :type db: Session
     :return: Created Contact
     :rtype: 201 | None
+    :raises ContactsQuotaExceeded: The user already has the maximum number of contacts
     """
     contact = Contact(**body.dict())
     contact.contact_owner_id = user_id
+    change_seq = _bump_contacts_version(user_id, db)
+    contact.change_seq = change_seq
+
+    counters = contact_counters(contact.favorite, contact.birthday)
+    if settings.contacts_quota:
+        try:
+            await reserve_contact(user_id, settings.contacts_quota, db)
+        except ContactsQuotaExceeded:
+            db.rollback()
+            raise
+        del counters[TOTAL]
+    await update_counters(user_id, counters, db)
+
     db.add(contact)
     db.commit()
     db.refresh(contact)
+    await contact_events.publish(user_id, "created", contact.id, change_seq)
     return contact
 
 async def get_contact_by_id(contact_id: int, user_id: int, db: Session):
@@ -58,7 +292,7 @@ async def get_contact_by_id(contact_id: int, user_id: int, db: Session):
     return contact
 
 
-async def update_contact(contact_id: int, user_id: int, body: ContactModel, db: Session):
+async def update_contact(contact_id: int, user_id: int, body: ContactModel, db: Session, version: int | None = None):
     """
     Update contact in database.
     
@@ -70,22 +304,37 @@ async def update_contact(contact_id: int, user_id: int, body: ContactModel, db:
     :type body: ContactModel
     :param db: database session
     :type db: Session
+    :param version: Update only if the contact is still at this version
+    :type version: int | None
     :return: Updated Contact
     :rtype: Contact
+    :raises ContactChanged: The contact is no longer at version
     """
     contact = await get_contact_by_id(contact_id, user_id, db)
     if contact:
+        # the version bump locks the user row first, in the same order as every other contact write
+        change_seq = _bump_contacts_version(user_id, db)
+        if not _reload_contacts([contact_id], user_id, db):
+            db.rollback()
+            return None
+        if version is not None:
+            _claim_contact(contact, user_id, version, change_seq, db)
+        counters = contact_counters(body.favorite, body.birthday)
+        counters.subtract(contact_counters(contact.favorite, contact.birthday))
+        await update_counters(user_id, counters, db)
         contact.first_name = body.first_name
         contact.last_name = body.last_name
         contact.birthday = body.birthday
         contact.email = body.email
         contact.phone = body.phone
         contact.favorite = body.favorite
+        contact.change_seq = change_seq
         db.commit()
+        await contact_events.publish(user_id, "updated", contact_id, change_seq)
     return contact
 
 
-async def remove_contact(contact_id:int, user_id: int, db: Session):  
+async def remove_contact(contact_id:int, user_id: int, db: Session, version: int | None = None):
     """
     Remove contact from database.
     
@@ -95,11 +344,230 @@ async def remove_contact(contact_id:int, user_id: int, db: Session):
     :type user_id: int
     :param db: database session
     :type db: Session
+    :param version: Remove only if the contact is still at this version
+    :type version: int | None
     :return: Status code 204 - No content
     :rtype: None
+    :raises ContactChanged: The contact is no longer at version
     """
     contact = await get_contact_by_id(contact_id, user_id, db)
     if contact:
+        change_seq = _bump_contacts_version(user_id, db)
+        if not _reload_contacts([contact_id], user_id, db):
+            db.rollback()
+            return None
+        if version is not None:
+            _claim_contact(contact, user_id, version, change_seq, db)
+        await update_counters(user_id, contact_counters(contact.favorite, contact.birthday, sign=-1), db)
+        db.add(ContactTombstone(contact_id=contact.id, contact_owner_id=user_id, change_seq=change_seq))
         db.delete(contact)
         db.commit()
+        await contact_events.publish(user_id, "deleted", contact_id, change_seq)
+    return contact
+
+
+async def get_changes(user_id: int, since: int, limit: int, db: Session):
+    """
+    Return contacts created, updated or deleted after the cursor.
+    Both contacts and tombstones are read through the (owner, change_seq) indexes,
+    so the cost depends on the number of changes, not on the size of the address book.
+
+    :param user_id: For wich user id get the changes
+    :type user_id: int
+    :param since: Cursor returned by the previous call, 0 for the first sync
+    :type since: int
+    :param limit: Maximum number of changes in one page
+    :type limit: int
+    :param db: database session
+    :type db: Session
+    :return: Changed contacts, ids of deleted contacts, next cursor and if there are more changes
+    :rtype: (list[Contact], list[int], int, bool)
+    """
+    contacts = db.execute(select(Contact)
+                          .where(Contact.contact_owner_id == user_id, Contact.change_seq > since)
+                          .order_by(Contact.change_seq)
+                          .limit(limit + 1)).scalars().all()
+    tombstones = db.execute(select(ContactTombstone.change_seq, ContactTombstone.contact_id)
+                            .where(ContactTombstone.contact_owner_id == user_id, ContactTombstone.change_seq > since)
+                            .order_by(ContactTombstone.change_seq)
+                            .limit(limit + 1)).all()
+
+    changes = sorted([(contact.change_seq, contact, None) for contact in contacts] +
+                     [(change_seq, None, contact_id) for change_seq, contact_id in tombstones],
+                     key=lambda change: change[0])
+    page = changes[:limit]
+    cursor = page[-1][0] if page else since
+    changed = [contact for _, contact, _ in page if contact is not None]
+    deleted = [contact_id for _, _, contact_id in page if contact_id is not None]
+    return changed, deleted, cursor, len(changes) > limit
+
+
+async def prune_tombstones(retention: timedelta, db: Session):
+    """
+    Remove the tombstones of contacts deleted longer than retention ago, user by user.
+    The age is measured with the clock of the database, which set deleted_at.
+    The change sequence of the newest removed tombstone becomes the tombstone horizon of the user,
+    a cursor older than it may miss deletions and needs a full sync.
+
+    :param retention: How long tombstones are kept
+    :type retention: timedelta
+    :param db: database session
+    :type db: Session
+    :return: The number of removed tombstones
+    :rtype: int
+    """
+    before = db.execute(select(func.now())).scalar() - retention
+    horizons = db.execute(select(ContactTombstone.contact_owner_id, func.max(ContactTombstone.change_seq))
+                          .where(ContactTombstone.deleted_at < before)
+                          .group_by(ContactTombstone.contact_owner_id)).all()
+    pruned = 0
+    for user_id, horizon in horizons:
+        # the user row first, in the same lock order as the contact writes
+        db.execute(update(User).where(User.id == user_id, User.tombstone_horizon < horizon)
+                   .values(tombstone_horizon=horizon))
+        pruned += db.execute(delete(ContactTombstone).where(ContactTombstone.contact_owner_id == user_id,
+                                                            ContactTombstone.change_seq <= horizon)).rowcount
+        db.commit()
+    return pruned
+
+
+async def search_contacts(user_id: int, query: str, limit: int, db: Session):
+    """
+    Search contacts by prefixes of first name, last name, email and phone.
+    On Postgres the tsvector and trigram indexes are used, on SQLite the FTS5 table,
+    other databases fall back to LIKE prefix matching without ranking.
+
+    :param user_id: For wich user id search contacts
+    :type user_id: int
+    :param query: Words typed by the user, every word must match as a prefix
+    :type query: str
+    :param limit: Maximum number of results
+    :type limit: int
+    :param db: database session
+    :type db: Session
+    :return: Matching contacts, the best match first
+    :rtype: [Contact] | []
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = text(f"SELECT contacts.* FROM contacts "
+                         f"WHERE contact_owner_id = :user_id "
+                         f"AND ({PG_DOCUMENT} @@ to_tsquery('simple', :tsquery) OR {PG_TEXT} LIKE :like) "
+                         f"ORDER BY ts_rank({PG_DOCUMENT}, to_tsquery('simple', :tsquery)) DESC, "
+                         f"similarity({PG_TEXT}, :raw) DESC "
+                         f"LIMIT :limit")
+        params = {"user_id": user_id, "tsquery": pg_prefix_query(terms), "like": f"%{' '.join(terms)}%",
+                  "raw": " ".join(terms), "limit": limit}
+    elif dialect == "sqlite":
+        statement = text("SELECT contacts.* FROM contacts_fts JOIN contacts ON contacts.id = contacts_fts.rowid "
+                         "WHERE contacts_fts MATCH :match "
+                         "ORDER BY bm25(contacts_fts) "
+                         "LIMIT :limit")
+        params = {"match": fts5_prefix_query(user_id, terms), "limit": limit}
+    else:
+        conditions = [or_(*[func.lower(getattr(Contact, column)).like(f"{term}%")
+                            for column in ("first_name", "last_name", "email", "phone")]) for term in terms]
+        return db.execute(select(Contact).where(Contact.contact_owner_id == user_id, *conditions)
+                          .order_by(Contact.last_name, Contact.first_name).limit(limit)).scalars().all()
+
+    return db.execute(select(Contact).from_statement(statement), params).scalars().all()
+
+
+def _email_local_part(db: Session):
+    """
+    Return the SQL expression of the local part of the canonical email for the database dialect.
+
+    :param db: database session
+    :type db: Session
+    :return: SQL expression
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return func.split_part(Contact.email_canonical, "@", 1)
+    return func.substr(Contact.email_canonical, 1, func.instr(Contact.email_canonical, "@") - 1)
+
+
+async def find_duplicates(user_id: int, db: Session, threshold: float = 0.6, max_block: int = 50):
+    """
+    Find groups of contacts which are likely the same person.
+    Contacts are blocked by canonical phone, email local part and phonetic name key,
+    every block is read from the database sorted by its key and compared pairwise,
+    so only one block is kept in memory and the work grows linearly with the address book.
+
+    :param user_id: For wich user id search duplicates
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :param threshold: Minimal score of a duplicate pair
+    :type threshold: float
+    :param max_block: Maximal number of contacts compared inside one block
+    :type max_block: int
+    :return: Groups of contact ids with the best pair score
+    :rtype: [([int], float)]
+    """
+    columns = (Contact.id, Contact.first_name, Contact.last_name, Contact.email_canonical,
+               Contact.phone_canonical, Contact.birthday)
+
+    def stream(key):
+        rows = db.execute(select(key, *columns)
+                          .where(Contact.contact_owner_id == user_id, key.is_not(None), key != "")
+                          .order_by(key)
+                          .execution_options(yield_per=1000))
+        return (Candidate(*row) for row in rows)
+
+    keys = (Contact.phone_canonical, _email_local_part(db), Contact.name_key)
+    return group_duplicates((stream(key) for key in keys), threshold, max_block).groups()
+
+
+async def merge_contacts(user_id: int, keep_id: int, merge_ids: list[int], db: Session):
+    """
+    Merge duplicates into one contact in one transaction.
+    The kept contact stays favorite if any of the merged ones was and gets the birthday of the first
+    merged contact when it has none, the merged contacts are removed with tombstones.
+
+    :param user_id: For wich user id merge contacts
+    :type user_id: int
+    :param keep_id: Contact which is kept
+    :type keep_id: int
+    :param merge_ids: Contacts which are merged into the kept one and removed
+    :type merge_ids: list[int]
+    :param db: database session
+    :type db: Session
+    :return: The kept contact or None if any of the contacts is not found
+    :rtype: Contact | None
+    """
+    merge_ids = [contact_id for contact_id in dict.fromkeys(merge_ids) if contact_id != keep_id]
+    contacts = db.query(Contact).filter(Contact.contact_owner_id == user_id,
+                                        Contact.id.in_([keep_id, *merge_ids])).all()
+    contacts = {contact.id: contact for contact in contacts}
+    if len(contacts) != len(merge_ids) + 1:
+        return None
+
+    change_seq = _bump_contacts_version(user_id, db, count=len(merge_ids) + 1)
+    if len(_reload_contacts([keep_id, *merge_ids], user_id, db)) != len(merge_ids) + 1:
+        db.rollback()
+        return None
+    contact = contacts[keep_id]
+    merged = [contacts[contact_id] for contact_id in merge_ids]
+    favorite = contact.favorite or any(duplicate.favorite for duplicate in merged)
+    birthday = contact.birthday or next((duplicate.birthday for duplicate in merged if duplicate.birthday), None)
+    counters = contact_counters(contact.favorite, contact.birthday, sign=-1)
+    for duplicate in merged:
+        counters.update(contact_counters(duplicate.favorite, duplicate.birthday, sign=-1))
+    counters.update(contact_counters(favorite, birthday))
+    await update_counters(user_id, counters, db)
+    contact.favorite, contact.birthday = favorite, birthday
+    first_seq = change_seq - len(merged)
+    for seq, duplicate in enumerate(merged, start=first_seq):
+        db.add(ContactTombstone(contact_id=duplicate.id, contact_owner_id=user_id, change_seq=seq))
+        db.delete(duplicate)
+    contact.change_seq = change_seq
+    db.commit()
+
+    for seq, contact_id in enumerate(merge_ids, start=first_seq):
+        await contact_events.publish(user_id, "deleted", contact_id, seq)
+    await contact_events.publish(user_id, "updated", keep_id, change_seq)
     return contact
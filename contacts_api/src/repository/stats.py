@@ -0,0 +1,176 @@
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import delete, extract, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from src.db.models import Contact, ContactCounter, User
+
+TOTAL = "total"
+FAVORITES = "favorites"
+
+
+class ContactsQuotaExceeded(Exception):
+    pass
+
+
+def birthday_counter(month: int) -> str:
+    """
+    The birthday_counter function returns the name of the counter of birthdays in a month.
+
+    :param month: int: Month from 1 to 12
+    :return: Counter name
+    """
+    return f"birthday_{month:02d}"
+
+
+def contact_counters(favorite: bool | None, birthday: date | None, sign: int = 1) -> Counter:
+    """
+    The contact_counters function returns the counters one contact contributes to.
+
+    :param favorite: bool | None: Favorite flag of the contact
+    :param birthday: date | None: Birthday of the contact
+    :param sign: int: 1 for an added contact, -1 for a removed one
+    :return: Counter deltas
+    """
+    counters = Counter({TOTAL: sign})
+    if favorite:
+        counters[FAVORITES] += sign
+    if birthday:
+        counters[birthday_counter(birthday.month)] += sign
+    return counters
+
+
+def _upsert(db: Session, user_id: int, deltas: dict):
+    """
+    The _upsert function adds the deltas to the counters, creating the missing ones, in one statement
+    on Postgres and SQLite and with update-then-insert on other databases.
+
+    :param db: Session: database session
+    :param user_id: int: Owner of the counters
+    :param deltas: dict: Counter name to delta
+    :return: None
+    """
+    rows = [{"contact_owner_id": user_id, "name": name, "value": delta} for name, delta in deltas.items()]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        statement = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(ContactCounter).values(rows)
+        db.execute(statement.on_conflict_do_update(index_elements=[ContactCounter.contact_owner_id,
+                                                                   ContactCounter.name],
+                                                   set_={"value": ContactCounter.value + statement.excluded.value}))
+        return
+    for row in rows:
+        result = db.execute(update(ContactCounter)
+                            .where(ContactCounter.contact_owner_id == user_id, ContactCounter.name == row["name"])
+                            .values(value=ContactCounter.value + row["value"]))
+        if result.rowcount == 0:
+            db.execute(insert(ContactCounter).values(**row))
+
+
+async def update_counters(user_id: int, deltas: dict, db: Session):
+    """
+    Apply counter deltas in the current transaction, zero deltas are skipped.
+    Counters of users created before the counters existed are reconciled first, so a delta is never
+    applied to a missing counter. Call it after the user row is locked by the version bump,
+    and before the change itself is flushed.
+
+    :param user_id: Owner of the counters
+    :type user_id: int
+    :param deltas: Counter name to delta
+    :type deltas: dict
+    :param db: database session
+    :type db: Session
+    :return: None
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    exists = db.execute(select(ContactCounter.value)
+                        .where(ContactCounter.contact_owner_id == user_id, ContactCounter.name == TOTAL)).first()
+    if exists is None:
+        await reconcile_stats(user_id, db)
+    _upsert(db, user_id, deltas)
+
+
+async def reserve_contact(user_id: int, quota: int, db: Session):
+    """
+    Count a new contact against the quota of the user with one conditional update.
+    Counters of users created before the counters existed are reconciled first.
+
+    :param user_id: Owner of the new contact
+    :type user_id: int
+    :param quota: Maximum number of contacts, 0 for no limit
+    :type quota: int
+    :param db: database session
+    :type db: Session
+    :return: None
+    :raises ContactsQuotaExceeded: The user already has quota contacts
+    """
+    if not quota:
+        return
+
+    def increment():
+        return db.execute(update(ContactCounter)
+                          .where(ContactCounter.contact_owner_id == user_id, ContactCounter.name == TOTAL,
+                                 ContactCounter.value < quota)
+                          .values(value=ContactCounter.value + 1)).rowcount
+
+    if increment():
+        return
+    exists = db.execute(select(ContactCounter.value)
+                        .where(ContactCounter.contact_owner_id == user_id, ContactCounter.name == TOTAL)).first()
+    if exists is None:
+        await reconcile_stats(user_id, db)
+        if increment():
+            return
+    raise ContactsQuotaExceeded(f"Limit of {quota} contacts is reached")
+
+
+async def get_stats(user_id: int, db: Session):
+    """
+    Return the counters of the user, reconciling them once if they were never computed.
+
+    :param user_id: Owner of the counters
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :return: Counter name to value
+    :rtype: dict
+    """
+    rows = db.execute(select(ContactCounter.name, ContactCounter.value)
+                      .where(ContactCounter.contact_owner_id == user_id)).all()
+    counters = dict(rows)
+    if TOTAL not in counters:
+        counters = await reconcile_stats(user_id, db)
+        db.commit()
+    return counters
+
+
+async def reconcile_stats(user_id: int, db: Session):
+    """
+    Recompute the counters of the user from the contacts and replace the stored ones.
+    The user row is locked first, like every contact write does with its version bump, so concurrent writes wait.
+    The caller commits the transaction.
+
+    :param user_id: Owner of the counters
+    :type user_id: int
+    :param db: database session
+    :type db: Session
+    :return: Counter name to value
+    :rtype: dict
+    """
+    db.execute(select(User.id).where(User.id == user_id).with_for_update())
+    owner = Contact.contact_owner_id == user_id
+    total, favorites = db.execute(select(func.count(Contact.id), func.count(Contact.id).filter(Contact.favorite))
+                                  .where(owner)).one()
+    month = extract("month", Contact.birthday)
+    birthdays = db.execute(select(month, func.count(Contact.id))
+                           .where(owner, Contact.birthday.is_not(None)).group_by(month)).all()
+
+    counters = {TOTAL: total, FAVORITES: favorites}
+    counters.update({birthday_counter(int(month)): count for month, count in birthdays})
+    db.execute(delete(ContactCounter).where(ContactCounter.contact_owner_id == user_id))
+    db.execute(insert(ContactCounter), [{"contact_owner_id": user_id, "name": name, "value": value}
+                                        for name, value in counters.items()])
+    return counters
@@ -2,30 +2,37 @@ from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from src.db.models import User
+from src.db.shards import shard_directory
 from src.schemas.users_schema import UserModel
 
 async def get_user_by_email(email: str, db: Session) -> User | None:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user associated with that email. If no such user exists, it
-    returns None.
+    returns None. With several shards the session is bound to the shard of the user first.
     
     :param email: str: Pass in the email of the user
     :param db: Session: Pass the database session into the function
     :return: A user object if a user with the given email exists in the database, otherwise it returns none
     """
+    if shard_directory.sharded and shard_directory.route(email, db) is None:
+        return None
     user = db.query(User).filter_by(email=email).first()
     return user
 
 async def create_user(body: UserModel, db: Session):
     """
     The create_user function creates a new user in the database.
+    With several shards the id and the shard of the user come from the shard directory.
     
     :param body: UserModel: Pass the user model to the function
     :param db: Session: Pass the database session to the function
     :return: A new user object
     """
     new_user = User(**body.dict())
+    entry = shard_directory.register(body.email, db)
+    if entry is not None:
+        new_user.id = entry.user_id
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
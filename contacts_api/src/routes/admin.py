@@ -0,0 +1,126 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from src.conf.config import settings
+from src.services.admission_service import admission
+from src.services.loop_monitor_service import loop_monitor
+from src.services.profiling_service import profiler
+
+
+async def verify_admin_token(x_admin_token: str = Header(None)):
+    """
+    The verify_admin_token function guards the admin endpoints with the X-Admin-Token header.
+    Without ADMIN_TOKEN configured the admin endpoints do not exist.
+
+    :param x_admin_token: str: Token from the X-Admin-Token header
+    :return: None
+    """
+    if not settings.admin_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(verify_admin_token)])
+
+
+@router.get("/loop")
+async def get_loop_stalls():
+    """
+    The get_loop_stalls function reports the call sites which blocked the event loop, by route.
+
+    :return: The monitor settings and the offenders, the longest total stall first
+    """
+    return {"enabled": settings.loop_monitor, "threshold_ms": loop_monitor.threshold * 1000,
+            "offenders": loop_monitor.report()}
+
+
+@router.delete("/loop", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_loop_stalls():
+    """
+    The reset_loop_stalls function forgets the recorded stalls.
+
+    :return: None
+    """
+    loop_monitor.reset()
+
+
+@router.get("/admission")
+async def get_admission_stats():
+    """
+    The get_admission_stats function returns the queue depth, requests in flight and rejections of every
+    priority class, and the share of the database pool in use.
+
+    :return: A dictionary with the admission metrics
+    """
+    return admission.snapshot()
+
+
+@router.get("/profile/cpu", response_class=PlainTextResponse)
+async def profile_cpu(seconds: float = Query(10, gt=0, le=120), interval_ms: float = Query(5, ge=1, le=100)):
+    """
+    The profile_cpu function samples the stacks of every thread of this worker for some seconds,
+    the worker keeps serving requests meanwhile.
+    The result is in the collapsed stack format of flamegraph.pl and speedscope.
+
+    :param seconds: float: Length of the profile
+    :param interval_ms: float: Milliseconds between samples
+    :return: Collapsed stacks
+    """
+    if profiler.busy:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A CPU profile is already running")
+    return await profiler.cpu(seconds, interval_ms / 1000)
+
+
+@router.get("/profile/requests/{profile_id}", response_class=PlainTextResponse)
+async def get_request_profile(profile_id: str):
+    """
+    The get_request_profile function returns the profile of a request sent with the X-Profile header,
+    its id is in the X-Profile-Id header of the response.
+
+    :param profile_id: str: Id of the profile
+    :return: Collapsed stacks
+    """
+    if profile_id not in profiler.requests:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return profiler.requests[profile_id]
+
+
+@router.post("/profile/memory")
+async def take_memory_snapshot(limit: int = Query(25, ge=1, le=500)):
+    """
+    The take_memory_snapshot function takes a tracemalloc snapshot. The first call starts tracing,
+    take it as the baseline and compare later snapshots with it.
+
+    :param limit: int: Number of top allocation sites
+    :return: Id of the snapshot, traced memory and the top allocation sites
+    """
+    return profiler.snapshot(limit=limit)
+
+
+@router.get("/profile/memory/diff")
+async def diff_memory_snapshots(first: int, second: int, limit: int = Query(25, ge=1, le=500)):
+    """
+    The diff_memory_snapshots function compares two snapshots by allocation site.
+
+    :param first: int: Id of the older snapshot
+    :param second: int: Id of the newer snapshot
+    :param limit: int: Number of allocation sites
+    :return: The sites with the largest growth first
+    """
+    try:
+        return profiler.diff(first, second, limit)
+    except KeyError as error:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Snapshot {error} not found")
+
+
+@router.delete("/profile/memory", status_code=status.HTTP_204_NO_CONTENT)
+async def stop_memory_tracing():
+    """
+    The stop_memory_tracing function stops tracemalloc and drops the snapshots, tracing slows allocations.
+
+    :return: None
+    """
+    profiler.stop_tracing()
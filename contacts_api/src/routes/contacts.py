@@ -1,15 +1,22 @@
 from datetime import date, datetime, timedelta
 from typing import List
 
-from fastapi import Depends, status, HTTPException, APIRouter
+from fastapi import Depends, status, HTTPException, APIRouter, Request, Response, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.orm import Session
 
-from src.db.db import get_db
+from src.db.db import get_db, get_read_db
 from src.repository import contacts as repository_contacts
-from src.schemas.contacts_schema import ContactModel, ContactResponse
+from src.repository import stats as repository_stats
+from src.schemas.contacts_schema import (ContactModel, ContactResponse, ContactChangesResponse, ContactMergeModel,
+                                         DuplicateGroupResponse, ContactStatsResponse)
 from src.db.models import User
 from src.services.auth import auth_service
+from src.services.etag_service import etag_service
+from src.services.events_service import contact_events
+from src.conf.config import settings
 
 from limiter import setup_limiter
 
@@ -22,18 +29,76 @@ async def startup():
 
 
 @router.get("/", response_model=List[ContactResponse], dependencies=[Depends(RateLimiter(times=3, seconds=5))])
-async def get_contacts(key: str = None, value: str = None, db: Session = Depends(get_db),
-                       current_user: User = Depends(auth_service.get_current_user)):
+async def get_contacts(request: Request, response: Response, key: str = None, value: str = None, fields: str = None,
+                       db: Session = Depends(get_read_db), current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contacts function returns a list of contacts.
+        The response carries an ETag built from the contact-set version of the user, so when the
+        If-None-Match header matches, 304 Not Modified is returned without loading any contact.
+        The full list is read as plain rows, fields=id,first_name limits the response to the given fields.
     
+    :param request: Request: Get the conditional headers
+    :param response: Response: Set the ETag header
     :param key: str: Specify the key of the search
     :param value: str: Get the value of a specific key
+    :param fields: str: Comma separated fields of the response, all fields when omitted
     :param db: Session: Get the database session
     :param current_user: User: Get the current user from the database
     :return: The list of contacts for the current user
     """
-    contacts = await repository_contacts.get_contacts(current_user.id, db)
+    try:
+        projection = repository_contacts.contact_fields(fields)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error))
+    if key in ('phone', 'email') and not (value and value.strip()):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"A value is required to search by {key}!")
+
+    version = await repository_contacts.get_contacts_version(current_user.id, db)
+    etag = etag_service.for_collection(current_user.id, version, key, value,
+                                       date.today() if key == 'birthday' else None,
+                                       *(projection if fields else ()))
+    not_modified = etag_service.not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    response.headers["ETag"] = etag
+    contacts = await _filter_contacts(current_user.id, key, value, projection, db)
+    if not fields:
+        return contacts
+    return JSONResponse(jsonable_encoder([{field: getattr(contact, field) for field in projection}
+                                          for contact in contacts]), headers={"ETag": etag})
+
+
+async def _filter_contacts(user_id: int, key: str | None, value: str | None, projection: tuple, db: Session):
+    """
+    The _filter_contacts function returns the contacts of the user matching the key and value query.
+
+    :param user_id: int: Owner of the contacts
+    :param key: str | None: Specify the key of the search
+    :param value: str | None: Get the value of a specific key
+    :param projection: tuple: Fields of the response
+    :param db: Session: Get the database session
+    :return: Matching contacts or rows
+    """
+
+    # phone
+    if key == 'phone':
+        matching_contact_by_phone = await repository_contacts.get_contacts_by_phone(user_id, value, db)
+        if not matching_contact_by_phone:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Contact with phone '{value}' - not found!")
+        return matching_contact_by_phone
+
+    # email
+    elif key == 'email':
+        matching_contact_by_email = await repository_contacts.get_contacts_by_email(user_id, value, db)
+        if not matching_contact_by_email:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f"Contact with email '{value}' - not found!")
+        return matching_contact_by_email
+
+    columns = tuple(field for field in repository_contacts.CONTACT_FIELDS if field in projection or field == key)
+    contacts = await repository_contacts.get_contact_rows(user_id, db, columns)
 
     # birthday
     if key == 'birthday':
@@ -75,36 +140,155 @@ async def get_contacts(key: str = None, value: str = None, db: Session = Depends
                                 detail=f"Contact with last name '{value}' - not found!")
         return matching_contact_by_last_name
 
-    # phone
-    elif key == 'phone':
-        matching_contact_by_phone = [contact for contact in contacts if contact.phone == value]
-        if not matching_contact_by_phone:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                                detail=f"Contact with phone '{value}' - not found!")
-        return matching_contact_by_phone
+    return contacts
 
-    # email
-    elif key == 'email':
-        matching_contact_by_email = [contact for contact in contacts if str(contact.email).lower() == value.lower()]
-        if not matching_contact_by_email:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                                detail=f"Contact with email '{value}' - not found!")
-        return matching_contact_by_email
 
-    return contacts
+@router.get("/changes", response_model=ContactChangesResponse,
+            dependencies=[Depends(RateLimiter(times=3, seconds=5))])
+async def get_changes(since: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000),
+                      db: Session = Depends(get_read_db), current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_changes function returns contacts created, updated or deleted after the cursor.
+        A client starts with since=0 and then passes the returned cursor, repeating while has_more is true.
+        Deleted ids must be applied before the returned contacts. Tombstones are kept for
+        TOMBSTONE_RETENTION_DAYS, for an older cursor 410 Gone is returned and the client syncs again from 0.
+    
+    :param since: int: Cursor returned by the previous sync
+    :param limit: int: Maximum number of changes in one page
+    :param db: Session: Get the database session
+    :param current_user: User: Get the current user from the database
+    :return: Changed contacts, deleted contact ids and the next cursor
+    """
+    window = await repository_contacts.get_changes_window(current_user.id, db)
+    if window is not None:
+        horizon, version = window
+        if 0 < since < horizon:
+            raise HTTPException(status_code=status.HTTP_410_GONE,
+                                detail="Changes after the cursor were pruned, sync again from 0!")
+        if since >= version:
+            return {"contacts": [], "deleted": [], "cursor": since, "has_more": False}
+
+    contacts, deleted, cursor, has_more = await repository_contacts.get_changes(current_user.id, since, limit, db)
+    return {"contacts": contacts, "deleted": deleted, "cursor": cursor, "has_more": has_more}
+
+
+@router.get("/search", response_model=List[ContactResponse],
+            dependencies=[Depends(RateLimiter(times=10, seconds=5))])
+async def search_contacts(q: str = Query(min_length=1, max_length=100), limit: int = Query(20, ge=1, le=100),
+                          db: Session = Depends(get_read_db), current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The search_contacts function returns contacts matching the typed words for autocomplete.
+        Every word must match the beginning of a word in first name, last name, email or phone,
+        the best matches are returned first.
+    
+    :param q: str: Words typed by the user
+    :param limit: int: Maximum number of results
+    :param db: Session: Get the database session
+    :param current_user: User: Get the current user from the database
+    :return: The list of matching contacts
+    """
+    return await repository_contacts.search_contacts(current_user.id, q, limit, db)
+
+
+@router.get("/stats", response_model=ContactStatsResponse, dependencies=[Depends(RateLimiter(times=3, seconds=5))])
+async def get_stats(db: Session = Depends(get_read_db), current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_stats function returns how many contacts, favorites and birthdays this month the user has.
+        The numbers come from counters maintained on every write, so the cost does not depend
+        on the size of the address book.
+    
+    :param db: Session: Get the database session
+    :param current_user: User: Get the current user from the database
+    :return: The contact statistics of the current user
+    """
+    counters = await repository_stats.get_stats(current_user.id, db)
+    return {"total": counters.get(repository_stats.TOTAL, 0),
+            "favorites": counters.get(repository_stats.FAVORITES, 0),
+            "birthdays_this_month": counters.get(repository_stats.birthday_counter(date.today().month), 0),
+            "quota": settings.contacts_quota or None}
+
+
+@router.get("/duplicates", response_model=List[DuplicateGroupResponse],
+            dependencies=[Depends(RateLimiter(times=1, seconds=5))])
+async def get_duplicates(threshold: float = Query(0.6, ge=0.3, le=1), limit: int = Query(100, ge=1, le=1000),
+                         db: Session = Depends(get_read_db), current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_duplicates function returns groups of contacts which are likely the same person.
+        Only contacts with the same phone, email local part or similar sounding name are compared.
+    
+    :param threshold: float: Minimal score of a duplicate pair, from 0.3 to 1
+    :param limit: int: Maximum number of groups
+    :param db: Session: Get the database session
+    :param current_user: User: Get the current user from the database
+    :return: The list of duplicate groups with their score
+    """
+    groups = (await repository_contacts.find_duplicates(current_user.id, db, threshold))[:limit]
+    contacts = await repository_contacts.get_contacts_by_ids([contact_id for ids, _ in groups for contact_id in ids],
+                                                             current_user.id, db)
+    contacts = {contact.id: contact for contact in contacts}
+    return [{"contacts": [contacts[contact_id] for contact_id in ids if contact_id in contacts], "score": score}
+            for ids, score in groups]
+
+
+@router.post("/merge", response_model=ContactResponse, dependencies=[Depends(RateLimiter(times=3, seconds=5))])
+async def merge_contacts(body: ContactMergeModel, db: Session = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The merge_contacts function merges duplicates into one contact.
+        The contact with keep_id stays, the contacts with merge_ids are removed.
+        If any of the contacts does not exist, it returns 404 Not Found.
+    
+    :param body: ContactMergeModel: Get the kept contact id and the merged contact ids
+    :param db: Session: Get the database session
+    :param current_user: User: Get the current user from the database
+    :return: The kept contact
+    """
+    contact = await repository_contacts.merge_contacts(current_user.id, body.keep_id, body.merge_ids, db)
+    if contact is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contacts for merging - not found!")
+    return contact
+
+
+@router.get("/events", response_class=StreamingResponse)
+async def get_events(request: Request, current_user: User = Depends(auth_service.get_stream_user)):
+    """
+    The get_events function opens a server-sent events stream with the changes of the user's contacts.
+        Every event carries the change sequence as id, so after a resync event or a reconnect
+        the client catches up with the changes endpoint.
+    
+    :param request: Request: Detect a disconnected client
+    :param current_user: User: Get the current user, the stream keeps no database session
+    :return: A text/event-stream response
+    """
+    subscriber = contact_events.subscribe(current_user.id)
+    return StreamingResponse(contact_events.stream(subscriber, request.is_disconnected),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @router.get("/{contact_id}", response_model=ContactResponse, dependencies=[Depends(RateLimiter(times=3, seconds=5))])
-async def get_contact(contact_id: int, db: Session = Depends(get_db),
+async def get_contact(contact_id: int, request: Request, response: Response, db: Session = Depends(get_read_db),
                       current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contact function returns a contact by id.
+        When the If-None-Match header matches the ETag of the contact, 304 Not Modified is returned
+        and the contact row is not loaded.
     
     :param contact_id: int: Get the contact id from the path
+    :param request: Request: Get the conditional headers
+    :param response: Response: Set the ETag header
     :param db: Session: Pass the database session to the function
     :param current_user: User: Get the current user from the database
     :return: A contact object
     """
+    version = await repository_contacts.get_contact_version(contact_id, current_user.id, db)
+    if version is not None:
+        etag = etag_service.for_contact(contact_id, version)
+        not_modified = etag_service.not_modified(request, etag)
+        if not_modified:
+            return not_modified
+        response.headers["ETag"] = etag
+
     contact = await repository_contacts.get_contact_by_id(contact_id, current_user.id, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
@@ -119,6 +303,7 @@ async def create_contact(body: ContactModel, db: Session = Depends(get_db),
     """
     The create_contact function creates a new contact in the database.
         It takes in a ContactModel object and returns the newly created contact.
+        A retry with the same Idempotency-Key header gets the first response and creates nothing.
     
     :param body: ContactModel: Get the contact information from the request
     :param db: Session: Create a database session
@@ -126,32 +311,49 @@ async def create_contact(body: ContactModel, db: Session = Depends(get_db),
     :return: A contactmodel object
     """
     
-    contact = await repository_contacts.create_contact(current_user.id, body, db)
+    try:
+        contact = await repository_contacts.create_contact(current_user.id, body, db)
+    except repository_stats.ContactsQuotaExceeded as error:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(error))
     return contact
 
 
 @router.put("/{contact_id}", response_model=ContactResponse)
-async def update_contact(contact_id: int, body: ContactModel, db: Session = Depends(get_db),
-                         current_user: User = Depends(auth_service.get_current_user)):
+async def update_contact(contact_id: int, body: ContactModel, request: Request, response: Response,
+                         db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     """
     The update_contact function updates a contact in the database.
         The function takes an id of the contact to be updated, and a body containing all fields that need to be updated.
         If no such contact exists, it returns 404 Not Found.
+        If the If-Match header is sent and does not match the current ETag, it returns 412 Precondition Failed,
+        also when another request changes the contact between the check and the update.
     
     :param contact_id: int: Identify the contact to be deleted
     :param body: ContactModel: Pass the data from the request body to the function
+    :param request: Request: Get the conditional headers
+    :param response: Response: Set the new ETag header
     :param db: Session: Pass the database session to the function
     :param current_user: User: Get the user_id of the logged in user
     :return: A contactmodel object
     """
-    contact = await repository_contacts.update_contact(contact_id, current_user.id, body, db)
+    version = await repository_contacts.get_contact_version(contact_id, current_user.id, db)
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Contact with id {contact_id} - not found!")
+    etag_service.check_if_match(request, etag_service.for_contact(contact_id, version))
+
+    expected = version if "if-match" in request.headers else None
+    try:
+        contact = await repository_contacts.update_contact(contact_id, current_user.id, body, db, expected)
+    except repository_contacts.ContactChanged as error:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(error))
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Contact with id {contact_id} - not found!")
+    response.headers["ETag"] = etag_service.for_contact(contact.id, contact.change_seq)
     return contact
 
 
 @router.delete('/{contact_id}', status_code=status.HTTP_204_NO_CONTENT)
-async def delete_contact(contact_id: int, db: Session = Depends(get_db),
+async def delete_contact(contact_id: int, request: Request, db: Session = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The delete_contact function deletes a contact from the database.
@@ -159,13 +361,25 @@ async def delete_contact(contact_id: int, db: Session = Depends(get_db),
         corresponding ContactModel object in the database. If no such object is found, 
         then a 404 error is raised. Otherwise, if such an object exists and belongs to 
         current_user (the user who made this request), then that ContactModel object is deleted.
+        If the If-Match header is sent and does not match the current ETag, 412 Precondition Failed is returned,
+        also when another request changes the contact between the check and the delete.
     
     :param contact_id: int: Specify the contact id to be deleted
+    :param request: Request: Get the conditional headers
     :param db: Session: Pass in the database session to the function
     :param current_user: User: Get the current user and pass it to the repository function
     :return: The deleted contact
     """
-    contact = await repository_contacts.remove_contact(contact_id, current_user.id, db)
+    version = await repository_contacts.get_contact_version(contact_id, current_user.id, db)
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Contact with id {contact_id} - not found!")
+    etag_service.check_if_match(request, etag_service.for_contact(contact_id, version))
+
+    expected = version if "if-match" in request.headers else None
+    try:
+        contact = await repository_contacts.remove_contact(contact_id, current_user.id, db, expected)
+    except repository_contacts.ContactChanged as error:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(error))
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Contact with id {contact_id} - not found!")
     return contact
\ No newline at end of file
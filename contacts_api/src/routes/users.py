@@ -1,16 +1,17 @@
 from fastapi import APIRouter, Depends, UploadFile, File
 from sqlalchemy.orm import Session
 
-from src.db.db import get_db
+from src.db.db import get_db, get_read_db
 from src.db.models import User
 from src.schemas.users_schema import UserResponse
 from src.services.auth import auth_service
 from src.services.cloudinary_service import CloudImage
+from src.services.metrics_service import AVATAR_UPLOADS
 from src.repository.users import update_avatar
 
 router = APIRouter(prefix="/users", tags=['users'])
 
-@router.get("/me/", response_model=UserResponse)
+@router.get("/me/", response_model=UserResponse, dependencies=[Depends(get_read_db)])
 async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
     """
     The read_users_me function is a GET request that returns the current user's information.
@@ -36,7 +37,12 @@ async def update_avatar_user(file: UploadFile = File(), current_user: User = Dep
     :return: The user object
     """
     public_id = CloudImage.genereate_name_avatar(current_user.email)
-    r = CloudImage.upload(file.file, public_id)
+    try:
+        r = CloudImage.upload(file.file, public_id)
+    except Exception:
+        AVATAR_UPLOADS.labels("failed").inc()
+        raise
+    AVATAR_UPLOADS.labels("uploaded").inc()
     src_url = CloudImage.get_url_for_avatar(public_id, r)
     user = await update_avatar(current_user.email, src_url, db)
     return user
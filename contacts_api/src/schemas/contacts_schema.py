@@ -1,19 +1,26 @@
 from datetime import datetime, date
+from typing import List, Optional
+
 from pydantic import BaseModel, Field, EmailStr, validator
 
+from src.services.normalize_service import phone_digits
+
 
 class ContactModel(BaseModel):
     first_name: str = Field(min_length=2, max_length=50)
     last_name: str = Field(min_length=2, max_length=50)
     birthday: date
     email: EmailStr
-    phone: str = Field(min_length=10, max_length=12)
+    phone: str = Field(min_length=10, max_length=20)
     favorite: bool
 
     @validator("phone")
     def validate_digits(cls, phone):
-        if not phone.isdigit():
-            raise ValueError("Phone number should only contain digits")
+        digits = phone_digits(phone)
+        if not digits.lstrip("+").isdigit():
+            raise ValueError("Phone number should only contain digits, spaces, dashes and brackets")
+        if not 10 <= len(digits.lstrip("+")) <= 15:
+            raise ValueError("Phone number should contain from 10 to 15 digits")
         return phone
 
 
@@ -30,3 +37,27 @@ class ContactResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class ContactChangesResponse(BaseModel):
+    contacts: List[ContactResponse]
+    deleted: List[int]
+    cursor: int
+    has_more: bool
+
+
+class ContactMergeModel(BaseModel):
+    keep_id: int
+    merge_ids: List[int] = Field(min_length=1, max_length=100)
+
+
+class DuplicateGroupResponse(BaseModel):
+    contacts: List[ContactResponse]
+    score: float
+
+
+class ContactStatsResponse(BaseModel):
+    total: int
+    favorites: int
+    birthdays_this_month: int
+    quota: Optional[int]
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import math
+from collections import Counter
+
+from sqlalchemy.engine import Engine
+from starlette.responses import JSONResponse
+
+from src.conf.config import settings
+from src.db.db import shard_engines
+from src.services.metrics_service import ADMISSION_REJECTED, ADMISSION_WAITING
+
+logger = logging.getLogger(__name__)
+
+QUEUE_FULL = "queue_full"
+DEADLINE = "deadline"
+SATURATED = "saturated"
+
+# first matching path prefix wins, None exempts the path (streams would hold a slot for their whole life)
+ROUTES = (
+    ("/api/admin", None),
+    ("/api/healthchecker", None),
+    ("/api/health/", None),
+    ("/api/contacts/events", None),
+    ("/api/auth", "auth"),
+    ("/api/contacts/duplicates", "export"),
+)
+# share of the database pool in use from which a class is shed at once instead of queued
+SHED_AT = {"export": 0.5, "list": 0.9, "write": 1.0, "auth": None}
+
+
+class Gate:
+    """
+    Concurrency limit of one priority class. Requests over the limit wait in FIFO order for at most
+    deadline seconds, and at most queue of them wait at the same time.
+    """
+
+    def __init__(self, name: str, limit: int, deadline: float, queue: int, shed_at: float | None = None):
+        self.name = name
+        self.limit = limit
+        self.deadline = deadline
+        self.queue = queue
+        self.shed_at = shed_at
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = Counter()
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> str | None:
+        """
+        The acquire function takes a slot of the class.
+
+        :return: None when admitted, otherwise the reason of the rejection
+        """
+        if self._semaphore.locked() or self.waiting:
+            if self.waiting >= self.queue:
+                return self.reject(QUEUE_FULL)
+            self.waiting += 1
+            ADMISSION_WAITING.labels(self.name).inc()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.deadline)
+            except asyncio.TimeoutError:
+                return self.reject(DEADLINE)
+            finally:
+                self.waiting -= 1
+                ADMISSION_WAITING.labels(self.name).dec()
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self.admitted += 1
+        return None
+
+    def release(self):
+        """
+        The release function gives the slot back to the next waiting request.
+
+        :return: None
+        """
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def reject(self, reason: str) -> str:
+        """
+        The reject function counts a rejected request.
+
+        :param reason: str: Reason of the rejection
+        :return: The reason
+        """
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        return reason
+
+
+class Admission:
+    """
+    Admission control of the API. Every request belongs to a priority class with its own concurrency limit
+    and queue deadline, so a burst of heavy reads cannot take the slots of logins and writes.
+    When the database pools are nearly exhausted, lower classes are rejected at once with 503 and Retry-After
+    instead of waiting in get_db until the pool timeout.
+    """
+
+    def __init__(self, limits: str, deadline: float, queue: int, engines: list[Engine] | None = None):
+        self.gates = {}
+        for item in limits.split(","):
+            name, _, rest = item.strip().partition(":")
+            limit, _, class_deadline = rest.partition(":")
+            self.gates[name] = Gate(name, int(limit), float(class_deadline or deadline), queue, SHED_AT.get(name))
+        missing = {"auth", "write", "list", "export"}.difference(self.gates)
+        if missing:
+            raise ValueError(f"Admission limits miss the classes {', '.join(sorted(missing))}")
+        self.engines = engines or []
+
+    @staticmethod
+    def classify(method: str, path: str) -> str | None:
+        """
+        The classify function returns the priority class of a request.
+
+        :param method: str: HTTP method
+        :param path: str: Path of the request
+        :return: Name of the class, None when the request is not limited
+        """
+        if not path.startswith("/api/"):
+            return None
+        for prefix, name in ROUTES:
+            if path.startswith(prefix):
+                return name
+        return "list" if method in ("GET", "HEAD") else "write"
+
+    def pool_usage(self) -> float:
+        """
+        The pool_usage function returns the largest share of checked out connections over the database pools.
+
+        :return: 0 for an idle pool, 1 for an exhausted one
+        """
+        usage = 0.0
+        for engine in self.engines:
+            pool = engine.pool
+            if not hasattr(pool, "checkedout") or not hasattr(pool, "size"):
+                continue
+            capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+            if capacity > 0:
+                usage = max(usage, pool.checkedout() / capacity)
+        return usage
+
+    async def admit(self, name: str) -> str | None:
+        """
+        The admit function decides about a request of the class.
+
+        :param name: str: Priority class
+        :return: None when admitted, otherwise the reason of the rejection
+        """
+        gate = self.gates[name]
+        if gate.shed_at is not None and self.pool_usage() >= gate.shed_at:
+            return gate.reject(SATURATED)
+        return await gate.acquire()
+
+    def retry_after(self, name: str) -> int:
+        """
+        The retry_after function returns the seconds a rejected client of the class should wait.
+
+        :param name: str: Priority class
+        :return: Seconds for the Retry-After header
+        """
+        return max(1, math.ceil(self.gates[name].deadline))
+
+    def snapshot(self) -> dict:
+        """
+        The snapshot function returns the queue depth, the requests in flight and the rejection counts.
+
+        :return: Metrics of every class and the pool usage
+        """
+        return {"pool_usage": round(self.pool_usage(), 3),
+                "classes": {name: {"limit": gate.limit, "in_flight": gate.in_flight, "waiting": gate.waiting,
+                                   "admitted": gate.admitted, "rejected": dict(gate.rejected)}
+                            for name, gate in self.gates.items()}}
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware which admits the requests through Admission, the slot is held until the response is sent.
+    """
+
+    def __init__(self, app, admission: Admission):
+        self.app = app
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        name = self.admission.classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if name is None:
+            return await self.app(scope, receive, send)
+        reason = await self.admission.admit(name)
+        if reason is not None:
+            logger.warning("Rejected %s %s (%s): %s", scope["method"], scope["path"], name, reason)
+            response = JSONResponse(status_code=503, content={"detail": "Service is overloaded, retry later"},
+                                    headers={"Retry-After": str(self.admission.retry_after(name))})
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.gates[name].release()
+
+
+admission = Admission(settings.admission_limits, settings.admission_deadline, settings.admission_queue, shard_engines)
@@ -1,17 +1,22 @@
 import pickle
+from functools import cached_property
 from typing import Optional
 from datetime import datetime, timedelta
 
-import redis
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
 from jose import JWTError, jwt
+from redis.exceptions import RedisError
 
-from src.db.db import get_db
+from src.db.db import DBSession, get_db
+from src.db.shards import shard_directory
 from src.repository.users import get_user_by_email
 from src.conf.config import settings
+from src.services.metrics_service import AUTH_CACHE, instrument_redis
+from src.services.redis_service import LocalCache, redis_client
+from src.services.tracing_service import tracer
 
 
 class Authorization:
@@ -19,7 +24,49 @@ class Authorization:
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    c = redis.Redis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password)
+    # users loaded while Redis is unavailable, with AUTH_CACHE_FALLBACK=local
+    local_cache = LocalCache(settings.auth_local_cache_size, settings.auth_local_cache_ttl)
+
+    @cached_property
+    def c(self):
+        """
+        The c property creates the Redis client of the user cache on first use, instrumented for metrics and tracing.
+
+        :return: Redis client
+        """
+        client = redis_client(sync=True, name="auth")
+        return tracer.instrument_redis(instrument_redis(client, "auth"), "auth")
+
+    def cache_get(self, key: str) -> bytes | None:
+        """
+        The cache_get function reads a pickled user from Redis. While Redis is unavailable the local cache
+        answers with AUTH_CACHE_FALLBACK=local, and with db every lookup goes to the database.
+
+        :param key: str: Key of the user
+        :return: The pickled user, None on a miss
+        """
+        try:
+            return self.c.get(key)
+        except RedisError:
+            AUTH_CACHE.labels("error").inc()
+            if settings.auth_cache_fallback == "local":
+                return self.local_cache.get(key)
+            return None
+
+    def cache_set(self, key: str, user: bytes):
+        """
+        The cache_set function stores a pickled user in Redis for 15 minutes,
+        or for AUTH_LOCAL_CACHE_TTL in the local cache while Redis is unavailable.
+
+        :param key: str: Key of the user
+        :param user: bytes: The pickled user
+        :return: None
+        """
+        try:
+            self.c.set(key, user, ex=900)
+        except RedisError:
+            if settings.auth_cache_fallback == "local":
+                self.local_cache.set(key, user)
 
     def verify_password(self, plain_password, password: str):
         """
@@ -99,7 +146,8 @@ class Authorization:
         credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Couldn't validate credentials!", headers={"WWW-Authenticate": "Bearer"})
 
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            with tracer.span("auth.jwt_decode"):
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
 
             if payload.get("scope") == "access_token":
                 email = payload.get("sub")
@@ -111,21 +159,46 @@ class Authorization:
             raise credentials_exception
         
         # user = await get_user_by_email(email, db)
-        user = self.c.get(f"user:{email}")
+        with tracer.span("auth.cache_get"):
+            user = self.cache_get(f"user:{email}")
 
         if user is None:
-            user = await get_user_by_email(email, db)
+            AUTH_CACHE.labels("miss").inc()
+            with tracer.span("auth.db_lookup"):
+                user = await get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.c.set(f"user:{email}", pickle.dumps(user))
-            self.c.expire(f"user:{email}", 900)
+            self.cache_set(f"user:{email}", pickle.dumps(user))
+            # the user is returned detached like a cached one, so the connection goes back to the pool
+            # now instead of after the response, the route checks out a new one only if it queries
+            db.expunge(user)
+            db.close()
         else:
+            AUTH_CACHE.labels("hit").inc()
             user = pickle.loads(user)
+            shard_directory.route(email, db)
 
         if user is None:
             raise credentials_exception
+        db.info["user_id"] = user.id
         return user
 
+    async def get_stream_user(self, token: str = Depends(oauth2_scheme)):
+        """
+        The get_stream_user function authenticates like get_current_user, for long responses such as event streams.
+        It looks the user up in a session of its own and closes it before returning, so the response
+        holds no session and no pool connection while it runs.
+
+        :param self: Represent the instance of the class
+        :param token: str: Get the token from the request header
+        :return: The detached user
+        """
+        db = DBSession()
+        try:
+            return await self.get_current_user(token, db)
+        finally:
+            db.close()
+
     async def decode_refresh_token(self, refresh_token: str):
         """
         The decode_refresh_token function decodes the refresh token and returns the email of the user.
@@ -1,17 +1,44 @@
 import hashlib
-
-import cloudinary
-import cloudinary.uploader
+from functools import cache
 
 from src.conf.config import settings
+from src.services.fakes_service import FaultProfile, FilesystemImages
+from src.services.tracing_service import tracer
+
+
+@cache
+def cloudinary_client():
+    """
+    The cloudinary_client function imports and configures the Cloudinary SDK on first use,
+    so importing the application neither loads the SDK nor changes its global configuration.
+
+    :return: The configured cloudinary module
+    """
+    import cloudinary
+    import cloudinary.uploader
 
-class CloudImage:
     cloudinary.config(
         cloud_name=settings.cloudinary_name,
         api_key=settings.cloudinary_api_key,
         api_secret=settings.cloudinary_api_secret,
         secure=True
     )
+    return cloudinary
+
+
+@cache
+def image_store() -> FilesystemImages | None:
+    """
+    The image_store function builds the filesystem image store used in place of Cloudinary with IMAGE_BACKEND=filesystem.
+
+    :return: The store, None with Cloudinary
+    """
+    if settings.image_backend != "filesystem":
+        return None
+    return FilesystemImages(settings.image_dir, settings.image_base_url, FaultProfile.parse(settings.image_fake_profile))
+
+
+class CloudImage:
 
     @staticmethod
     def genereate_name_avatar(email: str):
@@ -27,6 +54,7 @@ class CloudImage:
         return f"avatars/{name}"
 
     @staticmethod
+    @tracer.traced("cloudinary.upload")
     def upload(file, public_id: str):
         """
         The upload function takes a file and public_id as arguments.
@@ -37,7 +65,9 @@ class CloudImage:
         :param public_id: str: Set the public_id of the image to be uploaded
         :return: A dictionary of the uploaded file's information
         """
-        r = cloudinary.uploader.upload(file, public_id=public_id, overwrite=True)
+        if image_store() is not None:
+            return image_store().upload(file, public_id)
+        r = cloudinary_client().uploader.upload(file, public_id=public_id, overwrite=True)
         return r
 
     @staticmethod
@@ -50,5 +80,7 @@ class CloudImage:
         :param r: Get the version of the image from cloudinary
         :return: The url for the avatar image
         """
-        src_url = cloudinary.CloudinaryImage(public_id).build_url(width=250, height=250, crop="fill", version=r.get('version'))
+        if image_store() is not None:
+            return image_store().url(public_id, r.get('version'))
+        src_url = cloudinary_client().CloudinaryImage(public_id).build_url(width=250, height=250, crop="fill", version=r.get('version'))
         return src_url
\ No newline at end of file
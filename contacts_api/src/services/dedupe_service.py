@@ -0,0 +1,129 @@
+from difflib import SequenceMatcher
+from itertools import combinations, groupby, islice
+from typing import Iterable, NamedTuple
+
+
+class Candidate(NamedTuple):
+    key: str
+    id: int
+    first_name: str
+    last_name: str
+    email: str | None
+    phone: str | None
+    birthday: object
+
+
+class DisjointSet:
+    """
+    Union-find over contact ids. Only ids which matched at least once are stored,
+    so the memory depends on the number of duplicates, not on the size of the address book.
+    """
+
+    def __init__(self):
+        self.parent: dict[int, int] = {}
+        self.scores: dict[int, float] = {}
+
+    def find(self, item: int) -> int:
+        """
+        The find function returns the representative of the group of an id, compressing the path on the way.
+
+        :param item: int: Contact id
+        :return: Id of the group representative
+        """
+        root = self.parent.setdefault(item, item)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first: int, second: int, score: float):
+        """
+        The union function joins the groups of two ids and keeps the best pair score of the group.
+
+        :param first: int: Contact id
+        :param second: int: Contact id
+        :param score: float: Score of the pair
+        :return: None
+        """
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            first, second = min(first, second), max(first, second)
+            self.parent[second] = first
+            score = max(score, self.scores.pop(second, 0.0))
+        self.scores[first] = max(score, self.scores.get(first, 0.0))
+
+    def groups(self) -> list[tuple[list[int], float]]:
+        """
+        The groups function returns every group of at least two ids with its best pair score.
+
+        :return: A list of (ids, score) sorted by the smallest id
+        """
+        members: dict[int, list[int]] = {}
+        for item in self.parent:
+            members.setdefault(self.find(item), []).append(item)
+        return sorted(((sorted(ids), self.scores.get(root, 0.0)) for root, ids in members.items() if len(ids) > 1),
+                      key=lambda group: group[0][0])
+
+
+def email_local_part(email: str | None) -> str:
+    """
+    The email_local_part function returns the part of an email before @.
+
+    :param email: str | None: Canonical email
+    :return: The local part or an empty string
+    """
+    return (email or "").split("@", 1)[0]
+
+
+def score(first: Candidate, second: Candidate, threshold: float = 0.0) -> float:
+    """
+    The score function estimates how likely two contacts are the same person.
+    The same phone or email weigh 0.4 each, the same email local part 0.2,
+    the name similarity up to 0.4 and the same birthday 0.1.
+    The expensive name comparison is skipped when even equal names could not reach the threshold.
+
+    :param first: Candidate: First contact
+    :param second: Candidate: Second contact
+    :param threshold: float: Score the caller is interested in
+    :return: A score from 0 to 1, or a lower bound under the threshold
+    """
+    result = 0.0
+    if first.phone and first.phone == second.phone:
+        result += 0.4
+    if first.email and first.email == second.email:
+        result += 0.4
+    elif email_local_part(first.email) and email_local_part(first.email) == email_local_part(second.email):
+        result += 0.2
+    if first.birthday and first.birthday == second.birthday:
+        result += 0.1
+    if result + 0.4 < threshold:
+        return result
+    first_name = f"{first.first_name} {first.last_name}".lower()
+    second_name = f"{second.first_name} {second.last_name}".lower()
+    result += 0.4 * SequenceMatcher(None, first_name, second_name).ratio()
+    return min(result, 1.0)
+
+
+def group_duplicates(streams: Iterable[Iterable[Candidate]], threshold: float, max_block: int,
+                     duplicates: DisjointSet | None = None) -> DisjointSet:
+    """
+    The group_duplicates function compares the contacts only inside blocks of equal key.
+    Every stream must be sorted by the key, so only one block is held in memory at a time.
+    Blocks bigger than max_block are truncated, which keeps the comparisons linear in the number of contacts.
+
+    :param streams: Iterable[Iterable[Candidate]]: One stream sorted by key for every blocking key
+    :param threshold: float: Minimal score of a duplicate pair
+    :param max_block: int: Maximal number of contacts compared inside one block
+    :param duplicates: DisjointSet | None: Groups found so far
+    :return: The groups of duplicates
+    """
+    duplicates = duplicates or DisjointSet()
+    for stream in streams:
+        for _, block in groupby(stream, key=lambda candidate: candidate.key):
+            block = list(islice(block, max_block))
+            for first, second in combinations(block, 2):
+                pair_score = score(first, second, threshold)
+                if pair_score >= threshold:
+                    duplicates.union(first.id, second.id, pair_score)
+    return duplicates
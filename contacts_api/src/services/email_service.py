@@ -1,26 +1,45 @@
+from functools import cache
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
 from src.conf.config import settings
+from src.services.fakes_service import FaultProfile, MailSink
+from src.services.metrics_service import EMAILS
+from src.services.tracing_service import tracer
 
-configuration = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=settings.mail_from,
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME='Desired Name',
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=False,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
 
+@cache
+def mail_client():
+    """
+    The mail_client function builds the mail client on first use. fastapi_mail is the slowest import
+    of the application, so it is imported here and not when the application starts.
+    With MAIL_BACKEND=memory the messages go to an in-memory sink with the faults of MAIL_FAKE_PROFILE.
+
+    :return: The FastMail client or the sink
+    """
+    if settings.mail_backend == "memory":
+        return MailSink(FaultProfile.parse(settings.mail_fake_profile))
+    from fastapi_mail import FastMail, ConnectionConfig
+
+    configuration = ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username,
+        MAIL_PASSWORD=settings.mail_password,
+        MAIL_FROM=settings.mail_from,
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME='Desired Name',
+        MAIL_STARTTLS=settings.mail_starttls,
+        MAIL_SSL_TLS=settings.mail_ssl_tls,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=settings.mail_validate_certs,
+        TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+    )
+    return FastMail(configuration)
+
+
+@tracer.traced("email.send_email")
 async def send_email(email: EmailStr, username: str, host: str):
     """
     The send_email function sends an email to the user with a link to confirm their email address.
@@ -35,6 +54,9 @@ async def send_email(email: EmailStr, username: str, host: str):
     :param host: str: Pass the hostname of the server to the template
     :return: A coroutine object
     """
+    from fastapi_mail import MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
+
     try:
         token_verification = auth_service.create_email_token({"sub": email})
 
@@ -45,12 +67,14 @@ async def send_email(email: EmailStr, username: str, host: str):
             subtype=MessageType.html
         )
 
-        fm = FastMail(configuration)
-        await fm.send_message(message, template_name="email_template.html")
+        await mail_client().send_message(message, template_name="email_template.html")
+        EMAILS.labels("email_template", "sent").inc()
     except ConnectionErrors as err:
+        EMAILS.labels("email_template", "failed").inc()
         print(err)
 
 
+@tracer.traced("email.reset_password")
 async def reset_password(email: EmailStr, username: str, host: str):
     """
     The reset_password function sends an email to the user with a link to reset their password.
@@ -60,6 +84,9 @@ async def reset_password(email: EmailStr, username: str, host: str):
     :param host: str: Pass the hostname of the server to be used in the email
     :return: A connectionerrors exception if the connection fails
     """
+    from fastapi_mail import MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
+
     try:
         token_reset_password = auth_service.create_email_token({"sub": email})
 
@@ -70,7 +97,8 @@ async def reset_password(email: EmailStr, username: str, host: str):
             subtype=MessageType.html
         )
 
-        fm = FastMail(configuration)
-        await fm.send_message(message, template_name="reset_password_template.html")
+        await mail_client().send_message(message, template_name="reset_password_template.html")
+        EMAILS.labels("reset_password_template", "sent").inc()
     except ConnectionErrors as err:
+        EMAILS.labels("reset_password_template", "failed").inc()
         print(err)
\ No newline at end of file
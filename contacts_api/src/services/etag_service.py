@@ -0,0 +1,90 @@
+import hashlib
+
+from fastapi import HTTPException, Request, Response, status
+
+
+class ETag:
+
+    @staticmethod
+    def for_collection(user_id: int, version: int, *parts) -> str:
+        """
+        The for_collection function builds a strong ETag for a list of contacts.
+        It is derived from the owner's contact-set version and any query parameters that change the payload,
+        so it can be computed without loading a single contact row.
+
+        :param user_id: int: Owner of the contacts
+        :param version: int: Contact-set version of the owner
+        :param parts: Query parameters which change the content of the list
+        :return: A quoted strong ETag
+        """
+        raw = ":".join(str(part) for part in (user_id, version, *parts))
+        return f'"{hashlib.sha1(raw.encode("utf-8")).hexdigest()}"'
+
+    @staticmethod
+    def for_contact(contact_id: int, version: int) -> str:
+        """
+        The for_contact function builds a strong ETag for a single contact from its version,
+        the change sequence of its last write, which changes on every write unlike a timestamp.
+
+        :param contact_id: int: Id of the contact
+        :param version: int: Version of the contact
+        :return: A quoted strong ETag
+        """
+        raw = f"{contact_id}:{version}"
+        return f'"{hashlib.sha1(raw.encode("utf-8")).hexdigest()}"'
+
+    @staticmethod
+    def _parse(header: str | None, weak: bool = True) -> list[str]:
+        """
+        The _parse function splits an If-None-Match / If-Match header into separate tags.
+
+        :param header: str | None: Raw header value
+        :param weak: bool: Use weak comparison (strip W/ prefix) or strong comparison (skip weak tags)
+        :return: A list of tags
+        """
+        if not header:
+            return []
+        tags = []
+        for tag in header.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                if not weak:
+                    continue
+                tag = tag[2:]
+            if tag:
+                tags.append(tag)
+        return tags
+
+    def not_modified(self, request: Request, etag: str) -> Response | None:
+        """
+        The not_modified function checks the If-None-Match header of the request.
+        If the client already has the current representation it returns a 304 response, otherwise None.
+
+        :param request: Request: Incoming request
+        :param etag: str: Current ETag of the resource
+        :return: A 304 response or None
+        """
+        tags = self._parse(request.headers.get("if-none-match"))
+        if "*" in tags or etag in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return None
+
+    def check_if_match(self, request: Request, etag: str) -> None:
+        """
+        The check_if_match function enforces optimistic concurrency for PUT and DELETE.
+        When the If-Match header is sent and none of its tags is the current ETag, a 412 error is raised.
+
+        :param request: Request: Incoming request
+        :param etag: str: Current ETag of the resource
+        :return: None
+        """
+        header = request.headers.get("if-match")
+        if header is None:
+            return
+        tags = self._parse(header, weak=False)
+        if "*" not in tags and etag not in tags:
+            raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED,
+                                detail="Contact was changed by another request!")
+
+
+etag_service = ETag()
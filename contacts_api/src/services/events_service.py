@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.redis_service import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """
+    Local queue of events for one connected client.
+    The queue is bounded, a client which does not read fast enough is marked as overflowed
+    and has to resynchronise through the changes endpoint.
+    """
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def push(self, event: str):
+        """
+        The push function puts an event into the queue without waiting.
+        When the queue is full the pending events are dropped and a single resync event is left instead.
+
+        :param event: str: Serialized event
+        :return: None
+        """
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.resync()
+
+    def resync(self):
+        """
+        The resync function drops the pending events and leaves a single resync event in the queue.
+
+        :return: None
+        """
+        self.overflowed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(json.dumps({"op": "resync"}))
+
+
+class ContactEvents:
+    CHANNEL_PREFIX = "contacts:events:"
+
+    def __init__(self):
+        self._redis = None
+        self._reader = None
+        self._subscribers: dict[int, set[Subscriber]] = {}
+
+    @property
+    def redis(self) -> redis.Redis:
+        """
+        The redis property creates the asyncio Redis client on first use.
+
+        :return: Redis client
+        """
+        if self._redis is None:
+            self._redis = redis_client(decode_responses=True, name="events")
+        return self._redis
+
+    async def publish(self, user_id: int, op: str, contact_id: int, change_seq: int):
+        """
+        The publish function sends a compact change event to every worker through Redis pub/sub.
+        A failed publish is only logged, clients will catch up through the changes endpoint.
+
+        :param user_id: int: Owner of the changed contact
+        :param op: str: created, updated or deleted
+        :param contact_id: int: Id of the changed contact
+        :param change_seq: int: Change sequence of the change, usable as cursor for the changes endpoint
+        :return: None
+        """
+        event = json.dumps({"op": op, "id": contact_id, "seq": change_seq}, separators=(",", ":"))
+        try:
+            await self.redis.publish(f"{self.CHANNEL_PREFIX}{user_id}", event)
+        except (RedisError, OSError) as err:
+            logger.warning("Couldn't publish contact event: %s", err)
+
+    async def _read(self):
+        """
+        The _read function listens to the events of all users with one pub/sub connection per worker
+        and fans them out to the local subscribers.
+
+        :return: None
+        """
+        pubsub = self.redis.pubsub()
+        try:
+            await pubsub.psubscribe(f"{self.CHANNEL_PREFIX}*")
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                user_id = int(message["channel"][len(self.CHANNEL_PREFIX):])
+                for subscriber in self._subscribers.get(user_id, ()):
+                    subscriber.push(message["data"])
+        except (RedisError, OSError) as err:
+            logger.warning("Contact events reader stopped: %s", err)
+            for subscribers in self._subscribers.values():
+                for subscriber in subscribers:
+                    subscriber.resync()
+        finally:
+            # a cancelled reader may finish after a new one started, which must keep its reference
+            if self._reader is asyncio.current_task():
+                self._reader = None
+            try:
+                await pubsub.reset()
+            except (RedisError, OSError):
+                pass
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        """
+        The subscribe function registers a new local subscriber and starts the reader when needed.
+
+        :param user_id: int: User which events are delivered
+        :return: The subscriber
+        """
+        subscriber = Subscriber(user_id, settings.events_queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._read())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """
+        The unsubscribe function removes a local subscriber and stops the reader when nobody listens.
+
+        :param subscriber: Subscriber: Subscriber to remove
+        :return: None
+        """
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.user_id]
+        if not self._subscribers and self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+
+    async def stream(self, subscriber: Subscriber, is_disconnected=None):
+        """
+        The stream function yields server-sent events for a subscriber.
+        When no event arrives during the heartbeat interval a comment line is sent to keep the connection alive.
+        The stream ends after a resync event or when the client disconnects.
+
+        :param subscriber: Subscriber: Subscriber to read from
+        :param is_disconnected: Optional coroutine function which tells if the client is gone
+        :return: An async generator of SSE frames
+        """
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), timeout=settings.events_heartbeat)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                data = json.loads(event)
+                if data["op"] == "resync":
+                    yield f"event: resync\ndata: {event}\n\n"
+                    break
+                yield f"id: {data['seq']}\nevent: contact\ndata: {event}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+contact_events = ContactEvents()
@@ -0,0 +1,423 @@
+import asyncio
+import fnmatch
+import hashlib
+import random
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable
+
+from redis.exceptions import ConnectionError as RedisConnectionError, NoScriptError, ResponseError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+
+class FaultProfile:
+    """
+    Latency and faults of a fake backend. Every operation waits latency_ms plus up to jitter_ms,
+    spike_rate of the operations wait spike_ms more, and error_rate of them fail with the connection
+    error of the backend. Profiles are read from strings like ``latency_ms=2,jitter_ms=1,error_rate=0.01``
+    and can be changed while the fake is in use.
+    """
+
+    FIELDS = ("latency_ms", "jitter_ms", "spike_rate", "spike_ms", "error_rate")
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, spike_rate: float = 0, spike_ms: float = 0,
+                 error_rate: float = 0, seed: int | None = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.spike_rate = spike_rate
+        self.spike_ms = spike_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec: str) -> "FaultProfile":
+        """
+        The parse function reads a profile from comma separated name=value pairs, missing fields are 0.
+
+        :param spec: str: The profile, like ``latency_ms=5,error_rate=0.1``
+        :return: The profile
+        :raises ValueError: Unknown field or value which is no number
+        """
+        values = {}
+        for part in filter(None, (part.strip() for part in spec.split(","))):
+            name, _, value = part.partition("=")
+            if name.strip() not in cls.FIELDS + ("seed",):
+                raise ValueError(f"Unknown fault profile field {name.strip()}, use {', '.join(cls.FIELDS)} or seed")
+            values[name.strip()] = int(value) if name.strip() == "seed" else float(value)
+        return cls(**values)
+
+    def delay(self) -> float:
+        """
+        The delay function draws the latency of one operation.
+
+        :return: Seconds to wait
+        """
+        delay = self.latency_ms + self.jitter_ms * self.random.random()
+        if self.spike_rate and self.random.random() < self.spike_rate:
+            delay += self.spike_ms
+        return delay / 1000
+
+    def fails(self) -> bool:
+        return bool(self.error_rate) and self.random.random() < self.error_rate
+
+    async def wait(self, error: Callable[[str], Exception]):
+        """
+        The wait function applies the profile to an asyncio operation.
+
+        :param error: Callable[[str], Exception]: Builds the connection error of the backend
+        :return: None
+        """
+        delay = self.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        if self.fails():
+            raise error("injected failure of the fake backend")
+
+    def block(self, error: Callable[[str], Exception], timeout: float | None = None,
+              timeout_error: Callable[[str], Exception] = TimeoutError):
+        """
+        The block function applies the profile to a blocking operation.
+        With a timeout a longer delay waits only the timeout and fails like a socket timeout.
+
+        :param error: Callable[[str], Exception]: Builds the connection error of the backend
+        :param timeout: float | None: Seconds the caller waits at most
+        :param timeout_error: Callable[[str], Exception]: Builds the timeout error of the backend
+        :return: None
+        """
+        delay = self.delay()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise timeout_error(f"fake backend timed out after {timeout}s")
+        if delay:
+            time.sleep(delay)
+        if self.fails():
+            raise error("injected failure of the fake backend")
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+class MemoryStore:
+    """
+    Data of a fake Redis server: strings with expiry, pub/sub and scripts.
+    Lua cannot run here, so scripts work only when a Python implementation was registered for their source.
+    """
+
+    def __init__(self):
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}
+        self.pubsubs: set[FakePubSub] = set()
+        self.scripts: dict[str, Callable] = {}
+        self._implementations: dict[str, Callable] = {}
+
+    def register_script(self, script: str, implementation: Callable):
+        """
+        The register_script function gives a Lua script a Python implementation.
+
+        :param script: str: Source of the script
+        :param implementation: Callable: Called with the store, the keys and the arguments
+        :return: None
+        """
+        self._implementations[hashlib.sha1(script.encode()).hexdigest()] = implementation
+
+    def execute(self, command: str, *args, **options):
+        handler = getattr(self, f"_{command.lower().replace(' ', '_')}", None)
+        if handler is None:
+            raise ResponseError(f"fake Redis does not support {command}")
+        return handler(*args, **options)
+
+    def _entry(self, key) -> tuple[bytes, float | None] | None:
+        key = _encode(key)
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    def _get(self, key):
+        entry = self._entry(key)
+        return entry[0] if entry else None
+
+    def _set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        exists = self._entry(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        ttl = ex if ex is not None else px / 1000 if px is not None else None
+        self.data[_encode(key)] = (_encode(value), time.monotonic() + ttl if ttl is not None else None)
+        return True
+
+    def _del(self, *keys):
+        return sum(self.data.pop(_encode(key), None) is not None for key in keys if self._entry(key) is not None)
+
+    def _exists(self, *keys):
+        return sum(self._entry(key) is not None for key in keys)
+
+    def _pexpire(self, key, milliseconds):
+        entry = self._entry(key)
+        if entry is None:
+            return False
+        self.data[_encode(key)] = (entry[0], time.monotonic() + milliseconds / 1000)
+        return True
+
+    def _expire(self, key, seconds):
+        return self._pexpire(key, seconds * 1000)
+
+    def _pttl(self, key):
+        entry = self._entry(key)
+        if entry is None:
+            return -2
+        return -1 if entry[1] is None else int((entry[1] - time.monotonic()) * 1000)
+
+    def _ttl(self, key):
+        pttl = self._pttl(key)
+        return pttl if pttl < 0 else pttl // 1000
+
+    def _incrby(self, key, amount=1):
+        entry = self._entry(key)
+        value = int(entry[0]) + amount if entry else amount
+        self.data[_encode(key)] = (_encode(value), entry[1] if entry else None)
+        return value
+
+    def _ping(self):
+        return True
+
+    def _flushall(self):
+        self.data.clear()
+        return True
+
+    def _publish(self, channel, message):
+        return sum(pubsub.deliver(_encode(channel), _encode(message)) for pubsub in list(self.pubsubs))
+
+    def _script_load(self, script):
+        sha = hashlib.sha1(script.encode()).hexdigest()
+        if sha not in self._implementations:
+            raise ResponseError("fake Redis cannot run Lua, register a Python implementation of the script")
+        self.scripts[sha] = self._implementations[sha]
+        return sha
+
+    def _evalsha(self, sha, numkeys, *keys_and_args):
+        if sha not in self.scripts:
+            raise NoScriptError("No matching script. Please use EVAL.")
+        return self.scripts[sha](self, keys_and_args[:int(numkeys)], keys_and_args[int(numkeys):])
+
+
+class RedisCommands:
+    """
+    The subset of redis-py commands the application uses. Every command goes through execute_command,
+    like in redis-py, so the metrics and tracing instrumentation sees the fake commands.
+    """
+
+    def get(self, name):
+        return self.execute_command("GET", name)
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+        return self.execute_command("SET", name, value, ex=ex, px=px, nx=nx, xx=xx)
+
+    def delete(self, *names):
+        return self.execute_command("DEL", *names)
+
+    def exists(self, *names):
+        return self.execute_command("EXISTS", *names)
+
+    def expire(self, name, time):
+        return self.execute_command("EXPIRE", name, time)
+
+    def pexpire(self, name, time):
+        return self.execute_command("PEXPIRE", name, time)
+
+    def ttl(self, name):
+        return self.execute_command("TTL", name)
+
+    def pttl(self, name):
+        return self.execute_command("PTTL", name)
+
+    def incr(self, name, amount=1):
+        return self.execute_command("INCRBY", name, amount)
+
+    def ping(self):
+        return self.execute_command("PING")
+
+    def flushall(self):
+        return self.execute_command("FLUSHALL")
+
+    def publish(self, channel, message):
+        return self.execute_command("PUBLISH", channel, message)
+
+    def script_load(self, script):
+        return self.execute_command("SCRIPT LOAD", script)
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        return self.execute_command("EVALSHA", sha, numkeys, *keys_and_args)
+
+    def _decode(self, value):
+        if self.decode_responses and isinstance(value, bytes):
+            return value.decode()
+        return value
+
+
+class FakeRedis(RedisCommands):
+    """
+    Blocking fake of redis.Redis on a MemoryStore, commands slower than socket_timeout fail like on a real socket.
+    """
+
+    def __init__(self, store: MemoryStore | None = None, profile: FaultProfile | None = None,
+                 decode_responses: bool = False, socket_timeout: float | None = None):
+        self.store = store if store is not None else MemoryStore()
+        self.profile = profile or FaultProfile()
+        self.decode_responses = decode_responses
+        self.socket_timeout = socket_timeout
+
+    def execute_command(self, *args, **options):
+        self.profile.block(RedisConnectionError, self.socket_timeout, RedisTimeoutError)
+        return self._decode(self.store.execute(*args, **options))
+
+    def close(self):
+        pass
+
+
+class FakeAsyncRedis(RedisCommands):
+    """
+    Fake of redis.asyncio.Redis on a MemoryStore, with pub/sub.
+    """
+
+    def __init__(self, store: MemoryStore | None = None, profile: FaultProfile | None = None,
+                 decode_responses: bool = False):
+        self.store = store if store is not None else MemoryStore()
+        self.profile = profile or FaultProfile()
+        self.decode_responses = decode_responses
+
+    async def execute_command(self, *args, **options):
+        await self.profile.wait(RedisConnectionError)
+        return self._decode(self.store.execute(*args, **options))
+
+    def pubsub(self) -> "FakePubSub":
+        return FakePubSub(self)
+
+    async def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+class FakePubSub:
+    """
+    Pub/sub connection of the fake asyncio Redis, with the messages redis-py yields from listen.
+    """
+
+    def __init__(self, client: FakeAsyncRedis):
+        self.client = client
+        self.channels: set[bytes] = set()
+        self.patterns: set[bytes] = set()
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def _message(self, kind: str, pattern: bytes | None, channel: bytes, data) -> dict:
+        decode = self.client._decode
+        return {"type": kind, "pattern": decode(pattern), "channel": decode(channel), "data": decode(data)}
+
+    async def subscribe(self, *channels):
+        await self.client.profile.wait(RedisConnectionError)
+        self.client.store.pubsubs.add(self)
+        for channel in map(_encode, channels):
+            self.channels.add(channel)
+            self.queue.put_nowait(self._message("subscribe", None, channel, len(self.channels) + len(self.patterns)))
+
+    async def psubscribe(self, *patterns):
+        await self.client.profile.wait(RedisConnectionError)
+        self.client.store.pubsubs.add(self)
+        for pattern in map(_encode, patterns):
+            self.patterns.add(pattern)
+            self.queue.put_nowait(self._message("psubscribe", None, pattern, len(self.channels) + len(self.patterns)))
+
+    def deliver(self, channel: bytes, data: bytes) -> int:
+        delivered = 0
+        if channel in self.channels:
+            self.queue.put_nowait(self._message("message", None, channel, data))
+            delivered += 1
+        for pattern in self.patterns:
+            if fnmatch.fnmatchcase(channel.decode(), pattern.decode()):
+                self.queue.put_nowait(self._message("pmessage", pattern, channel, data))
+                delivered += 1
+        return delivered
+
+    async def listen(self):
+        while self.channels or self.patterns:
+            yield await self.queue.get()
+
+    async def reset(self):
+        self.client.store.pubsubs.discard(self)
+        self.channels.clear()
+        self.patterns.clear()
+
+
+class MailSink:
+    """
+    Mail backend which keeps the last messages in memory in place of sending them, a drop-in for FastMail.
+    Injected failures raise the ConnectionErrors of fastapi_mail, like an unreachable SMTP server.
+    """
+
+    def __init__(self, profile: FaultProfile | None = None, size: int = 1000):
+        self.profile = profile or FaultProfile()
+        self.outbox: deque[dict] = deque(maxlen=size)
+
+    @staticmethod
+    def _error(message: str) -> Exception:
+        from fastapi_mail.errors import ConnectionErrors
+
+        return ConnectionErrors(message)
+
+    async def send_message(self, message, template_name: str | None = None):
+        """
+        The send_message function records the message.
+
+        :param message: MessageSchema: The message
+        :param template_name: str | None: Template of the body
+        :return: None
+        """
+        await self.profile.wait(self._error)
+        self.outbox.append({"recipients": [str(recipient) for recipient in message.recipients],
+                            "subject": message.subject, "template": template_name, "body": message.template_body})
+
+    async def ping(self):
+        await self.profile.wait(self._error)
+
+
+class FilesystemImages:
+    """
+    Image store which keeps uploads in a local directory in place of Cloudinary.
+    The URLs point to base_url, where the application serves the directory.
+    """
+
+    def __init__(self, directory: str | Path, base_url: str, profile: FaultProfile | None = None):
+        self.directory = Path(directory).resolve()
+        self.base_url = base_url.rstrip("/")
+        self.profile = profile or FaultProfile()
+
+    def path(self, public_id: str) -> Path:
+        path = (self.directory / public_id).resolve()
+        if not path.is_relative_to(self.directory):
+            raise ValueError(f"Public id {public_id} leaves the image directory")
+        return path
+
+    def upload(self, file, public_id: str) -> dict:
+        """
+        The upload function stores the image, overwriting an older one with the same public id.
+
+        :param file: File object of the image
+        :param public_id: str: Name of the image
+        :return: Public id, version and size of the image, like a Cloudinary upload result
+        """
+        self.profile.block(ConnectionError)
+        data = file.read()
+        path = self.path(public_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return {"public_id": public_id, "version": int(time.time()), "bytes": len(data)}
+
+    def url(self, public_id: str, version) -> str:
+        return f"{self.base_url}/{public_id}?v={version}"
@@ -0,0 +1,170 @@
+import asyncio
+import ssl
+import time
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from src.conf.config import settings
+from src.db.db import shard_engines
+from src.services.admission_service import admission
+from src.services.email_service import mail_client
+from src.services.idempotency_service import idempotency
+
+
+class Check:
+    def __init__(self, name: str, probe: Callable[[], Awaitable], critical: bool = True, uses_pool: bool = False):
+        self.name = name
+        self.probe = probe
+        self.critical = critical
+        self.uses_pool = uses_pool
+
+
+class Health:
+    """
+    Readiness of the worker. The dependency checks run concurrently, each with its own timeout,
+    and their result is cached for cache_seconds, so probes from many orchestrator nodes cost one round of checks.
+    A failing critical check, or a database pool fuller than pool_limit, makes the worker not ready,
+    a failing optional check only marks it degraded. Checks which need a pool connection are skipped
+    while the pool is over the limit, so probes do not queue for connections with the requests.
+    """
+
+    def __init__(self, checks: list[Check], timeout: float = 1, cache_seconds: float = 2, pool_limit: float = 0.8,
+                 pool_usage: Callable[[], float] = lambda: 0.0):
+        self.checks = checks
+        self.timeout = timeout
+        self.cache_seconds = cache_seconds
+        self.pool_limit = pool_limit
+        self.pool_usage = pool_usage
+        self._result: dict | None = None
+        self._checked = 0.0
+        self._running: asyncio.Task | None = None
+
+    async def _run(self, check: Check, saturated: bool) -> dict:
+        started = time.perf_counter()
+        try:
+            if saturated and check.uses_pool:
+                raise RuntimeError("skipped, the pool is over the limit")
+            await asyncio.wait_for(check.probe(), self.timeout)
+        except asyncio.TimeoutError:
+            error = f"timed out after {self.timeout}s"
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        else:
+            error = None
+        result = {"ok": error is None, "critical": check.critical,
+                  "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+        if error:
+            result["error"] = error
+        return result
+
+    async def _check_all(self) -> dict:
+        usage = self.pool_usage()
+        saturated = usage >= self.pool_limit
+        results = await asyncio.gather(*(self._run(check, saturated) for check in self.checks))
+        checks = {check.name: result for check, result in zip(self.checks, results)}
+        ready = not saturated and all(result["ok"] for result in results if result["critical"])
+        degraded = not all(result["ok"] for result in results)
+        status = "ready" if ready and not degraded else "degraded" if ready else "not ready"
+        return {"status": status, "ready": ready, "checks": checks,
+                "pool": {"usage": round(usage, 3), "limit": self.pool_limit}}
+
+    async def readiness(self) -> dict:
+        """
+        The readiness function returns the cached result of the checks, concurrent callers share one round of checks.
+
+        :return: Status, readiness, result of every check and the database pool usage
+        """
+        if self._result is not None and time.monotonic() - self._checked < self.cache_seconds:
+            return self._result
+        if self._running is None:
+            self._running = asyncio.ensure_future(self._check_all())
+        running = self._running
+        try:
+            result = await asyncio.shield(running)
+        finally:
+            if self._running is running and running.done():
+                self._running = None
+        self._result, self._checked = result, time.monotonic()
+        return result
+
+
+def database_probe(engine: Engine) -> Callable[[], Awaitable]:
+    """
+    The database_probe function checks a database with SELECT 1 in a worker thread.
+
+    :param engine: Engine: Engine of the database
+    :return: The probe
+    """
+    def select_one():
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    return lambda: asyncio.to_thread(select_one)
+
+
+async def redis_probe():
+    """
+    The redis_probe function pings the Redis server of the user cache, the limiter and the idempotency keys.
+    The check is optional, while Redis is unavailable the user cache and the limiter use their fallbacks.
+
+    :return: None
+    """
+    await idempotency.c.ping()
+
+
+def mail_tls_context() -> ssl.SSLContext:
+    """
+    The mail_tls_context function builds the TLS context of the mail server, which checks the certificate
+    only with MAIL_VALIDATE_CERTS, like the mail client.
+
+    :return: The context
+    """
+    context = ssl.create_default_context()
+    if not settings.mail_validate_certs:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+async def _smtp_reply(reader: asyncio.StreamReader, code: bytes):
+    while True:
+        line = await reader.readline()
+        if not line.startswith(code):
+            raise ConnectionError(f"Unexpected SMTP reply {line[:80]!r}")
+        if line[3:4] != b"-":
+            return
+
+
+async def smtp_probe():
+    """
+    The smtp_probe function connects to the mail server like the mail client does, with implicit TLS
+    (MAIL_SSL_TLS) or STARTTLS (MAIL_STARTTLS), and reads its greeting,
+    or pings the in-memory sink with MAIL_BACKEND=memory.
+
+    :return: None
+    """
+    if settings.mail_backend == "memory":
+        return await mail_client().ping()
+    context = mail_tls_context()
+    reader, writer = await asyncio.open_connection(settings.mail_server, settings.mail_port,
+                                                   ssl=context if settings.mail_ssl_tls else None)
+    try:
+        await _smtp_reply(reader, b"220")
+        if settings.mail_starttls and not settings.mail_ssl_tls:
+            writer.write(b"EHLO health\r\n")
+            await _smtp_reply(reader, b"250")
+            writer.write(b"STARTTLS\r\n")
+            await _smtp_reply(reader, b"220")
+            await writer.start_tls(context, server_hostname=settings.mail_server)
+        writer.write(b"QUIT\r\n")
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+health = Health([Check(f"db_shard{shard}", database_probe(engine), uses_pool=True) for shard, engine in enumerate(shard_engines)]
+                + [Check("redis", redis_probe, critical=False), Check("smtp", smtp_probe, critical=False)],
+                settings.health_timeout, settings.health_cache_seconds, settings.health_pool_limit,
+                admission.pool_usage)
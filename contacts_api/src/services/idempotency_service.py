@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import json
+import logging
+
+from jose import JWTError, jwt
+from redis.exceptions import RedisError
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from src.conf.config import settings
+from src.services.redis_service import redis_client
+
+HEADER = "Idempotency-Key"
+REPLAYED = "Idempotent-Replayed"
+logger = logging.getLogger(__name__)
+PENDING = "pending"
+DONE = "done"
+# client errors which a retry of the same request gets again, the others (429, 401, 403, 408) may pass later
+STORED_ERRORS = frozenset({400, 404, 409, 412, 422})
+
+
+class Idempotency:
+    """
+    Responses of write requests sent with an Idempotency-Key header, kept in Redis for ttl seconds.
+    A retry with the same key and the same request gets the stored response without running the endpoint,
+    a retry which arrives while the first request still runs waits for its response.
+    Keys are scoped to the user of the bearer token, so users cannot read each other's responses.
+    """
+
+    def __init__(self, ttl: int = settings.idempotency_ttl, lock_ttl: int = 30, wait: float = settings.idempotency_wait,
+                 poll: float = 0.05):
+        self.c = redis_client(name="idempotency")
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait = wait
+        self.poll = poll
+
+    @staticmethod
+    def owner(request: Request) -> str | None:
+        """
+        The owner function returns the user of the verified bearer token of the request.
+
+        :param request: Request: The write request
+        :return: Email of the user, None without a valid access token
+        """
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        try:
+            payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        except JWTError:
+            return None
+        return payload.get("sub") if payload.get("scope") == "access_token" else None
+
+    @staticmethod
+    def fingerprint(request: Request, body: bytes) -> str:
+        """
+        The fingerprint function hashes everything of the request which changes its result.
+
+        :param request: Request: The write request
+        :param body: bytes: Body of the request
+        :return: Hex digest
+        """
+        digest = hashlib.sha256()
+        for part in (request.method, request.url.path, request.url.query):
+            digest.update(part.encode("utf-8") + b"\0")
+        digest.update(body)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _key(owner: str, key: str) -> str:
+        return f"idempotency:{hashlib.sha1(owner.encode('utf-8')).hexdigest()}:{key}"
+
+    async def begin(self, owner: str, key: str, fingerprint: str) -> dict | None:
+        """
+        The begin function claims the key for a new request.
+
+        :param owner: str: User of the request
+        :param key: str: Idempotency key
+        :param fingerprint: str: Fingerprint of the request
+        :return: None when the key is claimed, otherwise the record stored for the key
+        """
+        record = json.dumps({"state": PENDING, "fingerprint": fingerprint})
+        if await self.c.set(self._key(owner, key), record, nx=True, ex=self.lock_ttl):
+            return None
+        return await self.get(owner, key) or {"state": PENDING, "fingerprint": fingerprint}
+
+    async def get(self, owner: str, key: str) -> dict | None:
+        """
+        The get function returns the record stored for the key.
+
+        :param owner: str: User of the request
+        :param key: str: Idempotency key
+        :return: The record, None when the key is unknown or expired
+        """
+        record = await self.c.get(self._key(owner, key))
+        return json.loads(record) if record else None
+
+    async def finish(self, owner: str, key: str, fingerprint: str, status: int, headers: list, body: bytes):
+        """
+        The finish function stores the response of a claimed key. Only successes and the client errors
+        of STORED_ERRORS are stored, any other response releases the key, so a retry runs the request again.
+
+        :param owner: str: User of the request
+        :param key: str: Idempotency key
+        :param fingerprint: str: Fingerprint of the request
+        :param status: int: Status code of the response
+        :param headers: list: Raw headers of the response
+        :param body: bytes: Body of the response
+        :return: None
+        """
+        if not (200 <= status < 300 or status in STORED_ERRORS):
+            await self.release(owner, key)
+            return
+        record = {"state": DONE, "fingerprint": fingerprint, "status": status,
+                  "headers": [(name.decode("latin-1"), value.decode("latin-1")) for name, value in headers],
+                  "body": body.decode("latin-1")}
+        await self.c.set(self._key(owner, key), json.dumps(record), ex=self.ttl)
+
+    async def release(self, owner: str, key: str):
+        """
+        The release function forgets the key after the request failed.
+
+        :param owner: str: User of the request
+        :param key: str: Idempotency key
+        :return: None
+        """
+        await self.c.delete(self._key(owner, key))
+
+    async def wait_done(self, owner: str, key: str) -> dict | None:
+        """
+        The wait_done function waits until the request which claimed the key stores its response.
+
+        :param owner: str: User of the request
+        :param key: str: Idempotency key
+        :return: The stored record, None when the first request failed, expired or runs too long
+        """
+        for _ in range(max(1, int(self.wait / self.poll))):
+            await asyncio.sleep(self.poll)
+            record = await self.get(owner, key)
+            if record is None or record["state"] == DONE:
+                return record
+        return None
+
+    @staticmethod
+    def replay(record: dict) -> Response:
+        """
+        The replay function rebuilds a stored response.
+
+        :param record: dict: Record of the key
+        :return: The response marked as replayed
+        """
+        response = Response(content=record["body"].encode("latin-1"), status_code=record["status"])
+        response.raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]]
+        response.headers[REPLAYED] = "true"
+        return response
+
+
+idempotency = Idempotency()
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware which makes the write requests under the given path prefixes idempotent.
+    It runs before the dependencies of the endpoint, so a replayed response does not touch the database.
+    """
+
+    def __init__(self, app, prefixes: tuple[str, ...], service: Idempotency = idempotency):
+        self.app = app
+        self.prefixes = prefixes
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH", "DELETE") or \
+                not scope["path"].startswith(self.prefixes):
+            return await self.app(scope, receive, send)
+        request = Request(scope, receive)
+        key = request.headers.get(HEADER)
+        if key is None:
+            return await self.app(scope, receive, send)
+        if not 0 < len(key) <= 255:
+            response = JSONResponse(status_code=400, content={"detail": f"{HEADER} must have 1 to 255 characters"})
+            return await response(scope, receive, send)
+        owner = self.service.owner(request)
+        if owner is None:
+            return await self.app(scope, receive, send)
+
+        body = await request.body()
+        fingerprint = self.service.fingerprint(request, body)
+        try:
+            record = await self.service.begin(owner, key, fingerprint)
+        except RedisError as err:
+            # without Redis the request cannot be made idempotent, running it could apply a retry twice
+            logger.warning("Couldn't claim %s: %s", HEADER, err)
+            response = JSONResponse(status_code=503, content={"detail": f"{HEADER} is unavailable, retry later"},
+                                    headers={"Retry-After": str(int(settings.redis_breaker_reset))})
+            return await response(scope, receive, send)
+        if record is not None:
+            response = await self._answer(owner, key, fingerprint, record)
+            return await response(scope, receive, send)
+
+        delivered = False
+
+        async def replay_body():
+            nonlocal delivered
+            if delivered:
+                return await receive()
+            delivered = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        started, chunks = {}, []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                started.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        except BaseException:
+            try:
+                await self.service.release(owner, key)
+            except RedisError as err:
+                logger.warning("Couldn't release %s: %s", HEADER, err)
+            raise
+        try:
+            await self.service.finish(owner, key, fingerprint, started.get("status", 500), started.get("headers", []),
+                                      b"".join(chunks))
+        except RedisError as err:
+            # the response is already sent, the claim expires after lock_ttl
+            logger.warning("Couldn't store the response of %s: %s", HEADER, err)
+
+    async def _answer(self, owner: str, key: str, fingerprint: str, record: dict) -> Response:
+        if record["fingerprint"] != fingerprint:
+            return JSONResponse(status_code=422, content={"detail": f"{HEADER} was already used for a different request"})
+        if record["state"] == PENDING:
+            record = await self.service.wait_done(owner, key)
+        if record is None or record["state"] != DONE:
+            return JSONResponse(status_code=409, content={"detail": f"A request with this {HEADER} is in progress"},
+                                headers={"Retry-After": "1"})
+        return self.service.replay(record)
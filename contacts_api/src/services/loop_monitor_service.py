@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from pathlib import Path
+
+from src.conf.config import settings
+from src.services.metrics_service import LOOP_LAG, LOOP_STALLS, route_name
+
+logger = logging.getLogger(__name__)
+
+PROJECT = str(Path(__file__).resolve().parents[2])
+
+
+class Offender:
+    def __init__(self, route: str, site: str, blocked_in: str):
+        self.route = route
+        self.site = site
+        self.blocked_in = blocked_in
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.stack = ""
+
+    def to_dict(self) -> dict:
+        return {"route": self.route, "site": self.site, "blocked_in": self.blocked_in, "count": self.count,
+                "total_ms": round(self.total * 1000, 1), "worst_ms": round(self.worst * 1000, 1), "stack": self.stack}
+
+
+class LoopMonitor:
+    """
+    Watchdog of the event loop. A heartbeat task sleeps interval seconds in the loop and records how late
+    it wakes up. A thread checks the heartbeat, and when the loop has not come back for threshold seconds
+    it captures the stack of the loop thread while the blocking call still runs. Stalls are grouped by
+    the route of the running request and by the innermost project frame of the stack, the call site.
+    """
+
+    def __init__(self, threshold_ms: float = 100, interval_ms: float = 20, size: int = 200):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.size = size
+        self.offenders: dict[tuple[str, str], Offender] = {}
+        self.routes: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._beat = time.perf_counter()
+        self._stall: tuple[Offender, str] | None = None
+        self._lock = threading.Lock()
+        self._thread_id: int | None = None
+        self._heartbeat: asyncio.Task | None = None
+        self._running = False
+
+    def start(self):
+        """
+        The start function starts the heartbeat in the running loop and the watchdog thread.
+
+        :return: None
+        """
+        if self._running:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._running = True
+        self._heartbeat = self.loop.create_task(self._run_heartbeat())
+        threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+
+    def stop(self):
+        """
+        The stop function stops the heartbeat and the watchdog thread.
+
+        :return: None
+        """
+        self._running = False
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    async def _run_heartbeat(self):
+        while self._running:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - expected, 0)
+            LOOP_LAG.observe(lag)
+            with self._lock:
+                self._beat = time.perf_counter()
+                if self._stall is not None:
+                    self._finish(lag)
+
+    def _watch(self):
+        while self._running:
+            time.sleep(self.threshold / 4)
+            with self._lock:
+                if self._stall is None and time.perf_counter() - self._beat > self.threshold:
+                    self._stall = self._capture()
+
+    def track(self, scope):
+        """
+        The track function remembers the request of the current task, so stalls are reported by route.
+
+        :param scope: ASGI scope of the request
+        :return: None
+        """
+        task = asyncio.current_task()
+        if task is not None:
+            self.routes[task] = scope
+
+    def _route(self) -> str:
+        task = asyncio.current_task(self.loop)
+        scope = self.routes.get(task) if task is not None else None
+        if scope is None:
+            return "background"
+        return f"{scope['method']} {route_name(scope)}"
+
+    def _capture(self) -> tuple[Offender, str] | None:
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return None
+        stack = traceback.extract_stack(frame)
+        own = [entry for entry in stack if entry.filename.startswith(PROJECT) and "site-packages" not in entry.filename]
+        site = own[-1] if own else stack[-1]
+        site = f"{Path(site.filename).relative_to(PROJECT) if own else site.filename}:{site.lineno} in {site.name}"
+        blocked_in = f"{Path(stack[-1].filename).name}:{stack[-1].lineno} in {stack[-1].name}"
+        route = self._route()
+        offender = self.offenders.get((route, site))
+        if offender is None:
+            if len(self.offenders) >= self.size:
+                return None
+            offender = self.offenders[(route, site)] = Offender(route, site, blocked_in)
+        return offender, "".join(traceback.format_list(stack[-15:]))
+
+    def _finish(self, lag: float):
+        offender, stack = self._stall
+        self._stall = None
+        offender.count += 1
+        offender.total += lag
+        offender.worst = max(offender.worst, lag)
+        offender.stack = stack
+        LOOP_STALLS.labels(offender.route).inc()
+        if offender.count == 1:
+            logger.warning("Event loop blocked %.0fms by %s at %s (in %s)\n%s", lag * 1000, offender.route,
+                           offender.site, offender.blocked_in, stack)
+
+    def report(self) -> list[dict]:
+        """
+        The report function returns the call sites which blocked the loop, the longest total first.
+
+        :return: Route, call site, blocking frame, number of stalls, total and worst stall and the last stack
+        """
+        with self._lock:
+            offenders = sorted(self.offenders.values(), key=lambda offender: offender.total, reverse=True)
+            return [offender.to_dict() for offender in offenders]
+
+    def reset(self):
+        """
+        The reset function forgets the recorded stalls.
+
+        :return: None
+        """
+        with self._lock:
+            self.offenders.clear()
+
+
+loop_monitor = LoopMonitor(settings.loop_monitor_threshold_ms)
+
+
+class LoopMonitorMiddleware:
+    """
+    ASGI middleware which tells the loop monitor which request every task serves.
+    """
+
+    def __init__(self, app, monitor: LoopMonitor = loop_monitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            self.monitor.track(scope)
+        await self.app(scope, receive, send)
@@ -0,0 +1,178 @@
+import functools
+import inspect
+import os
+import time
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.responses import Response
+
+# with PROMETHEUS_MULTIPROC_DIR set every uvicorn worker writes its values to files in that directory
+# and /metrics of any worker reports the sum over all of them
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ["method", "route"],
+                    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests in progress", ["method"],
+                    multiprocess_mode="livesum")
+
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections checked out of the pool", ["engine"],
+                         multiprocess_mode="livesum")
+POOL_OVERFLOW = Gauge("db_pool_overflow", "Overflow connections of the pool", ["engine"], multiprocess_mode="livesum")
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool", ["engine"])
+POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time to get a connection from the pool", ["engine"],
+                      buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+
+REDIS_LATENCY = Histogram("redis_command_duration_seconds", "Redis command latency", ["client", "command"],
+                          buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1))
+REDIS_CIRCUIT_OPEN = Gauge("redis_circuit_open", "Workers whose Redis circuit breaker is open or half-open",
+                           multiprocess_mode="livesum")
+REDIS_FALLBACKS = Counter("redis_fallbacks_total", "Redis commands answered by the local fallback", ["client"])
+AUTH_CACHE = Counter("auth_user_cache_total", "User lookups of get_current_user by cache result", ["result"])
+EMAILS = Counter("emails_sent_total", "Emails sent", ["template", "result"])
+AVATAR_UPLOADS = Counter("avatar_uploads_total", "Avatar uploads", ["result"])
+
+ADMISSION_WAITING = Gauge("admission_waiting", "Requests waiting for admission", ["priority"],
+                          multiprocess_mode="livesum")
+LOOP_LAG = Histogram("event_loop_lag_seconds", "Delay of the event loop heartbeat",
+                     buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+LOOP_STALLS = Counter("event_loop_stalls_total", "Event loop stalls longer than the threshold", ["route"])
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Requests rejected by admission control",
+                             ["priority", "reason"])
+
+
+def instrument_engine(engine: Engine, name: str):
+    """
+    The instrument_engine function records the pool metrics of an engine.
+    The checkout wait is the time Engine.raw_connection takes, it includes opening a new connection.
+
+    :param engine: Engine: Engine to instrument
+    :param name: str: Value of the engine label
+    :return: None
+    """
+    raw_connection = engine.raw_connection
+
+    @functools.wraps(raw_connection)
+    def timed_raw_connection(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return raw_connection(*args, **kwargs)
+        finally:
+            POOL_WAIT.labels(name).observe(time.perf_counter() - started)
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKOUTS.labels(name).inc()
+        POOL_CHECKED_OUT.labels(name).inc()
+        if hasattr(engine.pool, "overflow"):
+            POOL_OVERFLOW.labels(name).set(max(engine.pool.overflow(), 0))
+
+    def checkin(dbapi_connection, connection_record):
+        POOL_CHECKED_OUT.labels(name).dec()
+
+    engine.raw_connection = timed_raw_connection
+    event.listen(engine, "checkout", checkout)
+    event.listen(engine, "checkin", checkin)
+
+
+def instrument_redis(client, name: str):
+    """
+    The instrument_redis function records the latency of every command of a sync or asyncio Redis client.
+
+    :param client: Redis client to instrument
+    :param name: str: Value of the client label
+    :return: The client
+    """
+    execute_command = client.execute_command
+    if inspect.iscoroutinefunction(execute_command):
+        @functools.wraps(execute_command)
+        async def timed(*args, **options):
+            started = time.perf_counter()
+            try:
+                return await execute_command(*args, **options)
+            finally:
+                REDIS_LATENCY.labels(name, str(args[0]).upper()).observe(time.perf_counter() - started)
+    else:
+        @functools.wraps(execute_command)
+        def timed(*args, **options):
+            started = time.perf_counter()
+            try:
+                return execute_command(*args, **options)
+            finally:
+                REDIS_LATENCY.labels(name, str(args[0]).upper()).observe(time.perf_counter() - started)
+    client.execute_command = timed
+    return client
+
+
+@functools.lru_cache(maxsize=None)
+def _route_paths(app) -> dict:
+    return {route.endpoint: route.path for route in getattr(app, "routes", ()) if hasattr(route, "endpoint")}
+
+
+def route_name(scope) -> str:
+    """
+    The route_name function returns the path template of the matched route, so ids in paths
+    do not create a time series per contact.
+
+    :param scope: ASGI scope after routing
+    :return: Path template, "unmatched" for requests no route matched
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None or scope.get("app") is None:
+        return "unmatched"
+    return _route_paths(scope["app"]).get(endpoint, "unmatched")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware which records the latency, the status and the requests in progress of every HTTP request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        status = [500]
+
+        async def record_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        IN_PROGRESS.labels(method).inc()
+        try:
+            await self.app(scope, receive, record_status)
+        finally:
+            IN_PROGRESS.labels(method).dec()
+            route = route_name(scope)
+            LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            REQUESTS.labels(method, route, str(status[0])).inc()
+
+
+def metrics_response() -> Response:
+    """
+    The metrics_response function renders the metrics in the Prometheus text format.
+
+    :return: The metrics of this process, or of all workers in multiprocess mode
+    """
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead():
+    """
+    The mark_process_dead function removes the live gauges of a stopping worker in multiprocess mode.
+
+    :return: None
+    """
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
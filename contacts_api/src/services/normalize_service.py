@@ -0,0 +1,93 @@
+import re
+
+from src.conf.config import settings
+
+PHONE_SEPARATORS = re.compile(r"[\s\-().]")
+
+
+def phone_digits(phone: str) -> str:
+    """
+    The phone_digits function drops the formatting characters of a phone number.
+
+    :param phone: str: Phone number as typed by the user
+    :return: The phone number with digits and a leading + only
+    """
+    return PHONE_SEPARATORS.sub("", phone.strip())
+
+
+def normalize_phone(phone: str | None) -> str | None:
+    """
+    The normalize_phone function converts a phone number to the canonical E.164 form.
+    Numbers without a country code get the default one from the settings, a leading trunk 0 is dropped,
+    so 0501112233, 380501112233 and +38 (050) 111-22-33 all become +380501112233.
+
+    :param phone: str | None: Phone number as typed by the user
+    :return: The phone number in E.164 form, None when it has no digits
+    """
+    if phone is None or not re.search(r"\d", phone):
+        return None
+    phone = phone_digits(phone)
+    if phone.startswith("+"):
+        return "+" + re.sub(r"\D", "", phone)
+
+    digits = re.sub(r"\D", "", phone)
+    country_code = str(settings.phone_country_code)
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    if digits.startswith(country_code):
+        return "+" + digits
+    if digits.startswith("0"):
+        digits = digits[1:]
+    return "+" + country_code + digits
+
+
+def normalize_email(email: str | None) -> str | None:
+    """
+    The normalize_email function converts an email to the canonical lowercase form.
+
+    :param email: str | None: Email as typed by the user
+    :return: The stripped lowercase email, None when it is blank
+    """
+    if email is None:
+        return None
+    return email.strip().lower() or None
+
+
+SOUNDEX_CODES = {**dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+                 "l": "4", **dict.fromkeys("mn", "5"), "r": "6"}
+
+
+def soundex(word: str | None) -> str:
+    """
+    The soundex function returns the American Soundex code of a word, e.g. S530 for Smith and Smyth.
+    Letters which are not latin are ignored, an empty word gives an empty code.
+
+    :param word: str | None: Word to encode
+    :return: A four characters code
+    """
+    letters = [letter for letter in (word or "").lower() if "a" <= letter <= "z"]
+    if not letters:
+        return ""
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], "")
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if letter not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def name_key(first_name: str | None, last_name: str | None) -> str | None:
+    """
+    The name_key function builds the phonetic key of a person used to block duplicate candidates.
+
+    :param first_name: str | None: First name
+    :param last_name: str | None: Last name
+    :return: Soundex of the last name and of the first name, None when both are empty
+    """
+    key = soundex(last_name) + soundex(first_name)
+    return key or None
@@ -0,0 +1,240 @@
+import asyncio
+import itertools
+import secrets
+import sys
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+from starlette.datastructures import MutableHeaders
+
+from src.conf.config import settings
+
+PROJECT = Path(__file__).resolve().parents[2]
+
+
+def frame_name(code) -> str:
+    """
+    The frame_name function names a function of a stack as ``name (file:line)``.
+    Project files are relative to the project, other files keep their last two path parts.
+
+    :param code: Code object of the frame
+    :return: Name of the function
+    """
+    path = Path(code.co_filename)
+    try:
+        short = path.relative_to(PROJECT)
+    except ValueError:
+        short = Path(*path.parts[-2:])
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def fold(frame, thread: str) -> str:
+    """
+    The fold function renders a stack in the collapsed format of flame graph tools, the outermost frame first.
+
+    :param frame: Innermost frame of the stack
+    :param thread: str: Name of the thread, the root of the stack
+    :return: Frames separated by semicolons
+    """
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join([thread, *reversed(names)])
+
+
+def collapsed(stacks: Counter) -> str:
+    """
+    The collapsed function renders sampled stacks as ``stack count`` lines, the input of flamegraph.pl and speedscope.
+
+    :param stacks: Counter: Number of samples of every folded stack
+    :return: The collapsed stacks
+    """
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class Sampler:
+    """
+    Sampling CPU profiler. A thread records the stacks of the other threads every interval seconds,
+    the profiled code runs unchanged. With thread_id only that thread is sampled, with task only the samples
+    taken while that asyncio task runs in its loop, which is the profile of one request.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: int | None = None, task: asyncio.Task | None = None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.task = task
+        self.loop = task.get_loop() if task is not None else None
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        """
+        The stop function ends the sampling.
+
+        :return: Number of samples of every folded stack
+        """
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_id is not None and thread_id != self.thread_id):
+                    continue
+                if self.task is not None and asyncio.current_task(self.loop) is not self.task:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                self.stacks[fold(frame, names.get(thread_id, str(thread_id)))] += 1
+
+
+class Profiler:
+    """
+    On-demand profiles of the live worker: CPU profiles of the whole process for some seconds,
+    CPU profiles of single requests, and tracemalloc snapshots with their differences.
+    Nothing runs and tracemalloc stays off until an endpoint asks for it.
+    """
+
+    def __init__(self, keep: int = 20):
+        self.keep = keep
+        self.requests: OrderedDict[str, str] = OrderedDict()
+        self.snapshots: OrderedDict[int, tracemalloc.Snapshot] = OrderedDict()
+        self._numbers = itertools.count(1)
+        self._cpu = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._cpu.locked()
+
+    async def cpu(self, seconds: float, interval: float) -> str:
+        """
+        The cpu function samples every thread of the process for some seconds, the loop keeps serving meanwhile.
+
+        :param seconds: float: Length of the profile
+        :param interval: float: Seconds between samples
+        :return: Collapsed stacks
+        """
+        async with self._cpu:
+            sampler = Sampler(interval).start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stacks = sampler.stop()
+        return collapsed(stacks)
+
+    def store_request(self, stacks: Counter) -> str:
+        """
+        The store_request function keeps the profile of a request for later download.
+
+        :param stacks: Counter: Sampled stacks of the request
+        :return: Id of the profile
+        """
+        profile_id = secrets.token_hex(8)
+        self.requests[profile_id] = collapsed(stacks)
+        while len(self.requests) > self.keep:
+            self.requests.popitem(last=False)
+        return profile_id
+
+    def snapshot(self, frames: int = 25, limit: int = 25) -> dict:
+        """
+        The snapshot function takes a tracemalloc snapshot, the first call starts tracing,
+        so only allocations made after it are seen by later snapshots.
+
+        :param frames: int: Frames stored per allocation when tracing starts
+        :param limit: int: Number of top allocation sites in the result
+        :return: Id of the snapshot, traced memory and the top allocation sites
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        number = next(self._numbers)
+        self.snapshots[number] = snapshot
+        while len(self.snapshots) > self.keep:
+            self.snapshots.popitem(last=False)
+        current, peak = tracemalloc.get_traced_memory()
+        return {"id": number, "traced_bytes": current, "peak_bytes": peak,
+                "top": [{"site": str(stat.traceback), "size": stat.size, "count": stat.count}
+                        for stat in snapshot.statistics("lineno")[:limit]]}
+
+    def diff(self, first: int, second: int, limit: int = 25) -> list[dict]:
+        """
+        The diff function compares two snapshots by allocation site.
+
+        :param first: int: Id of the older snapshot
+        :param second: int: Id of the newer snapshot
+        :param limit: int: Number of sites in the result
+        :return: The sites with the largest growth first
+        :raises KeyError: Unknown snapshot id
+        """
+        stats = self.snapshots[second].compare_to(self.snapshots[first], "lineno")
+        return [{"site": str(stat.traceback), "size_diff": stat.size_diff, "size": stat.size,
+                 "count_diff": stat.count_diff} for stat in stats[:limit]]
+
+    def stop_tracing(self):
+        """
+        The stop_tracing function stops tracemalloc and drops the snapshots.
+
+        :return: None
+        """
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+
+profiler = Profiler()
+
+
+class RequestProfileMiddleware:
+    """
+    ASGI middleware which profiles a single request sent with the X-Profile header and a valid
+    X-Admin-Token header. The profile id is returned in the X-Profile-Id header.
+    Only the event loop part of the request is sampled, sync endpoints and dependencies run in the threadpool.
+    """
+
+    def __init__(self, app, profiler: Profiler = profiler, interval: float = 0.001):
+        self.app = app
+        self.profiler = profiler
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        token = headers.get(b"x-admin-token", b"").decode("latin-1")
+        if b"x-profile" not in headers or not settings.admin_token or \
+                not secrets.compare_digest(token, settings.admin_token):
+            return await self.app(scope, receive, send)
+
+        sampler = Sampler(self.interval, threading.get_ident(), asyncio.current_task()).start()
+        started = []
+
+        async def send_profile_id(message):
+            if message["type"] == "http.response.start":
+                started.append(message)
+                return
+            if started:
+                start = started.pop()
+                MutableHeaders(scope=start).append("X-Profile-Id", self.profiler.store_request(sampler.stop()))
+                await send(start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profile_id)
+        finally:
+            sampler.stop()
@@ -0,0 +1,221 @@
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import redis
+import redis.asyncio
+from fastapi_limiter import FastAPILimiter
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError, TimeoutError as RedisTimeoutError
+
+from src.conf.config import settings
+from src.services.fakes_service import FakeAsyncRedis, FakeRedis, FaultProfile, MemoryStore
+from src.services.metrics_service import REDIS_CIRCUIT_OPEN, REDIS_FALLBACKS
+
+# errors which tell the server is unreachable or too slow, error replies of the server do not count
+FAILURES = (RedisConnectionError, RedisTimeoutError, OSError, asyncio.TimeoutError)
+
+
+def rate_limit(store: MemoryStore, keys: tuple, args: tuple) -> int:
+    """
+    The rate_limit function is the Python version of the Lua script of FastAPILimiter for the fake Redis.
+
+    :param store: MemoryStore: Data of the fake Redis
+    :param keys: tuple: Key of the counter
+    :param args: tuple: Limit and window in milliseconds
+    :return: Milliseconds until the window ends when the limit is reached, else 0
+    """
+    key, (limit, expire) = keys[0], args
+    current = int(store.execute("GET", key) or 0)
+    if current > 0:
+        if current + 1 > int(limit):
+            return store.execute("PTTL", key)
+        store.execute("INCRBY", key)
+        return 0
+    store.execute("SET", key, 1, px=int(expire))
+    return 0
+
+
+class RedisUnavailable(RedisConnectionError):
+    """
+    The command was not sent, because the circuit breaker of the server is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a Redis server. After failures consecutive failed commands the circuit opens
+    and commands fail at once in place of waiting for their timeout. After reset seconds one trial command
+    goes through (half-open), its success closes the circuit and its failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failures: int = 5, reset: float = 5, clock: Callable[[], float] = time.monotonic):
+        self.failures = failures
+        self.reset = reset
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failed = 0
+        self._opened = 0.0
+        self._lock = threading.Lock()
+
+    def _move(self, state: str):
+        if (self.state == self.CLOSED) != (state == self.CLOSED):
+            REDIS_CIRCUIT_OPEN.inc(1 if state != self.CLOSED else -1)
+        self.state = state
+
+    def allow(self) -> bool:
+        """
+        The allow function tells if a command may be sent. In the half-open state one trial is allowed
+        per reset period, so a trial which never reports back does not keep the circuit open forever.
+
+        :return: True when the command may be sent
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.clock() - self._opened < self.reset:
+                return False
+            self._move(self.HALF_OPEN)
+            self._opened = self.clock()
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failed = 0
+            self._move(self.CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self.failed += 1
+            if self.state == self.HALF_OPEN or self.failed >= self.failures:
+                self._move(self.OPEN)
+                self._opened = self.clock()
+
+
+class LocalCache:
+    """
+    Bounded in-process cache with expiry, the least recently used entry is dropped when it is full.
+    """
+
+    def __init__(self, size: int = 10000, ttl: float = 30):
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+def protect(client, breaker: CircuitBreaker, name: str, timeout: float | None = None,
+            fallback: Callable | None = None):
+    """
+    The protect function guards every command of a sync or asyncio Redis client with the circuit breaker.
+    Commands of asyncio clients are also cut after timeout seconds, blocking clients rely on their socket timeout.
+    A command refused by the open circuit or failed to reach the server is answered by the fallback when there is one,
+    otherwise it raises.
+
+    :param client: Redis client to protect
+    :param breaker: CircuitBreaker: Breaker of the server
+    :param name: str: Value of the client label of the fallback metric
+    :param timeout: float | None: Seconds an asyncio command may take
+    :param fallback: Callable | None: Called with the arguments of the command in place of the server
+    :return: The client
+    """
+    execute_command = client.execute_command
+
+    def degrade(args, options, error: Exception):
+        if fallback is None:
+            raise error
+        REDIS_FALLBACKS.labels(name).inc()
+        return fallback(*args, **options)
+
+    if inspect.iscoroutinefunction(execute_command):
+        @functools.wraps(execute_command)
+        async def guarded(*args, **options):
+            if not breaker.allow():
+                return degrade(args, options, RedisUnavailable("Redis circuit breaker is open"))
+            try:
+                result = await asyncio.wait_for(execute_command(*args, **options), timeout)
+            except FAILURES as err:
+                breaker.failure()
+                if isinstance(err, asyncio.TimeoutError):
+                    err = RedisTimeoutError(f"Redis command timed out after {timeout}s")
+                return degrade(args, options, err)
+            except RedisError:
+                breaker.success()
+                raise
+            breaker.success()
+            return result
+    else:
+        @functools.wraps(execute_command)
+        def guarded(*args, **options):
+            if not breaker.allow():
+                return degrade(args, options, RedisUnavailable("Redis circuit breaker is open"))
+            try:
+                result = execute_command(*args, **options)
+            except FAILURES as err:
+                breaker.failure()
+                return degrade(args, options, err)
+            except RedisError:
+                breaker.success()
+                raise
+            breaker.success()
+            return result
+    client.execute_command = guarded
+    return client
+
+
+# one fake server per process, shared by all clients like a real one
+memory_store = MemoryStore()
+memory_store.register_script(FastAPILimiter.lua_script, rate_limit)
+memory_profile = FaultProfile.parse(settings.redis_fake_profile)
+# all clients talk to the same server, so they share the breaker
+redis_breaker = CircuitBreaker(settings.redis_breaker_failures, settings.redis_breaker_reset)
+
+
+def redis_client(sync: bool = False, decode_responses: bool = False, name: str = "redis",
+                 timeout: float | None = settings.redis_timeout, fallback: Callable | None = None):
+    """
+    The redis_client function creates a Redis client for the configured backend: the Redis server,
+    or with REDIS_BACKEND=memory the in-process fake with the latency and faults of REDIS_FAKE_PROFILE.
+    The commands of the client time out after REDIS_TIMEOUT and go through the circuit breaker of the server.
+
+    :param sync: bool: Blocking client in place of an asyncio one
+    :param decode_responses: bool: Return strings in place of bytes
+    :param name: str: Name of the client in the metrics
+    :param timeout: float | None: Seconds a command may take
+    :param fallback: Callable | None: Answers the commands while the server is unavailable
+    :return: The client
+    """
+    if settings.redis_backend == "memory":
+        if sync:
+            client = FakeRedis(memory_store, memory_profile, decode_responses=decode_responses, socket_timeout=timeout)
+        else:
+            client = FakeAsyncRedis(memory_store, memory_profile, decode_responses=decode_responses)
+    elif sync:
+        client = redis.Redis(host=settings.redis_host, port=settings.redis_port, password=settings.redis_password,
+                             decode_responses=decode_responses, socket_timeout=timeout, socket_connect_timeout=timeout)
+    else:
+        # no socket timeout, it would also end the idle reads of pub/sub, the commands are cut by protect
+        client = redis.asyncio.Redis(host=settings.redis_host, port=settings.redis_port,
+                                     password=settings.redis_password, decode_responses=decode_responses,
+                                     socket_connect_timeout=timeout)
+    return protect(client, redis_breaker, name, None if sync else timeout, fallback)
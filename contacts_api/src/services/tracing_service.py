@@ -0,0 +1,341 @@
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import fastapi.routing
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from src.conf.config import settings
+from src.services.metrics_service import route_name
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.error = False
+        self.spans: list[Span] = []
+
+
+class Span:
+    """
+    One timed stage of a trace. Spans are recorded for every trace, the sampling decision is taken
+    when the root span of the trace finishes.
+    """
+
+    def __init__(self, trace: Trace, name: str, parent_id: str | None, attributes: dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error: str | None = None
+        self.start = time.time()
+        self.duration: float | None = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        """
+        The set function adds attributes to the span.
+
+        :param attributes: Attributes of the span
+        :return: None
+        """
+        self.attributes.update(attributes)
+
+    def fail(self, error: BaseException):
+        """
+        The fail function marks the span and its trace as failed.
+
+        :param error: BaseException: The raised exception
+        :return: None
+        """
+        self.error = repr(error)
+        self.trace.error = True
+
+    def end(self, duration: float | None = None):
+        """
+        The end function stops the span, only the first call counts.
+
+        :param duration: float | None: Seconds of the span, measured from its start when None
+        :return: None
+        """
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._started if duration is None else duration
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "name": self.name, "start": self.start, "duration_ms": round((self.duration or 0) * 1000, 3),
+                "attributes": self.attributes, "error": self.error}
+
+
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class InMemoryExporter:
+    """
+    Exporter which keeps the last traces in memory, for tests.
+    """
+
+    def __init__(self, size: int = 1000):
+        self.traces: deque[list[Span]] = deque(maxlen=size)
+
+    def export(self, spans: list[Span]):
+        self.traces.append(spans)
+
+    def clear(self):
+        self.traces.clear()
+
+
+class LoggingExporter:
+    """
+    Exporter which writes every kept trace as one JSON log line.
+    """
+
+    def export(self, spans: list[Span]):
+        logger.info(json.dumps([span.to_dict() for span in spans], default=str))
+
+
+EXPORTERS = {"none": lambda: None, "log": LoggingExporter, "memory": InMemoryExporter}
+
+
+class Tracer:
+    """
+    Tracer of the request path. Any object with an export(spans) method can be the exporter, without one
+    tracing is off and spans cost one context variable lookup.
+
+    Head sampling keeps sample_rate of the traces, or follows the sampled flag of an incoming traceparent header.
+    Tail sampling also keeps every trace slower than tail_latency_ms and, with tail_errors, every failed one.
+    """
+
+    def __init__(self, exporter=None, sample_rate: float = 0.01, tail_latency_ms: float = 500,
+                 tail_errors: bool = True, max_spans: int = 1000):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.tail_latency = tail_latency_ms / 1000
+        self.tail_errors = tail_errors
+        self.max_spans = max_spans
+
+    @staticmethod
+    def _parent(traceparent: str | None) -> tuple[str | None, str | None, bool | None]:
+        parts = (traceparent or "").split("-")
+        if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None, None, None
+        return parts[1], parts[2], parts[3] == "01"
+
+    @contextmanager
+    def trace(self, name: str, traceparent: str | None = None, **attributes):
+        """
+        The trace function opens the root span of a new trace and exports the trace when it is kept.
+
+        :param name: str: Name of the root span
+        :param traceparent: str | None: W3C traceparent header of the caller
+        :param attributes: Attributes of the root span
+        :return: The root span, None when tracing is off
+        """
+        if self.exporter is None:
+            yield None
+            return
+        trace_id, parent_id, sampled = self._parent(traceparent)
+        trace = Trace(trace_id or os.urandom(16).hex(), random.random() < self.sample_rate if sampled is None else sampled)
+        root = Span(trace, name, parent_id, attributes)
+        trace.spans.append(root)
+        token = current_span.set(root)
+        try:
+            yield root
+        except BaseException as error:
+            root.fail(error)
+            raise
+        finally:
+            root.end()
+            current_span.reset(token)
+            self.finish(trace, root)
+
+    def finish(self, trace: Trace, root: Span):
+        """
+        The finish function takes the tail sampling decision and exports a kept trace.
+
+        :param trace: Trace: The finished trace
+        :param root: Span: Root span of the trace
+        :return: None
+        """
+        if not (trace.sampled or (self.tail_errors and trace.error) or root.duration >= self.tail_latency):
+            return
+        try:
+            self.exporter.export(trace.spans)
+        except Exception as error:
+            logger.warning("Trace export failed: %s", error)
+
+    def _child(self, name: str, attributes: dict) -> Span | None:
+        parent = current_span.get()
+        if parent is None or len(parent.trace.spans) >= self.max_spans:
+            return None
+        span = Span(parent.trace, name, parent.span_id, attributes)
+        parent.trace.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        The span function opens a child span of the current span.
+
+        :param name: str: Name of the span
+        :param attributes: Attributes of the span
+        :return: The span, None outside of a trace
+        """
+        span = self._child(name, attributes)
+        if span is None:
+            yield None
+            return
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.fail(error)
+            raise
+        finally:
+            span.end()
+            current_span.reset(token)
+
+    def record(self, name: str, duration: float, **attributes):
+        """
+        The record function adds a finished child span to the current span, for stages timed elsewhere.
+
+        :param name: str: Name of the span
+        :param duration: float: Seconds of the stage, which ended now
+        :param attributes: Attributes of the span
+        :return: None
+        """
+        span = self._child(name, attributes)
+        if span is not None:
+            span.start -= duration
+            span.end(duration)
+
+    def traced(self, name: str):
+        """
+        The traced function decorates a sync or async function with a span around every call.
+
+        :param name: str: Name of the span
+        :return: The decorator
+        """
+        def decorator(function):
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await function(*args, **kwargs)
+            else:
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return function(*args, **kwargs)
+            wrapper.__traced__ = True
+            return wrapper
+        return decorator
+
+    def instrument_engine(self, engine: Engine):
+        """
+        The instrument_engine function adds a span for every statement of the engine.
+
+        :param engine: Engine: Engine to instrument
+        :return: None
+        """
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("trace_started", []).append(time.perf_counter())
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            duration = time.perf_counter() - conn.info["trace_started"].pop()
+            self.record("db.query", duration, statement=statement[:200])
+
+        def failed(context):
+            if context.connection is not None and context.connection.info.get("trace_started"):
+                context.connection.info["trace_started"].pop()
+
+        event.listen(engine, "before_cursor_execute", before)
+        event.listen(engine, "after_cursor_execute", after)
+        event.listen(engine, "handle_error", failed)
+
+    def instrument_redis(self, client, name: str):
+        """
+        The instrument_redis function adds a span for every command of a sync or asyncio Redis client.
+
+        :param client: Redis client to instrument
+        :param name: str: Name of the client
+        :return: The client
+        """
+        execute_command = client.execute_command
+        if inspect.iscoroutinefunction(execute_command):
+            async def traced(*args, **options):
+                with self.span(f"redis.{str(args[0]).lower()}", client=name):
+                    return await execute_command(*args, **options)
+        else:
+            def traced(*args, **options):
+                with self.span(f"redis.{str(args[0]).lower()}", client=name):
+                    return execute_command(*args, **options)
+        client.execute_command = traced
+        return client
+
+    def instrument_fastapi(self):
+        """
+        The instrument_fastapi function adds spans for the stages of FastAPI request handling:
+        solving the dependencies, running the endpoint and serializing its result.
+
+        :return: None
+        """
+        for attribute, name in (("solve_dependencies", "fastapi.dependencies"),
+                                ("run_endpoint_function", "fastapi.endpoint"),
+                                ("serialize_response", "fastapi.serialize")):
+            function = getattr(fastapi.routing, attribute)
+            if not getattr(function, "__traced__", False):
+                setattr(fastapi.routing, attribute, self.traced(name)(function))
+
+
+tracer = Tracer(EXPORTERS[settings.trace_exporter](), settings.trace_sample_rate, settings.trace_tail_latency_ms,
+                settings.trace_tail_errors)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware which opens the root span of every HTTP request. The span ends when the response is sent,
+    background tasks run after that as its children and the trace is exported once they are done.
+    """
+
+    def __init__(self, app, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.tracer.exporter is None:
+            return await self.app(scope, receive, send)
+        traceparent = dict(scope["headers"]).get(b"traceparent", b"").decode("latin-1")
+        with self.tracer.trace(f"{scope['method']} {scope['path']}", traceparent or None,
+                               method=scope["method"], path=scope["path"]) as root:
+            async def traced_send(message):
+                if message["type"] == "http.response.start":
+                    root.set(status=message["status"])
+                    if message["status"] >= 500:
+                        root.trace.error = True
+                    headers = MutableHeaders(scope=message)
+                    flags = "01" if root.trace.sampled else "00"
+                    headers.append("traceparent", f"00-{root.trace.trace_id}-{root.span_id}-{flags}")
+                elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                    root.end()
+                await send(message)
+
+            try:
+                await self.app(scope, receive, traced_send)
+            finally:
+                route = route_name(scope)
+                root.name = f"{scope['method']} {route}"
+                root.set(route=route)
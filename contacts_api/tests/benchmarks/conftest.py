@@ -0,0 +1,75 @@
+"""
+Microbenchmarks of the hot paths, run with pytest-benchmark.
+
+They are skipped by a plain test run. Save a baseline, and compare a later run against it, failing when
+the fastest round regressed, the statistic least disturbed by a busy machine::
+
+    python -m pytest tests/benchmarks --benchmark-only --benchmark-storage=tests/benchmarks/baseline --benchmark-save=baseline
+    python -m pytest tests/benchmarks --benchmark-only --benchmark-storage=tests/benchmarks/baseline \\
+        --benchmark-compare --benchmark-compare-fail=min:25%
+
+The baselines are JSON files, one directory per machine and interpreter.
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db.models import Base, User
+from data import DATASET_CONTACTS, make_contact
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    collect_ignore_glob = ["test_*.py"]
+
+
+def pytest_collection_modifyitems(config, items):
+    """
+    The pytest_collection_modifyitems function skips the benchmarks in a plain test run,
+    they run with --benchmark-only or --benchmark-enable.
+
+    :param config: The pytest config
+    :param items: The collected tests
+    :return: None
+    """
+    if config.getoption("benchmark_only", False) or config.getoption("benchmark_enable", False):
+        return
+    skip = pytest.mark.skip(reason="benchmark, run with --benchmark-only")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip)
+
+@pytest.fixture(scope="session")
+def dataset():
+    """
+    The dataset fixture seeds an in-memory SQLite database: DATASET_CONTACTS contacts of user 1,
+    with repeated names for the duplicate search, and a few contacts of user 2.
+
+    :return: A sessionmaker of the database
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        db.add_all([User(id=1, username="bench", email="bench@mail.com", password="x"),
+                    User(id=2, username="other", email="other@mail.com", password="x")])
+        db.add_all([make_contact(i) for i in range(1, DATASET_CONTACTS + 1)])
+        db.add_all([make_contact(i, owner=2) for i in range(DATASET_CONTACTS + 1, DATASET_CONTACTS + 11)])
+        db.commit()
+    yield Session
+    engine.dispose()
+
+
+@pytest.fixture
+def db(dataset):
+    """
+    The db fixture gives every benchmark a session of the dataset, rolled back afterwards.
+
+    :return: A database session
+    """
+    session = dataset()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
@@ -0,0 +1,28 @@
+import datetime
+
+from src.db.models import Contact
+
+DATASET_CONTACTS = 2_000
+
+
+def run(coroutine):
+    """
+    The run function runs a repository or auth coroutine which does not suspend, without the cost of an event loop.
+
+    :param coroutine: The coroutine
+    :return: Its result
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("the coroutine suspended, run it in an event loop")
+
+
+def make_contact(i: int, owner: int = 1) -> Contact:
+    now = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=i)
+    return Contact(id=i, first_name=f"name{i % 300}", last_name=f"surname{i % 700}",
+                   birthday=datetime.datetime(1990, i % 12 + 1, i % 28 + 1), email=f"contact{i}@mail.com",
+                   phone=f"38050{i:07d}", favorite=i % 5 == 0, created_at=now, updated_at=now,
+                   contact_owner_id=owner, change_seq=i)
@@ -0,0 +1,75 @@
+import datetime
+import json
+import pickle
+
+import pytest
+from jose import jwt
+
+from src.db.models import User
+from src.services.auth import auth_service
+from data import run
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def cached_user() -> User:
+    return User(id=1, username="michail", email="michail_mayers@main.com", password=auth_service.get_password_hash("x"),
+                registration_date=datetime.datetime(2024, 1, 1, 12, 30), refresh_token=None, confirmed=True,
+                avatar="https://res.cloudinary.com/demo/image/upload/v1/avatars/0123456789", contacts_version=42)
+
+
+def user_columns(user: User) -> dict:
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+def user_from_json(columns: dict) -> User:
+    columns["registration_date"] = datetime.datetime.fromisoformat(columns["registration_date"])
+    return User(**columns)
+
+
+# How get_current_user could store the user: encode on a cache miss, decode on every hit.
+ENCODINGS = {
+    "pickle-orm": (pickle.dumps, pickle.loads),
+    "pickle-columns": (lambda user: pickle.dumps(user_columns(user)), lambda data: User(**pickle.loads(data))),
+    "json-columns": (lambda user: json.dumps(user_columns(user), default=str),
+                     lambda data: user_from_json(json.loads(data))),
+}
+if orjson is not None:
+    ENCODINGS["orjson-columns"] = (lambda user: orjson.dumps(user_columns(user)),
+                                   lambda data: user_from_json(orjson.loads(data)))
+
+
+def test_jwt_encode(benchmark):
+    token = benchmark(lambda: run(auth_service.create_access_token(data={"sub": "michail_mayers@main.com"})))
+    assert token.count(".") == 2
+
+
+def test_jwt_decode(benchmark):
+    token = run(auth_service.create_access_token(data={"sub": "michail_mayers@main.com"}))
+    payload = benchmark(jwt.decode, token, auth_service.SECRET_KEY, algorithms=[auth_service.ALGORITHM])
+    assert payload["sub"] == "michail_mayers@main.com"
+
+
+def test_bcrypt_verify(benchmark):
+    password = auth_service.get_password_hash("qwerty123")
+    assert benchmark(auth_service.verify_password, "qwerty123", password)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_user_cache_decode(benchmark, encoding):
+    dumps, loads = ENCODINGS[encoding]
+    data = dumps(cached_user())
+    benchmark.extra_info["bytes"] = len(data)
+    user = benchmark(loads, data)
+    assert user.email == "michail_mayers@main.com"
+    assert user.registration_date == datetime.datetime(2024, 1, 1, 12, 30)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_user_cache_encode(benchmark, encoding):
+    dumps, _ = ENCODINGS[encoding]
+    user = cached_user()
+    benchmark.extra_info["bytes"] = len(benchmark(dumps, user))
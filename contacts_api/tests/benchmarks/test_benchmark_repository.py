@@ -0,0 +1,32 @@
+import pytest
+
+from src.repository import contacts, stats, users
+from data import DATASET_CONTACTS, run
+
+# Every read query of the repository against the seeded dataset, the queries of user 1 see DATASET_CONTACTS rows.
+QUERIES = {
+    "get_contacts": lambda db: contacts.get_contacts(1, db),
+    "get_contact_rows": lambda db: contacts.get_contact_rows(1, db),
+    "get_contact_rows id,phone": lambda db: contacts.get_contact_rows(1, db, ("id", "phone")),
+    "get_contact_by_id": lambda db: contacts.get_contact_by_id(DATASET_CONTACTS // 2, 1, db),
+    "get_contacts_by_ids": lambda db: contacts.get_contacts_by_ids(list(range(1, 101)), 1, db),
+    "get_contacts_by_phone": lambda db: contacts.get_contacts_by_phone(1, "+380 50 000 1000", db),
+    "get_contacts_by_email": lambda db: contacts.get_contacts_by_email(1, "Contact1000@mail.com", db),
+    "get_contacts_version": lambda db: contacts.get_contacts_version(1, db),
+    "get_contact_version": lambda db: contacts.get_contact_version(DATASET_CONTACTS // 2, 1, db),
+    "get_changes": lambda db: contacts.get_changes(1, DATASET_CONTACTS - 500, 100, db),
+    "search_contacts": lambda db: contacts.search_contacts(1, "name12 surname", 20, db),
+    "find_duplicates": lambda db: contacts.find_duplicates(1, db),
+    "get_stats": lambda db: stats.get_stats(1, db),
+    "get_user_by_email": lambda db: users.get_user_by_email("bench@mail.com", db),
+}
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_repository_query(benchmark, db, query):
+    def execute():
+        result = run(QUERIES[query](db))
+        db.expunge_all()
+        return result
+
+    assert benchmark(execute) is not None
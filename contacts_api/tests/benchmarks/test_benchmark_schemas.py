@@ -0,0 +1,25 @@
+from typing import List
+
+import pytest
+from pydantic import TypeAdapter
+
+from src.schemas.contacts_schema import ContactModel, ContactResponse
+from data import make_contact
+
+CONTACT = {"first_name": "michael", "last_name": "mayers", "birthday": "2000-01-01",
+           "email": "michael@mail.com", "phone": "+380 (50) 111-22-33", "favorite": True}
+
+contact_list = TypeAdapter(List[ContactResponse])
+
+
+def test_contact_model_validation(benchmark):
+    contact = benchmark(ContactModel.model_validate, CONTACT)
+    assert contact.email == "michael@mail.com"
+
+
+@pytest.mark.parametrize("rows", [1_000, 10_000])
+def test_contact_response_serialization(benchmark, rows):
+    contacts = [make_contact(i) for i in range(1, rows + 1)]
+    # what FastAPI does with the result of a list endpoint: validate it from the ORM rows, render it as JSON
+    body = benchmark(lambda: contact_list.dump_json(contact_list.validate_python(contacts, from_attributes=True)))
+    benchmark.extra_info["bytes"] = len(body)
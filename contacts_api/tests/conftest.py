@@ -1,8 +1,15 @@
+import os
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+# the suite runs offline, Redis, the mail server and Cloudinary are replaced by the in-memory fakes
+os.environ.setdefault("REDIS_BACKEND", "memory")
+os.environ.setdefault("MAIL_BACKEND", "memory")
+os.environ.setdefault("IMAGE_BACKEND", "filesystem")
+os.environ.setdefault("IMAGE_DIR", "test_media")
 
 from main import app
 from src.db.models import Base
@@ -0,0 +1,64 @@
+import unittest
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from src.db.models import Base, Contact, User
+from src.db.profiler import QueryProfile, QueryProfiler, SQLProfilerMiddleware, current_profile
+
+
+class TestQueryProfile(unittest.TestCase):
+    def test_server_timing_flags_repeated_shapes(self):
+        profile = QueryProfile()
+        profile.add("SELECT a", 0.002)
+        for _ in range(3):
+            profile.add("SELECT b WHERE id = ?", 0.001)
+        self.assertEqual(profile.repeated(3), [("SELECT b WHERE id = ?", 3)])
+        self.assertEqual(profile.server_timing(4), 'db;dur=5.0;desc="4 queries"')
+        self.assertEqual(profile.server_timing(3), 'db;dur=5.0;desc="4 queries", '
+                                                   'db-repeated;desc="1 shapes, 3 runs of the most repeated"')
+
+
+class TestQueryProfiler(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=self.engine)
+        QueryProfiler(slow_ms=0).instrument(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add(User(id=1, username="a", email="a@mail.com", password="x"))
+        for i in range(3):
+            self.session.add(Contact(first_name="a", last_name="b", email=f"c{i}@mail.com", phone=f"3805011122{i}",
+                                     contact_owner_id=1))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_queries_per_row_share_a_shape(self):
+        profile = QueryProfile()
+        token = current_profile.set(profile)
+        try:
+            for contact in self.session.scalars(select(Contact)).all():
+                self.session.execute(select(User.username).where(User.id == contact.contact_owner_id)).scalar()
+        finally:
+            current_profile.reset(token)
+        self.assertEqual(profile.count, 4)
+        shape, runs = profile.repeated(3)[0]
+        self.assertEqual(runs, 3)
+        self.assertIn("FROM users", shape)
+
+    async def test_middleware_sets_server_timing(self):
+        app = FastAPI()
+
+        @app.get("/api/contacts/")
+        async def contacts():
+            return [contact.id for contact in self.session.scalars(select(Contact))]
+
+        app.add_middleware(SQLProfilerMiddleware, threshold=5)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/api/contacts/")
+        self.assertEqual(response.json(), [1, 2, 3])
+        self.assertRegex(response.headers["Server-Timing"], r'^db;dur=[0-9.]+;desc="1 queries"$')
+        self.assertIsNone(current_profile.get())
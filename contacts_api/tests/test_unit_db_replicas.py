@@ -0,0 +1,124 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from src.db.db import ShardedSession
+from src.db.models import Base, User
+from src.db.replicas import ReplicaSet
+from src.services.fakes_service import FakeRedis, FaultProfile, MemoryStore
+
+
+class TestReplicaSet(unittest.TestCase):
+    def setUp(self):
+        self.engines = [create_engine("sqlite://") for _ in range(2)]
+        self.replicas = ReplicaSet(self.engines, max_lag=5)
+        self.replicas.start = MagicMock()
+
+    def test_replicas_join_rotation_after_check(self):
+        self.assertIsNone(self.replicas.pick())
+        self.replicas.check()
+        self.assertEqual([self.replicas.pick() for _ in range(3)], [self.engines[0], self.engines[1], self.engines[0]])
+
+    def test_failing_and_lagging_replicas_leave_rotation(self):
+        with patch.object(ReplicaSet, "measure_lag", side_effect=[ConnectionError(), 1.0]):
+            self.replicas.check()
+        self.assertEqual([self.replicas.pick() for _ in range(2)], [self.engines[1]] * 2)
+        with patch.object(ReplicaSet, "measure_lag", side_effect=[0.5, 10.0]):
+            self.replicas.check()
+        self.assertEqual(self.replicas.pick(), self.engines[0])
+
+    def test_least_lag(self):
+        replicas = ReplicaSet(self.engines, strategy="least_lag")
+        replicas.start = MagicMock()
+        with patch.object(ReplicaSet, "measure_lag", side_effect=[2.0, 0.5]):
+            replicas.check()
+        self.assertEqual([replicas.pick() for _ in range(2)], [self.engines[1]] * 2)
+
+    def test_pinned_user_reads_primary(self):
+        self.replicas.check()
+        self.replicas.pin(7)
+        self.assertIsNone(self.replicas.pick(7))
+        self.assertIsNotNone(self.replicas.pick(8))
+
+    def test_pins_are_shared_between_workers(self):
+        store = MemoryStore()
+        workers = [ReplicaSet(self.engines, max_lag=5, store=FakeRedis(store)) for _ in range(2)]
+        for replicas in workers:
+            replicas.start = MagicMock()
+            replicas.check()
+        workers[0].pin(7)
+        self.assertIsNone(workers[1].pick(7))
+        self.assertIsNotNone(workers[1].pick(8))
+
+    def test_unavailable_store_keeps_local_pins(self):
+        replicas = ReplicaSet(self.engines, store=FakeRedis(profile=FaultProfile(error_rate=1)))
+        replicas.start = MagicMock()
+        replicas.check()
+        replicas.pin(7)
+        self.assertIsNone(replicas.pick(7))
+        self.assertIsNotNone(replicas.pick(8))
+
+
+class TestReplicaRouting(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.primary = create_engine(f"sqlite:///{os.path.join(self.folder.name, 'primary.db')}")
+        self.replica = create_engine(f"sqlite:///{os.path.join(self.folder.name, 'replica.db')}")
+        self.addCleanup(lambda: [engine.dispose() for engine in (self.primary, self.replica)])
+        for engine, username in ((self.primary, "primary"), (self.replica, "replica")):
+            Base.metadata.create_all(bind=engine)
+            with sessionmaker(bind=engine)() as db:
+                db.add(User(id=1, username=username, email="a@mail.com", password="x"))
+                db.commit()
+        self.replicas = ReplicaSet([self.replica])
+        self.replicas.start = MagicMock()
+        self.replicas.check()
+        self.sessions = sessionmaker(class_=ShardedSession, shards=[self.primary], replicas=[self.replicas])
+
+    def username(self, db):
+        return db.execute(select(User.username).where(User.id == 1)).scalar()
+
+    def test_plain_session_reads_primary(self):
+        with self.sessions() as db:
+            self.assertEqual(self.username(db), "primary")
+
+    def test_read_session_reads_replica_until_write(self):
+        with self.sessions(info={"replica": True, "user_id": 1}) as db:
+            self.assertEqual(self.username(db), "replica")
+            db.add(User(id=2, username="new", email="b@mail.com", password="x"))
+            db.flush()
+            self.assertEqual(self.username(db), "primary")
+            db.commit()
+        with self.sessions(info={"replica": True, "user_id": 1}) as db:
+            self.assertEqual(self.username(db), "primary")
+        with self.sessions(info={"replica": True, "user_id": 2}) as db:
+            self.assertEqual(self.username(db), "replica")
+
+    def test_read_session_stays_on_one_replica(self):
+        other = create_engine(f"sqlite:///{os.path.join(self.folder.name, 'other.db')}")
+        self.addCleanup(other.dispose)
+        Base.metadata.create_all(bind=other)
+        with sessionmaker(bind=other)() as db:
+            db.add(User(id=1, username="other", email="a@mail.com", password="x"))
+            db.commit()
+        replicas = ReplicaSet([self.replica, other])
+        replicas.start = MagicMock()
+        replicas.check()
+        sessions = sessionmaker(class_=ShardedSession, shards=[self.primary], replicas=[replicas])
+        with sessions(info={"replica": True}) as db:
+            self.assertEqual({self.username(db) for _ in range(4)}, {"replica"})
+        with sessions(info={"replica": True}) as db:
+            self.assertEqual({self.username(db) for _ in range(4)}, {"other"})
+
+    def test_locking_read_goes_to_primary(self):
+        with self.sessions(info={"replica": True}) as db:
+            self.assertEqual(db.execute(select(User.username).with_for_update()).scalar(), "primary")
+
+
+if __name__ == '__main__':
+    unittest.main()
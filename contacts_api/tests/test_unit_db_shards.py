@@ -0,0 +1,88 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from src.db.db import ShardedSession
+from src.db.models import Base, Contact, ContactTombstone, DirectoryBase, User
+from src.db.shards import ShardDirectory, UserMoving
+from src.jobs.reshard import move_user
+from src.repository.contacts import get_changes
+from src.repository.users import create_user, get_user_by_email
+from src.schemas.users_schema import UserModel
+
+
+class TestShards(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        directory = create_engine(f"sqlite:///{os.path.join(self.folder.name, 'directory.db')}")
+        DirectoryBase.metadata.create_all(bind=directory)
+        self.shards = [create_engine(f"sqlite:///{os.path.join(self.folder.name, f'shard{i}.db')}") for i in range(3)]
+        for shard in self.shards:
+            Base.metadata.create_all(bind=shard)
+        self.addCleanup(lambda: [engine.dispose() for engine in [directory, *self.shards]])
+        self.directory = ShardDirectory(directory, self.shards, ttl=60)
+        self.sessions = sessionmaker(class_=ShardedSession, shards=self.shards)
+        for target in ("src.repository.users.shard_directory", "src.jobs.reshard.shard_directory"):
+            patcher = patch(target, self.directory)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def signup(self, number):
+        with self.sessions() as db:
+            body = UserModel(username=f"user{number}", email=f"user{number}@mail.com", password="password")
+            return (await create_user(body, db)).id
+
+    def rows(self, shard, model):
+        with self.sessions(info={"shard": shard}) as db:
+            return db.execute(select(func.count()).select_from(model)).scalar()
+
+    async def test_users_are_placed_by_id(self):
+        ids = [await self.signup(number) for number in range(4)]
+        self.assertEqual(ids, [1, 2, 3, 4])
+        self.assertEqual([self.rows(shard, User) for shard in range(3)], [1, 2, 1])
+
+    async def test_get_user_by_email_routes_session(self):
+        await self.signup(0)
+        user_id = await self.signup(1)
+        with self.sessions() as db:
+            user = await get_user_by_email("user1@mail.com", db)
+            self.assertEqual(user.id, user_id)
+            self.assertEqual(db.info["shard"], 2)
+            self.assertIsNone(await get_user_by_email("unknown@mail.com", db))
+
+    async def test_moving_user_is_rejected(self):
+        user_id = await self.signup(0)
+        self.directory.set(user_id, moving=True)
+        with self.sessions() as db:
+            with self.assertRaises(UserMoving):
+                await get_user_by_email("user0@mail.com", db)
+
+    async def test_move_user(self):
+        user_id = await self.signup(0)
+        with self.sessions(info={"shard": 1}) as db:
+            db.add(Contact(first_name="Ann", last_name="Lee", email="ann@mail.com", phone="380501112233",
+                           birthday=datetime.datetime(2000, 1, 1), contact_owner_id=user_id))
+            db.commit()
+        with patch("src.jobs.reshard.DBSession", self.sessions):
+            self.assertEqual(move_user(user_id, 1, 2, drain=0), 1)
+
+        self.assertEqual([self.rows(shard, Contact) for shard in range(3)], [0, 0, 1])
+        self.assertEqual(self.rows(1, User), 0)
+        with self.sessions() as db:
+            user = await get_user_by_email("user0@mail.com", db)
+            self.assertEqual(db.info["shard"], 2)
+            changed, deleted, cursor, _ = await get_changes(user_id, 0, 10, db)
+            self.assertEqual(len(changed), 1)
+            self.assertEqual(cursor, user.contacts_version)
+            self.assertEqual(len(deleted), 1)
+            self.assertEqual(db.execute(select(func.count()).select_from(ContactTombstone)).scalar(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
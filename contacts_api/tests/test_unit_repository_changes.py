@@ -0,0 +1,56 @@
+import datetime
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+from src.db.models import Base, User, Contact, ContactTombstone
+from src.repository.contacts import get_changes_window, prune_tombstones, remove_contact
+from src.routes.contacts import get_changes
+
+
+class TestTombstoneRetention(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+        self.user = User(id=1, username="a", email="a@mail.com", password="x", contacts_version=3)
+        self.session.add(self.user)
+        for i in range(3):
+            self.session.add(Contact(first_name="a", last_name="b", email=f"a{i}@b.com", phone=f"38050777000{i}",
+                                     contact_owner_id=1, change_seq=i + 1))
+        self.session.commit()
+        patcher = patch("src.repository.contacts.contact_events.publish", AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.session.close()
+
+    async def test_old_tombstones_are_pruned(self):
+        for contact_id in (1, 2):
+            await remove_contact(contact_id=contact_id, user_id=1, db=self.session)
+        self.session.execute(update(ContactTombstone).where(ContactTombstone.contact_id == 1)
+                             .values(deleted_at=datetime.datetime(2000, 1, 1)))
+        self.session.commit()
+        self.assertEqual(await prune_tombstones(datetime.timedelta(days=30), self.session), 1)
+        self.assertEqual([tombstone.contact_id for tombstone in self.session.query(ContactTombstone)], [2])
+        self.assertEqual(tuple(await get_changes_window(user_id=1, db=self.session)), (4, 5))
+        self.assertEqual(await prune_tombstones(datetime.timedelta(days=30), self.session), 0)
+
+    async def test_cursor_before_horizon_is_gone(self):
+        self.session.execute(update(User).values(tombstone_horizon=2))
+        self.session.commit()
+        with self.assertRaises(HTTPException) as error:
+            await get_changes(since=1, limit=10, db=self.session, current_user=self.user)
+        self.assertEqual(error.exception.status_code, 410)
+        changes = await get_changes(since=2, limit=10, db=self.session, current_user=self.user)
+        self.assertEqual([contact.id for contact in changes["contacts"]], [3])
+        changes = await get_changes(since=0, limit=10, db=self.session, current_user=self.user)
+        self.assertEqual(len(changes["contacts"]), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
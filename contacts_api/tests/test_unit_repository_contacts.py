@@ -1,10 +1,10 @@
 import datetime
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock, patch
 
 from sqlalchemy.orm import Session
 
-from src.db.models import User, Contact
+from src.db.models import User, Contact, ContactTombstone
 from src.schemas.contacts_schema import ContactModel
 from src.repository.contacts import (
     get_contacts,
@@ -12,6 +12,11 @@ from src.repository.contacts import (
     get_contact_by_id,
     update_contact,
     remove_contact,
+    get_contacts_version,
+    get_contact_version,
+    get_changes,
+    get_contacts_by_phone,
+    get_contacts_by_email,
 )
 
 
@@ -29,6 +34,10 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.session = MagicMock(spec=Session)
         self.user = User(id=1)
+        self.publish = AsyncMock()
+        patcher = patch("src.repository.contacts.contact_events.publish", self.publish)
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact()]
@@ -36,6 +45,22 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         result = await get_contacts(user_id=self.user.id, db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_by_phone(self):
+        contacts = [Contact()]
+        self.session.query().filter().all.return_value = contacts
+        result = await get_contacts_by_phone(user_id=self.user.id, phone="+38 (050) 111-22-33", db=self.session)
+        self.assertEqual(result, contacts)
+
+    async def test_get_contacts_by_email(self):
+        self.session.query().filter().all.return_value = []
+        result = await get_contacts_by_email(user_id=self.user.id, email="Michael@Mail.com", db=self.session)
+        self.assertEqual(result, [])
+
+    async def test_blank_phone_or_email_matches_nothing(self):
+        self.session.query().filter().all.return_value = [Contact()]
+        self.assertEqual(await get_contacts_by_phone(user_id=self.user.id, phone=" ", db=self.session), [])
+        self.assertEqual(await get_contacts_by_email(user_id=self.user.id, email=None, db=self.session), [])
+
     async def test_create_contact(self):
         body = contact_model
         result = await create_contact(user_id=self.user.id, body=body, db=self.session)
@@ -57,17 +82,22 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertIsNone(result)
 
     async def test_update_contact(self):
-        contact = contact_model
+        contact = Contact()
         self.session.query().filter().first.return_value = contact
         self.session.commit.return_value = None
-        result = await update_contact(contact_id=1, user_id=self.user.id, body=contact, db=self.session)
+        self.session.execute().scalar.return_value = 5
+        result = await update_contact(contact_id=1, user_id=self.user.id, body=contact_model, db=self.session)
         self.assertEqual(result, contact)
+        self.assertEqual(result.first_name, contact_model.first_name)
+        self.assertEqual(result.change_seq, 5)
+        self.publish.assert_awaited_once_with(self.user.id, "updated", 1, 5)
 
     async def test_update_contact_not_found(self):
         contact = contact_model
         self.session.query().filter().first.return_value = None
         result = await update_contact(contact_id=1, user_id=self.user.id, body=contact, db=self.session)
         self.assertIsNone(result)
+        self.publish.assert_not_awaited()
 
     async def test_remove_contact(self):
         contact = Contact()
@@ -75,11 +105,60 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         result = await remove_contact(contact_id=1, user_id=self.user.id, db=self.session)
         self.assertEqual(result, contact)
 
+    async def test_remove_contact_adds_tombstone(self):
+        contact = Contact(id=7)
+        self.session.query().filter().first.return_value = contact
+        self.session.execute().scalar.return_value = 9
+        await remove_contact(contact_id=7, user_id=self.user.id, db=self.session)
+        tombstone = self.session.add.call_args.args[0]
+        self.assertIsInstance(tombstone, ContactTombstone)
+        self.assertEqual(tombstone.contact_id, 7)
+        self.assertEqual(tombstone.change_seq, 9)
+        self.session.delete.assert_called_once_with(contact)
+        self.publish.assert_awaited_once_with(self.user.id, "deleted", 7, 9)
+
     async def test_remove_not_found(self):
         self.session.query().filter().first.return_value = None
         result = await remove_contact(contact_id=1, user_id=self.user.id, db=self.session)
         self.assertIsNone(result)
 
+    async def test_get_contacts_version(self):
+        self.session.execute().scalar.return_value = 3
+        result = await get_contacts_version(user_id=self.user.id, db=self.session)
+        self.assertEqual(result, 3)
+
+    async def test_get_contact_version(self):
+        self.session.execute().scalar.return_value = 5
+        result = await get_contact_version(contact_id=1, user_id=self.user.id, db=self.session)
+        self.assertEqual(result, 5)
+
+    async def test_create_contact_bumps_version(self):
+        self.session.execute.reset_mock()
+        await create_contact(user_id=self.user.id, body=contact_model, db=self.session)
+        statement = self.session.execute.call_args_list[0].args[0]
+        self.assertEqual(statement.table.name, "users")
+        self.session.commit.assert_called_once()
+
+    async def test_get_changes(self):
+        contacts = [Contact(id=1, change_seq=2), Contact(id=2, change_seq=4)]
+        self.session.execute().scalars().all.return_value = contacts
+        self.session.execute().all.return_value = [(3, 5)]
+        changed, deleted, cursor, has_more = await get_changes(user_id=self.user.id, since=1, limit=10, db=self.session)
+        self.assertEqual(changed, contacts)
+        self.assertEqual(deleted, [5])
+        self.assertEqual(cursor, 4)
+        self.assertFalse(has_more)
+
+    async def test_get_changes_paginated(self):
+        contacts = [Contact(id=1, change_seq=2), Contact(id=2, change_seq=4)]
+        self.session.execute().scalars().all.return_value = contacts
+        self.session.execute().all.return_value = [(3, 5)]
+        changed, deleted, cursor, has_more = await get_changes(user_id=self.user.id, since=1, limit=2, db=self.session)
+        self.assertEqual(changed, contacts[:1])
+        self.assertEqual(deleted, [5])
+        self.assertEqual(cursor, 3)
+        self.assertTrue(has_more)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
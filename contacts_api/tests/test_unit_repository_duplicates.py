@@ -0,0 +1,84 @@
+import datetime
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from src.db.models import Base, User, Contact, ContactTombstone
+from src.jobs.backfill_canonical import CANONICAL_INDEXES
+from src.repository.contacts import find_duplicates, merge_contacts
+from src.services.dedupe_service import Candidate, DisjointSet, score
+
+
+def candidate(contact_id, first_name, last_name, email=None, phone=None, birthday=None):
+    return Candidate("", contact_id, first_name, last_name, email, phone, birthday)
+
+
+class TestDedupeService(unittest.TestCase):
+    def test_score_same_person(self):
+        first = candidate(1, "John", "Smith", "john@mail.com", "+380501112233")
+        second = candidate(2, "Jon", "Smyth", "john@gmail.com", "+380501112233")
+        self.assertGreater(score(first, second), 0.6)
+
+    def test_score_shared_phone(self):
+        first = candidate(1, "John", "Smith", "john@mail.com", "+380501112233")
+        second = candidate(2, "Mary", "Brown", "mary@mail.com", "+380501112233")
+        self.assertLess(score(first, second), 0.6)
+
+    def test_disjoint_set(self):
+        duplicates = DisjointSet()
+        duplicates.union(3, 2, 0.7)
+        duplicates.union(2, 1, 0.9)
+        duplicates.union(5, 6, 0.8)
+        self.assertEqual(duplicates.groups(), [([1, 2, 3], 0.9), ([5, 6], 0.8)])
+
+
+class TestDuplicates(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+        # duplicates with the same canonical phone exist only in databases created before the unique indexes
+        for name in CANONICAL_INDEXES:
+            self.session.execute(text(f"DROP INDEX {name}"))
+        self.session.add_all([User(id=1, username="a", email="a@mail.com", password="x"),
+                              User(id=2, username="b", email="b@mail.com", password="x")])
+        rows = [(1, "John", "Smith", "john.smith@mail.com", "0501112233", False),
+                (1, "Jon", "Smyth", "john.smith@gmail.com", "0661112233", True),
+                (1, "Mary", "Brown", "mary@mail.com", "380501112234", False),
+                (1, "Marie", "Brown", "marie@mail.com", "+38 050 111 22 34", False),
+                (1, "Peter", "Parker", "peter@mail.com", "0931112233", False),
+                (2, "John", "Smith", "js@mail.com", "0631112233", False)]
+        for owner, first_name, last_name, email, phone, favorite in rows:
+            self.session.add(Contact(first_name=first_name, last_name=last_name, email=email, phone=phone,
+                                     birthday=datetime.datetime(2000, 1, 1), favorite=favorite,
+                                     contact_owner_id=owner))
+        self.session.commit()
+        patcher = patch("src.repository.contacts.contact_events.publish", AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.session.close()
+
+    async def test_find_duplicates(self):
+        groups = await find_duplicates(user_id=1, db=self.session)
+        self.assertEqual([ids for ids, _ in groups], [[1, 2], [3, 4]])
+
+    async def test_merge_contacts(self):
+        contact = await merge_contacts(user_id=1, keep_id=1, merge_ids=[2], db=self.session)
+        self.assertTrue(contact.favorite)
+        self.assertIsNone(self.session.get(Contact, 2))
+        tombstone = self.session.query(ContactTombstone).one()
+        self.assertEqual(tombstone.contact_id, 2)
+        self.assertLess(tombstone.change_seq, contact.change_seq)
+        self.assertEqual(await find_duplicates(user_id=1, db=self.session), [([3, 4], unittest.mock.ANY)])
+
+    async def test_merge_contacts_not_found(self):
+        self.assertIsNone(await merge_contacts(user_id=1, keep_id=1, merge_ids=[6], db=self.session))
+        self.assertIsNotNone(self.session.get(Contact, 6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db.models import Base, User, Contact
+from src.repository.contacts import CONTACT_FIELDS, contact_fields, get_contact_rows
+
+
+class TestContactFields(unittest.TestCase):
+    def test_empty_selects_all_fields(self):
+        self.assertEqual(contact_fields(None), CONTACT_FIELDS)
+        self.assertEqual(contact_fields(""), CONTACT_FIELDS)
+
+    def test_fields_follow_response_order(self):
+        self.assertEqual(contact_fields(" phone,id ,first_name,phone"), ("id", "first_name", "phone"))
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError) as context:
+            contact_fields("id,password,contact_owner_id")
+        self.assertIn("contact_owner_id, password", str(context.exception))
+
+
+class TestGetContactRows(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+        self.session.add_all([User(id=1, username="a", email="a@mail.com", password="x"),
+                              User(id=2, username="b", email="b@mail.com", password="x")])
+        for i, owner in ((2, 1), (1, 1), (3, 2)):
+            self.session.add(Contact(id=i, first_name=f"first{i}", last_name="last", email=f"c{i}@mail.com",
+                                     phone=f"38050111223{i}", contact_owner_id=owner))
+        self.session.commit()
+        self.session.expunge_all()
+
+    def tearDown(self):
+        self.session.close()
+
+    async def test_rows_of_the_owner_with_all_fields(self):
+        rows = await get_contact_rows(user_id=1, db=self.session)
+        self.assertEqual([row.id for row in rows], [1, 2])
+        self.assertEqual(tuple(rows[0]._fields), CONTACT_FIELDS)
+        self.assertEqual(rows[0].first_name, "first1")
+
+    async def test_projection_creates_no_orm_instances(self):
+        rows = await get_contact_rows(user_id=1, db=self.session, fields=("id", "phone"))
+        self.assertEqual([tuple(row) for row in rows], [(1, "380501112231"), (2, "380501112232")])
+        self.assertEqual(len(self.session.identity_map), 0)
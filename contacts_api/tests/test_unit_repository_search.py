@@ -0,0 +1,67 @@
+import datetime
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db.models import Base, User, Contact
+from src.db.search import search_terms, pg_prefix_query, fts5_prefix_query
+from src.repository.contacts import search_contacts
+
+
+class TestSearchQueries(unittest.TestCase):
+    def test_search_terms(self):
+        self.assertEqual(search_terms('Ali "Smi*'), ['ali', 'smi'])
+        self.assertEqual(search_terms('!!'), [])
+
+    def test_pg_prefix_query(self):
+        self.assertEqual(pg_prefix_query(['ali', 'smi']), 'ali:* & smi:*')
+
+    def test_fts5_prefix_query(self):
+        self.assertEqual(fts5_prefix_query(3, ['ali']),
+                         'contact_owner_id : "3" AND {first_name last_name email phone} : ("ali"*)')
+
+
+class TestSearchContacts(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+        self.session.add_all([User(id=1, username="a", email="a@mail.com", password="x"),
+                              User(id=2, username="b", email="b@mail.com", password="x")])
+        for i, (owner, first_name, last_name) in enumerate([(1, "Alice", "Smith"), (1, "Bob", "Alison"),
+                                                             (1, "Carl", "Jones"), (2, "Alina", "Smirnova")]):
+            self.session.add(Contact(first_name=first_name, last_name=last_name, birthday=datetime.datetime(2000, 1, 1),
+                                     email=f"{first_name.lower()}@mail.com", phone=f"38050111223{i}",
+                                     favorite=False, contact_owner_id=owner))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    async def test_search_prefix(self):
+        result = await search_contacts(user_id=1, query="ali", limit=10, db=self.session)
+        self.assertEqual({contact.first_name for contact in result}, {"Alice", "Bob"})
+
+    async def test_search_all_terms(self):
+        result = await search_contacts(user_id=1, query="ali smi", limit=10, db=self.session)
+        self.assertEqual([contact.first_name for contact in result], ["Alice"])
+
+    async def test_search_phone_and_limit(self):
+        result = await search_contacts(user_id=1, query="38050", limit=2, db=self.session)
+        self.assertEqual(len(result), 2)
+
+    async def test_search_follows_updates(self):
+        contact = self.session.query(Contact).filter_by(first_name="Carl").first()
+        contact.first_name = "Alfred"
+        self.session.commit()
+        result = await search_contacts(user_id=1, query="alf", limit=10, db=self.session)
+        self.assertEqual([contact.first_name for contact in result], ["Alfred"])
+
+    async def test_search_empty(self):
+        self.assertEqual(await search_contacts(user_id=1, query="!!", limit=10, db=self.session), [])
+        self.assertEqual(await search_contacts(user_id=1, query="zzz", limit=10, db=self.session), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
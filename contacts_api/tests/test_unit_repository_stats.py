@@ -0,0 +1,127 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db.models import Base, User, Contact, ContactCounter
+from src.schemas.contacts_schema import ContactModel
+from src.repository import contacts as repository_contacts
+from src.repository.contacts import ContactChanged, create_contact, get_contact_version, update_contact, remove_contact
+from src.repository.stats import ContactsQuotaExceeded, get_stats, reconcile_stats, reserve_contact
+
+
+def contact_model(i, favorite=False, month=1):
+    return ContactModel(first_name="michael", last_name="mayers", birthday=datetime.date(2000, month, 1),
+                        email=f"michael{i}@mail.com", phone=f"38050111223{i}", favorite=favorite)
+
+
+class TestStats(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+        self.session.add(User(id=1, username="a", email="a@mail.com", password="x"))
+        self.session.commit()
+        patcher = patch("src.repository.contacts.contact_events.publish", AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.session.close()
+
+    async def test_counters_follow_writes(self):
+        await create_contact(user_id=1, body=contact_model(1, favorite=True, month=3), db=self.session)
+        await create_contact(user_id=1, body=contact_model(2, month=3), db=self.session)
+        await update_contact(contact_id=2, user_id=1, body=contact_model(2, favorite=True, month=4), db=self.session)
+        await remove_contact(contact_id=1, user_id=1, db=self.session)
+        counters = await get_stats(user_id=1, db=self.session)
+        self.assertEqual(counters, {"total": 1, "favorites": 1, "birthday_03": 0, "birthday_04": 1})
+
+    async def test_get_stats_reconciles_missing_counters(self):
+        self.session.add(Contact(first_name="a", last_name="b", email="a@b.com", phone="380501112233",
+                                 birthday=datetime.datetime(2000, 5, 1), favorite=True, contact_owner_id=1))
+        self.session.commit()
+        counters = await get_stats(user_id=1, db=self.session)
+        self.assertEqual(counters, {"total": 1, "favorites": 1, "birthday_05": 1})
+        self.assertEqual(self.session.query(ContactCounter).count(), 3)
+
+    async def test_first_write_reconciles_missing_counters(self):
+        for i in range(2):
+            self.session.add(Contact(first_name="a", last_name="b", email=f"a{i}@b.com", phone=f"38050999000{i}",
+                                     birthday=datetime.datetime(2000, 5, 1), contact_owner_id=1))
+        self.session.commit()
+        await update_contact(contact_id=1, user_id=1, body=contact_model(1, favorite=True, month=5), db=self.session)
+        await remove_contact(contact_id=2, user_id=1, db=self.session)
+        counters = await get_stats(user_id=1, db=self.session)
+        self.assertEqual(counters, {"total": 1, "favorites": 1, "birthday_05": 1})
+
+    async def test_stale_version_is_rejected(self):
+        contact = await create_contact(user_id=1, body=contact_model(1), db=self.session)
+        version = await get_contact_version(contact_id=contact.id, user_id=1, db=self.session)
+        await update_contact(contact_id=contact.id, user_id=1, body=contact_model(1, favorite=True), db=self.session,
+                             version=version)
+        with self.assertRaises(ContactChanged):
+            await update_contact(contact_id=contact.id, user_id=1, body=contact_model(1, month=7), db=self.session,
+                                 version=version)
+        with self.assertRaises(ContactChanged):
+            await remove_contact(contact_id=contact.id, user_id=1, db=self.session, version=version)
+        stored = self.session.get(Contact, contact.id)
+        self.assertEqual((stored.favorite, stored.birthday.month), (True, 1))
+        self.assertEqual(await get_stats(user_id=1, db=self.session), {"total": 1, "favorites": 1, "birthday_01": 1})
+        current = await get_contact_version(contact_id=contact.id, user_id=1, db=self.session)
+        await remove_contact(contact_id=contact.id, user_id=1, db=self.session, version=current)
+        self.assertEqual(self.session.query(Contact).count(), 0)
+
+    async def test_concurrent_update_is_counted_once(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        engine = create_engine(f"sqlite:///{os.path.join(folder.name, 'stats.db')}")
+        self.addCleanup(engine.dispose)
+        Base.metadata.create_all(bind=engine)
+        sessions = sessionmaker(bind=engine)
+        with sessions() as db:
+            db.add(User(id=1, username="a", email="a@mail.com", password="x"))
+            db.commit()
+            contact = await create_contact(user_id=1, body=contact_model(1), db=db)
+        load = repository_contacts.get_contact_by_id
+
+        async def load_then_other_update(contact_id, user_id, db):
+            stale = await load(contact_id, user_id, db)
+            with patch("src.repository.contacts.get_contact_by_id", load), sessions() as other:
+                await update_contact(contact_id, user_id, contact_model(1, favorite=True), other)
+            return stale
+
+        with patch("src.repository.contacts.get_contact_by_id", load_then_other_update), sessions() as db:
+            await update_contact(contact.id, 1, contact_model(1, favorite=True), db)
+        with sessions() as db:
+            self.assertEqual((await get_stats(user_id=1, db=db))["favorites"], 1)
+
+    async def test_reconcile_fixes_drift(self):
+        await create_contact(user_id=1, body=contact_model(1), db=self.session)
+        self.session.query(ContactCounter).filter_by(name="total").update({"value": 10})
+        counters = await reconcile_stats(user_id=1, db=self.session)
+        self.assertEqual(counters["total"], 1)
+
+    async def test_quota(self):
+        with patch("src.repository.contacts.settings.contacts_quota", 2):
+            await create_contact(user_id=1, body=contact_model(1), db=self.session)
+            await create_contact(user_id=1, body=contact_model(2), db=self.session)
+            with self.assertRaises(ContactsQuotaExceeded):
+                await create_contact(user_id=1, body=contact_model(3), db=self.session)
+        self.assertEqual(self.session.query(Contact).count(), 2)
+        self.assertEqual((await get_stats(user_id=1, db=self.session))["total"], 2)
+
+    async def test_reserve_contact_without_counters(self):
+        self.session.add(Contact(first_name="a", last_name="b", email="a@b.com", phone="380501112233",
+                                 contact_owner_id=1))
+        self.session.commit()
+        with self.assertRaises(ContactsQuotaExceeded):
+            await reserve_contact(user_id=1, quota=1, db=self.session)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+
+import httpx
+from fastapi import FastAPI
+
+from src.services.admission_service import Admission, AdmissionMiddleware, Gate, DEADLINE, QUEUE_FULL, SATURATED
+
+
+def engine(checked_out, size=5, overflow=10):
+    pool = MagicMock()
+    pool.size.return_value = size
+    pool.checkedout.return_value = checked_out
+    pool._max_overflow = overflow
+    return MagicMock(pool=pool)
+
+
+class TestGate(unittest.IsolatedAsyncioTestCase):
+    async def test_waiters_get_released_slots(self):
+        gate = Gate("list", limit=1, deadline=1, queue=5)
+        self.assertIsNone(await gate.acquire())
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(gate.waiting, 1)
+        gate.release()
+        self.assertIsNone(await waiter)
+        self.assertEqual((gate.in_flight, gate.waiting, gate.admitted), (1, 0, 2))
+
+    async def test_deadline_and_full_queue(self):
+        gate = Gate("list", limit=1, deadline=0.05, queue=1)
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        self.assertEqual(await gate.acquire(), QUEUE_FULL)
+        self.assertEqual(await waiter, DEADLINE)
+        self.assertEqual(gate.rejected, {QUEUE_FULL: 1, DEADLINE: 1})
+
+
+class TestAdmission(unittest.IsolatedAsyncioTestCase):
+    def test_classify(self):
+        classify = Admission.classify
+        self.assertEqual(classify("POST", "/api/auth/login"), "auth")
+        self.assertEqual(classify("GET", "/api/contacts/"), "list")
+        self.assertEqual(classify("PUT", "/api/contacts/1"), "write")
+        self.assertEqual(classify("GET", "/api/contacts/duplicates"), "export")
+        self.assertIsNone(classify("GET", "/api/contacts/events"))
+        self.assertIsNone(classify("GET", "/"))
+
+    def test_limits_need_every_class(self):
+        with self.assertRaises(ValueError):
+            Admission("auth:1,list:1", 1, 1)
+
+    async def test_saturated_pool_sheds_lower_classes(self):
+        admission = Admission("auth:5,write:5,list:5,export:5:0.5", 2, 10, [engine(0), engine(12)])
+        self.assertEqual(admission.pool_usage(), 0.8)
+        self.assertEqual(await admission.admit("export"), SATURATED)
+        self.assertIsNone(await admission.admit("list"))
+        admission.engines = [engine(15)]
+        self.assertEqual(await admission.admit("write"), SATURATED)
+        self.assertIsNone(await admission.admit("auth"))
+        snapshot = admission.snapshot()
+        self.assertEqual(snapshot["classes"]["export"]["rejected"], {SATURATED: 1})
+        self.assertEqual(snapshot["classes"]["auth"]["in_flight"], 1)
+
+    async def test_middleware_rejects_with_retry_after(self):
+        app = FastAPI()
+        release = asyncio.Event()
+
+        @app.get("/api/contacts/")
+        async def slow():
+            await release.wait()
+            return []
+
+        admission = Admission("auth:1,write:1,list:1:0.05,export:1", 2, 10)
+        app.add_middleware(AdmissionMiddleware, admission=admission)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = asyncio.create_task(client.get("/api/contacts/"))
+            await asyncio.sleep(0.01)
+            rejected = await client.get("/api/contacts/")
+            release.set()
+            self.assertEqual((await first).status_code, 200)
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(rejected.headers["Retry-After"], "1")
+        self.assertEqual(admission.gates["list"].in_flight, 0)
@@ -0,0 +1,97 @@
+import os
+import pickle
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import sessionmaker
+
+from src.db.db import ShardedSession
+from src.db.models import Base, User
+from src.services.auth import auth_service
+from src.services.fakes_service import FakeRedis, FaultProfile
+from src.services.redis_service import CircuitBreaker, LocalCache, protect
+
+
+class UserDatabase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.folder.name, 'auth.db')}")
+        self.addCleanup(self.engine.dispose)
+        Base.metadata.create_all(bind=self.engine)
+        self.sessions = sessionmaker(class_=ShardedSession, shards=[self.engine])
+        with self.sessions() as db:
+            db.add(User(id=1, username="a", email="a@mail.com", password="x"))
+            db.commit()
+
+    async def current_user(self, db):
+        token = await auth_service.create_access_token(data={"sub": "a@mail.com"})
+        return await auth_service.get_current_user(token, db)
+
+
+class TestGetCurrentUser(UserDatabase):
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(auth_service, "c", MagicMock())
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_cache_miss_releases_connection(self):
+        self.cache.get.return_value = None
+        with self.sessions() as db:
+            user = await self.current_user(db)
+            self.assertEqual(self.engine.pool.checkedout(), 0)
+            self.assertEqual(user.email, "a@mail.com")
+            self.assertEqual(db.info["user_id"], 1)
+        self.assertEqual(pickle.loads(self.cache.set.call_args.args[1]).id, 1)
+
+    async def test_cache_hit_does_not_query(self):
+        self.cache.get.return_value = pickle.dumps(User(id=1, username="a", email="a@mail.com", password="x"))
+        checkouts = MagicMock()
+        event.listen(self.engine, "checkout", checkouts)
+        with self.sessions() as db:
+            user = await self.current_user(db)
+            self.assertEqual(user.id, 1)
+        checkouts.assert_not_called()
+
+    async def test_stream_user_keeps_no_session(self):
+        self.cache.get.return_value = None
+        token = await auth_service.create_access_token(data={"sub": "a@mail.com"})
+        with patch("src.services.auth.DBSession", self.sessions):
+            user = await auth_service.get_stream_user(token)
+        self.assertEqual(user.id, 1)
+        self.assertTrue(inspect(user).detached)
+        self.assertEqual(self.engine.pool.checkedout(), 0)
+
+
+class TestCacheFallback(UserDatabase):
+    def setUp(self):
+        super().setUp()
+        self.checkouts = MagicMock()
+        event.listen(self.engine, "checkout", self.checkouts)
+        patcher = patch.object(auth_service, "c", protect(FakeRedis(profile=FaultProfile(error_rate=1)),
+                                                          CircuitBreaker(failures=1), "auth"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(auth_service, "local_cache", LocalCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_local_cache_while_redis_is_down(self):
+        for _ in range(3):
+            with self.sessions() as db:
+                self.assertEqual((await self.current_user(db)).id, 1)
+        self.assertEqual(self.checkouts.call_count, 1)
+
+    async def test_database_fallback(self):
+        with patch("src.services.auth.settings.auth_cache_fallback", "db"):
+            for _ in range(2):
+                with self.sessions() as db:
+                    self.assertEqual((await self.current_user(db)).id, 1)
+        self.assertEqual(self.checkouts.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
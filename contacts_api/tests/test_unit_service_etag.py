@@ -0,0 +1,60 @@
+import unittest
+from unittest.mock import MagicMock
+
+from fastapi import HTTPException
+
+from src.services.etag_service import etag_service
+
+
+def make_request(headers: dict):
+    request = MagicMock()
+    request.headers = {key.lower(): value for key, value in headers.items()}
+    return request
+
+
+class TestETag(unittest.TestCase):
+    def setUp(self):
+        self.etag = etag_service.for_contact(1, 7)
+
+    def test_collection_etag_depends_on_version(self):
+        self.assertNotEqual(etag_service.for_collection(1, 1), etag_service.for_collection(1, 2))
+        self.assertEqual(etag_service.for_collection(1, 1, None, None), etag_service.for_collection(1, 1, None, None))
+
+    def test_collection_etag_depends_on_query(self):
+        self.assertNotEqual(etag_service.for_collection(1, 1, 'first_name', 'bob'),
+                            etag_service.for_collection(1, 1, 'first_name', 'alice'))
+
+    def test_contact_etag_depends_on_version(self):
+        self.assertNotEqual(self.etag, etag_service.for_contact(1, 8))
+        self.assertNotEqual(self.etag, etag_service.for_contact(2, 7))
+
+    def test_not_modified(self):
+        response = etag_service.not_modified(make_request({"If-None-Match": f'"other", {self.etag}'}), self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], self.etag)
+
+    def test_not_modified_weak(self):
+        response = etag_service.not_modified(make_request({"If-None-Match": f'W/{self.etag}'}), self.etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified(self):
+        self.assertIsNone(etag_service.not_modified(make_request({"If-None-Match": '"other"'}), self.etag))
+        self.assertIsNone(etag_service.not_modified(make_request({}), self.etag))
+
+    def test_if_match(self):
+        etag_service.check_if_match(make_request({}), self.etag)
+        etag_service.check_if_match(make_request({"If-Match": self.etag}), self.etag)
+        etag_service.check_if_match(make_request({"If-Match": "*"}), self.etag)
+
+    def test_if_match_failed(self):
+        with self.assertRaises(HTTPException) as error:
+            etag_service.check_if_match(make_request({"If-Match": '"other"'}), self.etag)
+        self.assertEqual(error.exception.status_code, 412)
+
+    def test_if_match_weak_never_matches(self):
+        with self.assertRaises(HTTPException):
+            etag_service.check_if_match(make_request({"If-Match": f'W/{self.etag}'}), self.etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
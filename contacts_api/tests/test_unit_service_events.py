@@ -0,0 +1,74 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.services.events_service import ContactEvents, Subscriber
+from src.services.fakes_service import FakeAsyncRedis
+
+
+class TestSubscriber(unittest.IsolatedAsyncioTestCase):
+    async def test_push(self):
+        subscriber = Subscriber(user_id=1, maxsize=2)
+        subscriber.push('{"op":"created","id":1,"seq":1}')
+        self.assertEqual(subscriber.queue.qsize(), 1)
+        self.assertFalse(subscriber.overflowed)
+
+    async def test_push_overflow(self):
+        subscriber = Subscriber(user_id=1, maxsize=2)
+        for seq in range(3):
+            subscriber.push(json.dumps({"op": "created", "id": 1, "seq": seq}))
+        self.assertTrue(subscriber.overflowed)
+        self.assertEqual(subscriber.queue.qsize(), 1)
+        self.assertEqual(json.loads(subscriber.queue.get_nowait()), {"op": "resync"})
+        subscriber.push(json.dumps({"op": "created", "id": 1, "seq": 4}))
+        self.assertTrue(subscriber.queue.empty())
+
+
+class TestContactEvents(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.events = ContactEvents()
+        self.events._reader = MagicMock()
+
+    async def test_stream(self):
+        subscriber = self.events.subscribe(1)
+        subscriber.push('{"op":"updated","id":3,"seq":7}')
+        subscriber.push('{"op":"resync"}')
+
+        frames = [frame async for frame in self.events.stream(subscriber)]
+        self.assertEqual(frames[1], 'id: 7\nevent: contact\ndata: {"op":"updated","id":3,"seq":7}\n\n')
+        self.assertTrue(frames[2].startswith("event: resync"))
+        self.assertNotIn(1, self.events._subscribers)
+
+    async def test_stream_heartbeat(self):
+        subscriber = self.events.subscribe(1)
+        with patch("src.services.events_service.settings.events_heartbeat", 0.01):
+            stream = self.events.stream(subscriber)
+            await stream.__anext__()
+            self.assertEqual(await stream.__anext__(), ": ping\n\n")
+            await stream.aclose()
+        self.assertNotIn(1, self.events._subscribers)
+
+
+class TestReader(unittest.IsolatedAsyncioTestCase):
+    async def test_resubscribe_keeps_one_reader(self):
+        events = ContactEvents()
+        events._redis = FakeAsyncRedis(decode_responses=True)
+        subscriber = events.subscribe(1)
+        await asyncio.sleep(0.01)
+        events.unsubscribe(subscriber)
+        first = events.subscribe(1)
+        await asyncio.sleep(0.01)
+        second = events.subscribe(1)
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(events._redis.store.pubsubs), 1)
+        await events.publish(1, "created", 1, 1)
+        for subscriber in (first, second):
+            self.assertEqual(await asyncio.wait_for(subscriber.queue.get(), 1), '{"op":"created","id":1,"seq":1}')
+            self.assertTrue(subscriber.queue.empty())
+        events.unsubscribe(first)
+        events.unsubscribe(second)
+
+
+if __name__ == '__main__':
+    unittest.main()
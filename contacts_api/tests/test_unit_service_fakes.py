@@ -0,0 +1,116 @@
+import asyncio
+import io
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import httpx
+from fastapi import Depends, FastAPI
+from fastapi_limiter import FastAPILimiter
+from fastapi_limiter.depends import RateLimiter
+from prometheus_client import REGISTRY
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.services.email_service import send_email
+from src.services.events_service import ContactEvents
+from src.services.fakes_service import FakeAsyncRedis, FakeRedis, FaultProfile, FilesystemImages, MailSink, MemoryStore
+from src.services.metrics_service import instrument_redis
+from src.services.redis_service import memory_store, redis_client
+
+
+class TestFaultProfile(unittest.IsolatedAsyncioTestCase):
+    def test_parse(self):
+        profile = FaultProfile.parse("latency_ms=5, jitter_ms=2,error_rate=0.5,seed=1")
+        self.assertEqual((profile.latency_ms, profile.jitter_ms, profile.error_rate), (5, 2, 0.5))
+        self.assertEqual(FaultProfile.parse("").delay(), 0)
+        with self.assertRaises(ValueError):
+            FaultProfile.parse("latency=5")
+
+    async def test_latency_and_failures(self):
+        client = FakeAsyncRedis(profile=FaultProfile(latency_ms=30))
+        started = time.perf_counter()
+        await client.ping()
+        self.assertGreaterEqual(time.perf_counter() - started, 0.03)
+        client.profile = FaultProfile(error_rate=1)
+        with self.assertRaises(RedisConnectionError):
+            await client.get("key")
+        with self.assertRaises(RedisConnectionError):
+            FakeRedis(profile=FaultProfile(error_rate=1)).get("key")
+
+
+class TestFakeRedis(unittest.IsolatedAsyncioTestCase):
+    async def test_strings_with_expiry(self):
+        client = FakeAsyncRedis()
+        self.assertTrue(await client.set("key", "value", nx=True, px=50))
+        self.assertIsNone(await client.set("key", "other", nx=True))
+        self.assertEqual(await client.get("key"), b"value")
+        self.assertGreater(await client.pttl("key"), 0)
+        await asyncio.sleep(0.06)
+        self.assertIsNone(await client.get("key"))
+        self.assertEqual(await client.incr("counter"), 1)
+        self.assertEqual(await client.delete("counter", "missing"), 1)
+
+    def test_sync_client_shares_the_store(self):
+        store = MemoryStore()
+        FakeRedis(store).set("user:a", b"\x80pickled")
+        self.assertEqual(FakeRedis(store).get("user:a"), b"\x80pickled")
+        self.assertEqual(FakeRedis(store, decode_responses=True).get("missing"), None)
+
+    async def test_instrumentation_sees_fake_commands(self):
+        client = instrument_redis(FakeAsyncRedis(), "fake")
+        await client.get("key")
+        self.assertGreater(REGISTRY.get_sample_value("redis_command_duration_seconds_count",
+                                                     {"client": "fake", "command": "GET"}), 0)
+
+    async def test_rate_limiter_script(self):
+        app = FastAPI()
+
+        @app.get("/limited", dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+        async def limited():
+            return {}
+
+        previous = FastAPILimiter.redis, FastAPILimiter.lua_sha
+        with patch("src.services.redis_service.settings.redis_backend", "memory"):
+            await FastAPILimiter.init(redis_client(decode_responses=True))
+        self.addCleanup(memory_store.data.clear)
+        self.addCleanup(setattr, FastAPILimiter, "lua_sha", previous[1])
+        self.addCleanup(setattr, FastAPILimiter, "redis", previous[0])
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            statuses = [(await client.get("/limited")).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    async def test_contact_events_over_fake_pubsub(self):
+        events = ContactEvents()
+        events._redis = FakeAsyncRedis(decode_responses=True)
+        subscriber = events.subscribe(7)
+        await asyncio.sleep(0.01)
+        await events.publish(7, "created", 1, 5)
+        await events.publish(8, "created", 2, 6)
+        self.assertEqual(await asyncio.wait_for(subscriber.queue.get(), 1), '{"op":"created","id":1,"seq":5}')
+        self.assertTrue(subscriber.queue.empty())
+        events.unsubscribe(subscriber)
+
+
+class TestMailSink(unittest.IsolatedAsyncioTestCase):
+    async def test_send_email_to_sink(self):
+        sink = MailSink()
+        with patch("src.services.email_service.mail_client", return_value=sink):
+            await send_email("a@mail.com", "michail", "http://test/")
+            sink.profile = FaultProfile(error_rate=1)
+            await send_email("b@mail.com", "michail", "http://test/")
+        self.assertEqual(len(sink.outbox), 1)
+        self.assertEqual(sink.outbox[0]["recipients"], ["a@mail.com"])
+        self.assertEqual(sink.outbox[0]["template"], "email_template.html")
+
+
+class TestFilesystemImages(unittest.TestCase):
+    def test_upload_and_url(self):
+        with tempfile.TemporaryDirectory() as directory:
+            images = FilesystemImages(directory, "/media/")
+            result = images.upload(io.BytesIO(b"png"), "avatars/0123456789")
+            self.assertEqual(images.path("avatars/0123456789").read_bytes(), b"png")
+            self.assertEqual(images.url("avatars/0123456789", result["version"]),
+                             f"/media/avatars/0123456789?v={result['version']}")
+            with self.assertRaises(ValueError):
+                images.upload(io.BytesIO(b"png"), "../outside")
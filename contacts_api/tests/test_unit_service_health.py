@@ -0,0 +1,107 @@
+import asyncio
+import shutil
+import ssl
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import create_engine
+
+from src.services.health_service import Check, Health, database_probe, smtp_probe
+
+
+class TestHealth(unittest.IsolatedAsyncioTestCase):
+    async def test_ready_and_degraded(self):
+        smtp = AsyncMock(side_effect=ConnectionRefusedError("refused"))
+        health = Health([Check("db", database_probe(create_engine("sqlite://")), uses_pool=True),
+                         Check("smtp", smtp, critical=False)])
+        result = await health.readiness()
+        self.assertEqual(result["status"], "degraded")
+        self.assertTrue(result["ready"])
+        self.assertTrue(result["checks"]["db"]["ok"])
+        self.assertEqual(result["checks"]["smtp"]["error"], "ConnectionRefusedError: refused")
+
+    async def test_timeout_of_critical_check(self):
+        async def hang():
+            await asyncio.sleep(10)
+
+        health = Health([Check("redis", hang)], timeout=0.01)
+        result = await health.readiness()
+        self.assertEqual(result["status"], "not ready")
+        self.assertIn("timed out", result["checks"]["redis"]["error"])
+
+    async def test_checks_run_once_per_cache_window(self):
+        probe = AsyncMock()
+        health = Health([Check("redis", probe)], cache_seconds=60)
+        results = await asyncio.gather(*(health.readiness() for _ in range(10)))
+        await health.readiness()
+        self.assertEqual(probe.await_count, 1)
+        self.assertTrue(all(result["ready"] for result in results))
+
+    async def test_saturated_pool_skips_database_checks(self):
+        probe = AsyncMock()
+        health = Health([Check("db", probe, uses_pool=True)], pool_limit=0.8, pool_usage=lambda: 0.9)
+        result = await health.readiness()
+        self.assertEqual(result["status"], "not ready")
+        self.assertEqual(result["pool"], {"usage": 0.9, "limit": 0.8})
+        probe.assert_not_awaited()
+
+
+@unittest.skipIf(shutil.which("openssl") is None, "openssl is needed for the test certificate")
+class TestSmtpProbe(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cert, key = Path(cls.folder.name) / "cert.pem", Path(cls.folder.name) / "key.pem"
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                        "-keyout", str(key), "-out", str(cert)], check=True, capture_output=True)
+        cls.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        cls.context.load_cert_chain(cert, key)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder.cleanup()
+
+    async def serve(self, handler, tls: bool, client_tls: bool | None = None, starttls: bool = False):
+        server = await asyncio.start_server(handler, "127.0.0.1", 0, ssl=self.context if tls else None)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        for name, value in (("mail_backend", "smtp"), ("mail_server", "127.0.0.1"),
+                            ("mail_port", server.sockets[0].getsockname()[1]), ("mail_ssl_tls", tls if client_tls is None else client_tls),
+                            ("mail_starttls", starttls)):
+            patcher = patch(f"src.services.health_service.settings.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    async def greet(reader, writer):
+        writer.write(b"220 test ESMTP\r\n")
+        await reader.readline()
+        writer.close()
+
+    async def test_implicit_tls(self):
+        await self.serve(self.greet, tls=True)
+        await asyncio.wait_for(smtp_probe(), 2)
+
+    async def test_plaintext_server_fails_the_tls_probe(self):
+        await self.serve(self.greet, tls=False, client_tls=True)
+        with self.assertRaises((ssl.SSLError, ConnectionError)):
+            await asyncio.wait_for(smtp_probe(), 2)
+
+    async def test_starttls(self):
+        async def handler(reader, writer):
+            writer.write(b"220 test ESMTP\r\n")
+            await reader.readline()
+            writer.write(b"250-test\r\n250 STARTTLS\r\n")
+            await reader.readline()
+            writer.write(b"220 ready\r\n")
+            await writer.drain()
+            await writer.start_tls(self.context)
+            await reader.readline()
+            writer.close()
+
+        await self.serve(handler, tls=False, starttls=True)
+        await asyncio.wait_for(smtp_probe(), 2)
+
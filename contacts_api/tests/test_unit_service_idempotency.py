@@ -0,0 +1,106 @@
+import asyncio
+import unittest
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+from src.services.auth import auth_service
+from src.services.idempotency_service import Idempotency, IdempotencyMiddleware
+
+
+class MemoryRedis(dict):
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self:
+            return None
+        self[key] = value
+        return True
+
+    async def get(self, key):
+        return super().get(key)
+
+    async def delete(self, key):
+        self.pop(key, None)
+
+
+class TestIdempotencyMiddleware(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = 0
+        self.limited = 0
+        app = FastAPI()
+
+        @app.post("/api/contacts/")
+        async def create(body: dict):
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            if self.limited:
+                self.limited -= 1
+                raise HTTPException(status_code=429, detail="Too Many Requests")
+            if body.get("missing"):
+                raise HTTPException(status_code=404, detail="Not found")
+            if body.get("fail"):
+                raise HTTPException(status_code=500, detail="boom")
+            return {"id": self.calls, **body}
+
+        service = Idempotency(wait=2, poll=0.01)
+        service.c = MemoryRedis()
+        app.add_middleware(IdempotencyMiddleware, prefixes=("/api/contacts",), service=service)
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+        self.token = {"Authorization": "Bearer " + await auth_service.create_access_token(data={"sub": "a@mail.com"})}
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    def post(self, body, key="key-1", **headers):
+        return self.client.post("/api/contacts/", json=body, headers={**self.token, "Idempotency-Key": key, **headers})
+
+    async def test_retry_replays_response(self):
+        first = await self.post({"name": "a"})
+        second = await self.post({"name": "a"})
+        self.assertEqual(first.json(), {"id": 1, "name": "a"})
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(self.calls, 1)
+
+    async def test_concurrent_duplicates_wait_for_first(self):
+        responses = await asyncio.gather(*(self.post({"name": "a"}) for _ in range(5)))
+        self.assertEqual({response.json()["id"] for response in responses}, {1})
+        self.assertEqual(self.calls, 1)
+
+    async def test_reused_key_with_other_body(self):
+        await self.post({"name": "a"})
+        response = await self.post({"name": "b"})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    async def test_server_error_releases_key(self):
+        self.assertEqual((await self.post({"fail": True})).status_code, 500)
+        self.assertEqual((await self.post({"fail": True})).status_code, 500)
+        self.assertEqual(self.calls, 2)
+
+    async def test_rate_limited_attempt_releases_key(self):
+        self.limited = 1
+        self.assertEqual((await self.post({"name": "a"})).status_code, 429)
+        response = await self.post({"name": "a"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+        self.assertEqual(self.calls, 2)
+
+    async def test_deterministic_client_error_is_replayed(self):
+        self.assertEqual((await self.post({"missing": True})).status_code, 404)
+        response = await self.post({"missing": True})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(self.calls, 1)
+
+    async def test_keys_are_scoped_to_user(self):
+        await self.post({"name": "a"})
+        other = "Bearer " + await auth_service.create_access_token(data={"sub": "b@mail.com"})
+        response = await self.post({"name": "a"}, Authorization=other)
+        self.assertEqual(response.json()["id"], 2)
+
+    async def test_requests_without_key_or_token_pass_through(self):
+        await self.client.post("/api/contacts/", json={"name": "a"}, headers=self.token)
+        await self.client.post("/api/contacts/", json={"name": "a"}, headers={"Idempotency-Key": "key-1"})
+        await self.client.post("/api/contacts/", json={"name": "a"}, headers={"Idempotency-Key": "key-1"})
+        self.assertEqual(self.calls, 3)
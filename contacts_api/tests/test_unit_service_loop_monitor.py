@@ -0,0 +1,66 @@
+import asyncio
+import time
+import unittest
+
+from fastapi.testclient import TestClient
+
+from main import app
+from src.conf.config import settings
+from src.services.loop_monitor_service import LoopMonitor
+
+
+def blocking_call(seconds):
+    time.sleep(seconds)
+
+
+class TestLoopMonitor(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.monitor = LoopMonitor(threshold_ms=50, interval_ms=10)
+        self.monitor.start()
+        await asyncio.sleep(0.02)
+
+    async def asyncTearDown(self):
+        self.monitor.stop()
+
+    async def test_blocking_call_is_reported_by_route_and_site(self):
+        self.monitor.track({"method": "GET", "path": "/api/contacts/"})
+        blocking_call(0.2)
+        await asyncio.sleep(0.05)
+        [offender] = self.monitor.report()
+        self.assertEqual(offender["route"], "GET unmatched")
+        self.assertRegex(offender["site"], r"^tests/test_unit_service_loop_monitor.py:\d+ in blocking_call$")
+        self.assertTrue(offender["blocked_in"].endswith("in blocking_call"))
+        self.assertEqual(offender["count"], 1)
+        self.assertGreaterEqual(offender["worst_ms"], 150)
+
+    async def test_short_steps_are_not_reported(self):
+        for _ in range(5):
+            blocking_call(0.005)
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.monitor.report(), [])
+
+
+class TestAdminRoutes(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(app)
+        self.token = settings.admin_token
+
+    def tearDown(self):
+        settings.admin_token = self.token
+
+    def test_admin_token(self):
+        settings.admin_token = ""
+        self.assertEqual(self.client.get("/api/admin/loop").status_code, 404)
+        settings.admin_token = "secret"
+        self.assertEqual(self.client.get("/api/admin/loop", headers={"X-Admin-Token": "wrong"}).status_code, 403)
+        response = self.client.get("/api/admin/loop", headers={"X-Admin-Token": "secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["offenders"], [])
+
+    def test_admission_needs_admin_token(self):
+        settings.admin_token = "secret"
+        self.assertEqual(self.client.get("/api/admin/admission").status_code, 403)
+        self.assertEqual(self.client.get("/api/admission").status_code, 404)
+        response = self.client.get("/api/admin/admission", headers={"X-Admin-Token": "secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("pool_usage", response.json())
@@ -0,0 +1,62 @@
+import unittest
+
+import httpx
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+
+from src.services.metrics_service import MetricsMiddleware, instrument_engine, instrument_redis, metrics_response
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    async def test_requests_are_labelled_with_route_template(self):
+        app = FastAPI()
+
+        @app.get("/api/items/{item_id}")
+        async def item(item_id: int):
+            return {"id": item_id}
+
+        app.add_middleware(MetricsMiddleware)
+        before = sample("http_requests_total", method="GET", route="/api/items/{item_id}", status="200")
+        unmatched = sample("http_requests_total", method="GET", route="unmatched", status="404")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await client.get("/api/items/1")
+            await client.get("/api/items/2")
+            await client.get("/missing")
+        self.assertEqual(sample("http_requests_total", method="GET", route="/api/items/{item_id}", status="200"),
+                         before + 2)
+        self.assertEqual(sample("http_requests_total", method="GET", route="unmatched", status="404"), unmatched + 1)
+        self.assertEqual(sample("http_requests_in_progress", method="GET"), 0)
+
+    def test_engine_pool_metrics(self):
+        engine = create_engine("sqlite://")
+        instrument_engine(engine, "test")
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            self.assertEqual(sample("db_pool_checked_out", engine="test"), 1)
+        self.assertEqual(sample("db_pool_checked_out", engine="test"), 0)
+        self.assertEqual(sample("db_pool_checkouts_total", engine="test"), 1)
+        self.assertEqual(sample("db_pool_checkout_wait_seconds_count", engine="test"), 1)
+
+    async def test_redis_latency_of_sync_and_async_clients(self):
+        class SyncClient:
+            def execute_command(self, *args, **options):
+                return "sync"
+
+        class AsyncClient:
+            async def execute_command(self, *args, **options):
+                return "async"
+
+        self.assertEqual(instrument_redis(SyncClient(), "test").execute_command("get", "k"), "sync")
+        self.assertEqual(await instrument_redis(AsyncClient(), "test").execute_command("SET", "k", "v"), "async")
+        self.assertEqual(sample("redis_command_duration_seconds_count", client="test", command="GET"), 1)
+        self.assertEqual(sample("redis_command_duration_seconds_count", client="test", command="SET"), 1)
+
+    def test_metrics_response(self):
+        response = metrics_response()
+        self.assertTrue(response.media_type.startswith("text/plain"))
+        self.assertIn(b"http_request_duration_seconds", response.body)
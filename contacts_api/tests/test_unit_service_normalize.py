@@ -0,0 +1,96 @@
+import datetime
+import unittest
+
+from pydantic import ValidationError
+from sqlalchemy import create_engine, inspect, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from src.db.models import Base, User, Contact
+from src.jobs.backfill_canonical import CANONICAL_INDEXES, backfill_canonical, unique_canonical_indexes
+from src.schemas.contacts_schema import ContactModel
+from src.services.normalize_service import normalize_phone, normalize_email
+
+
+class TestNormalize(unittest.TestCase):
+    def test_normalize_phone(self):
+        for phone in ("0501112233", "380501112233", "+380501112233", "+38 (050) 111-22-33", "00380501112233"):
+            self.assertEqual(normalize_phone(phone), "+380501112233", phone)
+
+    def test_normalize_phone_without_digits(self):
+        for phone in (None, "", "  ", "+", "(-)"):
+            self.assertIsNone(normalize_phone(phone), phone)
+        self.assertIsNone(normalize_email("  "))
+
+    def test_normalize_foreign_phone(self):
+        self.assertEqual(normalize_phone("+1 (212) 555-0100"), "+12125550100")
+
+    def test_normalize_email(self):
+        self.assertEqual(normalize_email(" Michael_Mayers@Mail.COM "), "michael_mayers@mail.com")
+        self.assertIsNone(normalize_email(None))
+
+    def test_contact_canonical_columns(self):
+        contact = Contact(email="Michael@Mail.com", phone="0501112233")
+        self.assertEqual(contact.email_canonical, "michael@mail.com")
+        self.assertEqual(contact.phone_canonical, "+380501112233")
+
+    def test_contact_model_phone(self):
+        body = dict(first_name="michael", last_name="mayers", birthday=datetime.date(2000, 1, 1),
+                    email="michael_mayers@mail.com", favorite=True)
+        self.assertEqual(ContactModel(phone="+38 (050) 111-22-33", **body).phone, "+38 (050) 111-22-33")
+        with self.assertRaises(ValidationError):
+            ContactModel(phone="050-111-22-3a", **body)
+        with self.assertRaises(ValidationError):
+            ContactModel(phone="+38 (050) 1-1", **body)
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine)()
+        self.session.add(User(id=1, username="a", email="a@mail.com", password="x"))
+        for i in range(5):
+            self.session.add(Contact(first_name="name", last_name="last", birthday=datetime.datetime(2000, 1, 1),
+                                     email=f"Contact{i}@Mail.com", phone=f"050111223{i}", contact_owner_id=1))
+        self.session.commit()
+        self.session.execute(update(Contact).values(email_canonical=None, phone_canonical=None))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_backfill(self):
+        self.assertEqual(backfill_canonical(self.session, batch_size=2), 5)
+        contacts = self.session.query(Contact).order_by(Contact.id).all()
+        self.assertEqual([contact.phone_canonical for contact in contacts],
+                         [f"+38050111223{i}" for i in range(5)])
+        self.assertEqual(contacts[0].email_canonical, "contact0@mail.com")
+        self.assertEqual(backfill_canonical(self.session), 0)
+
+    def test_canonical_duplicates_are_rejected(self):
+        backfill_canonical(self.session)
+        self.session.add(Contact(first_name="name", last_name="last", email="other@mail.com",
+                                 phone="+380501112230", contact_owner_id=1))
+        with self.assertRaises(IntegrityError):
+            self.session.commit()
+
+    def test_unique_indexes_wait_for_merged_duplicates(self):
+        backfill_canonical(self.session)
+        for name in CANONICAL_INDEXES:
+            self.session.execute(text(f"DROP INDEX {name}"))
+            self.session.execute(text(f"CREATE INDEX {name} ON contacts (contact_owner_id, "
+                                      f"{name.removeprefix('ix_contacts_owner_')})"))
+        self.session.add(Contact(first_name="name", last_name="last", email="CONTACT0@mail.com",
+                                 phone="+380501112230", contact_owner_id=1))
+        self.session.commit()
+        self.assertEqual(unique_canonical_indexes(self.session), 2)
+        self.session.query(Contact).filter(Contact.phone == "+380501112230").delete()
+        self.session.commit()
+        self.assertEqual(unique_canonical_indexes(self.session), 0)
+        unique = {index["name"]: index["unique"] for index in inspect(self.session.connection()).get_indexes("contacts")}
+        self.assertTrue(all(unique[name] for name in CANONICAL_INDEXES))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import time
+import tracemalloc
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+import httpx
+from fastapi import FastAPI
+
+from src.services.profiling_service import Profiler, RequestProfileMiddleware, collapsed
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfiler(unittest.IsolatedAsyncioTestCase):
+    def test_collapsed(self):
+        self.assertEqual(collapsed(Counter({"main;a": 1, "main;a;b": 3})), "main;a;b 3\nmain;a 1\n")
+
+    async def test_cpu_profile_of_live_loop(self):
+        profiler = Profiler()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            busy(0.1)
+
+        task = asyncio.create_task(work())
+        profile = await profiler.cpu(0.15, 0.002)
+        await task
+        lines = [line for line in profile.splitlines() if "busy (tests/test_unit_service_profiling.py" in line]
+        self.assertTrue(lines)
+        self.assertTrue(all(line.startswith("MainThread;") for line in lines))
+
+    def test_memory_snapshots(self):
+        profiler = Profiler()
+        self.addCleanup(profiler.stop_tracing)
+        first = profiler.snapshot()
+        leak = [bytearray(1000) for _ in range(1000)]
+        second = profiler.snapshot()
+        [top] = profiler.diff(first["id"], second["id"], limit=1)
+        self.assertIn("test_unit_service_profiling.py", top["site"])
+        self.assertGreaterEqual(top["size_diff"], 1_000_000)
+        self.assertEqual(len(leak), 1000)
+        with self.assertRaises(KeyError):
+            profiler.diff(first["id"], 99)
+        profiler.stop_tracing()
+        self.assertFalse(tracemalloc.is_tracing())
+
+    async def test_request_profile_by_header(self):
+        app = FastAPI()
+        profiler = Profiler()
+
+        @app.get("/slow")
+        async def slow():
+            busy(0.05)
+            return {}
+
+        app.add_middleware(RequestProfileMiddleware, profiler=profiler)
+        with patch("src.services.profiling_service.settings.admin_token", "secret"):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                plain = await client.get("/slow", headers={"X-Profile": "1"})
+                profiled = await client.get("/slow", headers={"X-Profile": "1", "X-Admin-Token": "secret"})
+        self.assertNotIn("X-Profile-Id", plain.headers)
+        self.assertIn("busy (tests/test_unit_service_profiling.py", profiler.requests[profiled.headers["X-Profile-Id"]])
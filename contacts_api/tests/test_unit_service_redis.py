@@ -0,0 +1,151 @@
+import time
+import unittest
+
+import httpx
+from fastapi import Depends, FastAPI
+from fastapi_limiter import FastAPILimiter
+from fastapi_limiter.depends import RateLimiter
+from redis.exceptions import ConnectionError as RedisConnectionError, NoScriptError, TimeoutError as RedisTimeoutError
+
+from limiter import limiter_fallback, reload_script
+from src.services.auth import auth_service
+from src.services.fakes_service import FakeAsyncRedis, FakeRedis, FaultProfile, MemoryStore
+from src.services.idempotency_service import Idempotency, IdempotencyMiddleware
+from src.services.redis_service import CircuitBreaker, LocalCache, RedisUnavailable, protect, rate_limit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_failures_and_closes_after_trial(self):
+        clock = Clock()
+        breaker = CircuitBreaker(failures=2, reset=5, clock=clock)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+        clock.now = 5
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.failure()
+        clock.now = 9
+        self.assertFalse(breaker.allow())
+        clock.now = 10
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertEqual((breaker.state, breaker.failed), (CircuitBreaker.CLOSED, 0))
+
+    def test_local_cache_is_bounded_and_expires(self):
+        cache = LocalCache(size=2, ttl=0.05)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("a"))
+
+
+class TestProtect(unittest.IsolatedAsyncioTestCase):
+    def test_open_circuit_fails_fast(self):
+        client = FakeRedis(profile=FaultProfile(latency_ms=20, error_rate=1))
+        protect(client, CircuitBreaker(failures=2, reset=60), "test")
+        for _ in range(2):
+            with self.assertRaises(RedisConnectionError):
+                client.get("key")
+        started = time.perf_counter()
+        with self.assertRaises(RedisUnavailable):
+            client.get("key")
+        self.assertLess(time.perf_counter() - started, 0.01)
+
+    def test_sync_socket_timeout(self):
+        client = FakeRedis(profile=FaultProfile(latency_ms=500), socket_timeout=0.02)
+        started = time.perf_counter()
+        with self.assertRaises(RedisTimeoutError):
+            protect(client, CircuitBreaker(), "test").get("key")
+        self.assertLess(time.perf_counter() - started, 0.2)
+
+    async def test_async_timeout_and_fallback(self):
+        breaker = CircuitBreaker(failures=1, reset=60)
+        client = protect(FakeAsyncRedis(profile=FaultProfile(latency_ms=500)), breaker, "test", timeout=0.02,
+                         fallback=lambda *args, **options: "fallback")
+        started = time.perf_counter()
+        self.assertEqual(await client.get("key"), "fallback")
+        self.assertLess(time.perf_counter() - started, 0.2)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(await client.get("key"), "fallback")
+
+    async def test_error_replies_do_not_open_the_circuit(self):
+        breaker = CircuitBreaker(failures=1)
+        client = protect(FakeAsyncRedis(), breaker, "test")
+        with self.assertRaises(NoScriptError):
+            await client.evalsha("missing", 0)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestLimiterFallback(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.app = FastAPI()
+
+        @self.app.get("/limited", dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+        async def limited():
+            return {}
+
+        previous = FastAPILimiter.redis, FastAPILimiter.lua_sha
+        self.addCleanup(setattr, FastAPILimiter, "lua_sha", previous[1])
+        self.addCleanup(setattr, FastAPILimiter, "redis", previous[0])
+
+    async def statuses(self, policy: str) -> list[int]:
+        server = FakeAsyncRedis(MemoryStore(), FaultProfile(error_rate=1), decode_responses=True)
+        client = protect(server, CircuitBreaker(failures=1, reset=60), "limiter", fallback=limiter_fallback(policy))
+        await FastAPILimiter.init(reload_script(client))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url="http://test") as client:
+            return [(await client.get("/limited")).status_code for _ in range(3)]
+
+    async def test_local_buckets(self):
+        self.assertEqual(await self.statuses("local"), [200, 200, 429])
+
+    async def test_open_and_closed(self):
+        self.assertEqual(await self.statuses("open"), [200, 200, 200])
+        self.assertEqual(await self.statuses("closed"), [429, 429, 429])
+
+    async def test_script_is_reloaded_when_redis_is_back(self):
+        store = MemoryStore()
+        store.register_script(FastAPILimiter.lua_script, rate_limit)
+        client = reload_script(FakeAsyncRedis(store, decode_responses=True))
+        sha = limiter_fallback()("SCRIPT LOAD", FastAPILimiter.lua_script)
+        self.assertEqual(await client.evalsha(sha, 1, "key", "2", "5000"), 0)
+        self.assertIn(sha, store.scripts)
+
+
+class TestIdempotencyWithoutRedis(unittest.IsolatedAsyncioTestCase):
+    async def test_keyed_write_is_refused(self):
+        app = FastAPI()
+
+        @app.post("/api/contacts/")
+        async def create():
+            return {}
+
+        service = Idempotency()
+        service.c = FakeAsyncRedis(profile=FaultProfile(error_rate=1))
+        app.add_middleware(IdempotencyMiddleware, prefixes=("/api/contacts",), service=service)
+        token = await auth_service.create_access_token(data={"sub": "a@mail.com"})
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            keyed = await client.post("/api/contacts/", headers={"Authorization": f"Bearer {token}",
+                                                                 "Idempotency-Key": "k"})
+            plain = await client.post("/api/contacts/", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(keyed.status_code, 503)
+        self.assertIn("Retry-After", keyed.headers)
+        self.assertEqual(plain.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+
+import httpx
+from fastapi import BackgroundTasks, Depends, FastAPI
+from sqlalchemy import create_engine, text
+
+from src.services.tracing_service import InMemoryExporter, Tracer, TracingMiddleware
+
+
+class TestTracing(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.exporter = InMemoryExporter()
+        self.tracer = Tracer(self.exporter, sample_rate=1)
+
+    def client(self, app):
+        app.add_middleware(TracingMiddleware, tracer=self.tracer)
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+    async def test_spans_of_request_and_background_task(self):
+        app = FastAPI()
+        tracer = self.tracer
+
+        @tracer.traced("email.send")
+        async def send():
+            await asyncio.sleep(0)
+
+        async def dependency():
+            with tracer.span("auth.jwt_decode"):
+                return 1
+
+        @app.get("/api/items/{item_id}")
+        async def item(item_id: int, background_tasks: BackgroundTasks, user: int = Depends(dependency)):
+            background_tasks.add_task(send)
+            return {"id": item_id}
+
+        async with self.client(app) as client:
+            response = await client.get("/api/items/3")
+        [spans] = self.exporter.traces
+        root, named = spans[0], {span.name: span for span in spans}
+        auth, email = named["auth.jwt_decode"], named["email.send"]
+        self.assertEqual(root.name, "GET /api/items/{item_id}")
+        self.assertEqual(root.attributes["status"], 200)
+        self.assertEqual(auth.parent_id, named.get("fastapi.dependencies", root).span_id)
+        self.assertEqual(email.parent_id, root.span_id)
+        self.assertEqual({span.trace.trace_id for span in spans}, {root.trace.trace_id})
+        self.assertIn(root.trace.trace_id, response.headers["traceparent"])
+
+    async def test_tail_sampling_keeps_errors_and_slow_traces(self):
+        self.tracer.sample_rate = 0
+        self.tracer.tail_latency = 0.05
+        app = FastAPI()
+
+        @app.get("/fast")
+        async def fast():
+            return {}
+
+        @app.get("/slow")
+        async def slow():
+            await asyncio.sleep(0.06)
+            return {}
+
+        @app.get("/broken")
+        async def broken():
+            raise RuntimeError("boom")
+
+        async with self.client(app) as client:
+            await client.get("/fast")
+            await client.get("/slow")
+            with self.assertRaises(RuntimeError):
+                await client.get("/broken")
+        self.assertEqual([spans[0].name for spans in self.exporter.traces], ["GET /slow", "GET /broken"])
+        self.assertIn("boom", self.exporter.traces[1][0].error)
+
+    async def test_fastapi_stages(self):
+        self.tracer.instrument_fastapi()
+        app = FastAPI()
+
+        @app.get("/")
+        async def root():
+            return {}
+
+        async with self.client(app) as client:
+            await client.get("/")
+        names = [span.name for span in self.exporter.traces[0]]
+        self.assertEqual(names, ["GET /", "fastapi.dependencies", "fastapi.endpoint", "fastapi.serialize"])
+
+    async def test_incoming_traceparent_decides_head_sampling(self):
+        self.tracer.sample_rate = 0
+        app = FastAPI()
+
+        @app.get("/")
+        async def root():
+            return {}
+
+        parent = "00-" + "a" * 32 + "-" + "b" * 16
+        async with self.client(app) as client:
+            await client.get("/", headers={"traceparent": parent + "-00"})
+            await client.get("/", headers={"traceparent": parent + "-01"})
+        [spans] = self.exporter.traces
+        self.assertEqual((spans[0].trace.trace_id, spans[0].parent_id), ("a" * 32, "b" * 16))
+
+    def test_statements_and_no_spans_outside_traces(self):
+        engine = create_engine("sqlite://")
+        self.tracer.instrument_engine(engine)
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            with self.tracer.trace("job") as root:
+                connection.execute(text("SELECT 2"))
+        [spans] = self.exporter.traces
+        self.assertEqual([(span.name, span.parent_id) for span in spans[1:]], [("db.query", root.span_id)])
+        self.assertEqual(spans[1].attributes["statement"], "SELECT 2")